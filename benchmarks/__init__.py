@@ -0,0 +1 @@
+"""Benchmarks of opentsdb-py against in-process fake OpenTSDB servers, run with `python -m benchmarks`."""
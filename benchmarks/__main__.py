@@ -0,0 +1,94 @@
+"""Run benchmarks and write results as JSON.
+
+    python -m benchmarks                                  # all scenarios to stdout
+    python -m benchmarks -s throughput_http -o new.json   # one scenario to a file
+    python -m benchmarks --scale 0.1 --compare old.json   # exit 1 on regression against old results
+"""
+import argparse
+import json
+import logging
+import platform
+import sys
+import time
+
+from opentsdb import __version__
+
+from benchmarks.scenarios import SCENARIOS
+
+# result keys where higher is better, all other compared keys are better lower
+HIGHER_IS_BETTER = ('points_per_second',)
+COMPARED = HIGHER_IS_BETTER + ('bytes_per_point', 'p50', 'p90', 'p99')
+
+
+def flatten(result: dict, prefix: str='') -> dict:
+    flat = {}
+    for key, value in result.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix + key + '.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """Return descriptions of compared values which are worse than the baseline by more than tolerance."""
+    regressions = []
+    current, previous = flatten(results), flatten(baseline)
+    for key, value in sorted(current.items()):
+        name = key.rsplit('.', 1)[-1]
+        if name not in COMPARED or not previous.get(key):
+            continue
+        change = (value - previous[key]) / previous[key]
+        if name in HIGHER_IS_BETTER:
+            change = -change
+        if change > tolerance:
+            regressions.append('%s: %.6g -> %.6g (%+.0f%%)' % (key, previous[key], value, change * 100))
+    return regressions
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description='opentsdb-py benchmarks')
+    parser.add_argument('-s', '--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run, may be repeated (default: all)')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiplier of points per scenario')
+    parser.add_argument('-o', '--output', help='write JSON results to the file instead of stdout')
+    parser.add_argument('--compare', help='JSON results of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative regression (default: 0.2)')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.CRITICAL)
+    results = {}
+    for name in args.scenario or sorted(SCENARIOS):
+        print('Running %s...' % name, file=sys.stderr)
+        results[name] = SCENARIOS[name](args.scale)
+
+    report = {
+        'meta': {
+            'version': __version__,
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'platform': platform.platform(),
+            'scale': args.scale,
+            'time': int(time.time()),
+        },
+        'results': results,
+    }
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as output:
+            output.write(data + '\n')
+    else:
+        print(data)
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)['results']
+        regressions = compare(results, {name: baseline[name] for name in results if name in baseline}, args.tolerance)
+        for regression in regressions:
+            print('REGRESSION %s' % regression, file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,187 @@
+import gc
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from opentsdb import TSDBClient, TSDBConnectProtocols, Counter
+
+from benchmarks.servers import FakeHTTPServer, FakeTelnetServer
+
+# run in a fresh interpreter: seconds of the imports and modules loaded by them
+IMPORT_CODE = '''
+import sys, time
+before = set(sys.modules)
+started = time.perf_counter()
+%s
+seconds = time.perf_counter() - started
+# numpy is loaded by the read API only, it triples the import time
+assert 'numpy' not in sys.modules
+print(seconds, len(set(sys.modules) - before))
+'''
+CLIENT_CODE = "import opentsdb; opentsdb.TSDBClient(%s, run_at_once=False)._get_connect('127.0.0.1', 4242, None, False)"
+IMPORTS = {
+    'import_opentsdb': 'import opentsdb',
+    'client_telnet': CLIENT_CODE % "protocol='TELNET'",
+    # http connections are created without connecting, that loads the HTTP library
+    'client_http_client': CLIENT_CODE % "http_transport='http.client'" + '.connect',
+    'client_requests': CLIENT_CODE % "http_transport='requests'" + '.connect',
+}
+
+SERVERS = {
+    TSDBConnectProtocols.HTTP: FakeHTTPServer,
+    TSDBConnectProtocols.TELNET: FakeTelnetServer,
+}
+QUANTILES = (0.5, 0.9, 0.99)
+
+
+def percentiles(samples, scale: float=1e6) -> dict:
+    """Percentiles of samples in seconds, reported in microseconds by default."""
+    samples = sorted(samples)
+    result = {'p%s' % format(quantile * 100, 'g'): samples[min(len(samples) - 1, int(quantile * len(samples)))] * scale
+              for quantile in QUANTILES}
+    result['mean'] = sum(samples) / len(samples) * scale
+    return result
+
+
+def _client(server, protocol: str, size: int, **kwargs) -> TSDBClient:
+    kwargs.setdefault('send_metrics_limit', 0)
+    # with several push threads the queue is split into shards of uneven load
+    kwargs.setdefault('max_queue_size', (size + 1) * kwargs.get('send_workers', 1))
+    return TSDBClient('127.0.0.1', server.port, protocol=protocol, host_tag=False,
+                      static_tags={'bench': 'opentsdb-py'}, **kwargs)
+
+
+def throughput(size: int=100000, protocol: str=TSDBConnectProtocols.HTTP, series: int=100,
+               latency: float=0, error_rate: float=0, **client_kwargs) -> dict:
+    """Points per second from the first send() until the server has received the last point."""
+    with SERVERS[protocol](latency=latency, error_rate=error_rate) as server:
+        client = _client(server, protocol, size, **client_kwargs)
+        started = time.perf_counter()
+        for index in range(size):
+            client.send('bench.throughput', index, series=index % series)
+        send_seconds = time.perf_counter() - started
+
+        client.close()
+        client.wait()
+        seconds = time.perf_counter() - started
+
+        return {
+            'points': size,
+            'received': server.points,
+            'requests': server.requests,
+            'errors': server.errors,
+            'bytes_per_point': server.bytes_received / max(server.points, 1),
+            'seconds': seconds,
+            'send_seconds': send_seconds,
+            'points_per_second': server.points / seconds,
+            'statuses': dict(client.statuses),
+        }
+
+
+def bulk_load(size: int=1000000, protocol: str=TSDBConnectProtocols.HTTP, series: int=10) -> dict:
+    """Points per second of send_many() backfilling `series` series from lists of timestamps and values."""
+    per_series = size // series
+    timestamps = list(range(1500000000, 1500000000 + per_series))
+    values = [index * 0.5 for index in range(per_series)]
+    with SERVERS[protocol]() as server:
+        client = _client(server, protocol, size)
+        started = time.perf_counter()
+        for index in range(series):
+            client.send_many('bench.bulk', timestamps, values, series=index)
+        send_seconds = time.perf_counter() - started
+
+        client.close()
+        client.wait()
+        seconds = time.perf_counter() - started
+
+        return {
+            'points': per_series * series,
+            'received': server.points,
+            'requests': server.requests,
+            'seconds': seconds,
+            'send_seconds': send_seconds,
+            'points_per_second': server.points / seconds,
+        }
+
+
+def call_latency(size: int=100000, protocol: str=TSDBConnectProtocols.HTTP) -> dict:
+    """Per-call latency of send(), Counter.inc() and labeled Counter.inc() in microseconds."""
+    timer = time.perf_counter
+    with SERVERS[protocol]() as server:
+        client = _client(server, protocol, size * 3)
+        client.REQUESTS = Counter('bench.requests', ['handler'])
+        child = client.REQUESTS.labels('index')
+
+        result = {}
+        for name, call in (('send', lambda index: client.send('bench.latency', index, series=index % 100)),
+                           ('counter_inc', lambda index: client.REQUESTS.tags('index').inc()),
+                           ('labeled_counter_inc', lambda index: child.inc())):
+            samples = []
+            for index in range(size):
+                started = timer()
+                call(index)
+                samples.append(timer() - started)
+            result[name] = percentiles(samples)
+
+        client.close()
+        client.wait()
+    return result
+
+
+def import_time(runs: int=20) -> dict:
+    """Milliseconds to import opentsdb and to create a client with each transport, in fresh interpreters."""
+    result = {}
+    for name, statement in IMPORTS.items():
+        samples, modules = [], 0
+        for _ in range(runs):
+            output = subprocess.check_output([sys.executable, '-c', IMPORT_CODE % statement])
+            seconds, modules = output.split()
+            samples.append(float(seconds))
+        result[name] = dict(percentiles(samples, scale=1e3), modules=int(modules))
+    return result
+
+
+def queued_point_memory(size: int=100000, series: int=100) -> dict:
+    """Memory held by the queue per point waiting to be sent."""
+    client = TSDBClient(run_at_once=False, host_tag=False, static_tags={'bench': 'opentsdb-py'},
+                        max_queue_size=size + 1, aggregation_interval=0)
+    for index in range(series):
+        client.send('bench.memory', 0, series=index)
+    while not client._metrics_queue.empty():
+        client._metrics_queue.get_nowait()
+
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    for index in range(size):
+        client.send('bench.memory', index * 1.5, series=index % series)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {'points': client.queue_size(), 'bytes_per_point': (after - before) / size}
+
+
+def slow_server(size: int=20000, latency: float=0.02, protocol: str=TSDBConnectProtocols.HTTP) -> dict:
+    """Throughput when each request takes `latency` seconds on the server, by number of push threads."""
+    return {'workers_%d' % workers: throughput(size, protocol, latency=latency, send_workers=workers)
+            for workers in (1, 4)}
+
+
+def server_errors(size: int=20000, error_rate: float=0.1, protocol: str=TSDBConnectProtocols.HTTP) -> dict:
+    """Throughput and delivery when `error_rate` of requests fail on the server."""
+    return throughput(size, protocol, error_rate=error_rate)
+
+
+SCENARIOS = {
+    'throughput_http': lambda scale: throughput(int(100000 * scale)),
+    'throughput_telnet': lambda scale: throughput(int(100000 * scale), TSDBConnectProtocols.TELNET),
+    'bulk_load_http': lambda scale: bulk_load(int(1000000 * scale)),
+    'bulk_load_telnet': lambda scale: bulk_load(int(1000000 * scale), TSDBConnectProtocols.TELNET),
+    'throughput_http_client': lambda scale: throughput(int(100000 * scale),
+                                                       http_transport=TSDBConnectProtocols.HTTP_CLIENT),
+    'call_latency': lambda scale: call_latency(int(100000 * scale)),
+    'import_time': lambda scale: import_time(max(3, int(20 * scale))),
+    'queued_point_memory': lambda scale: queued_point_memory(int(100000 * scale)),
+    'slow_server': lambda scale: slow_server(int(20000 * scale)),
+    'server_errors': lambda scale: server_errors(int(20000 * scale)),
+}
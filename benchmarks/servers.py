@@ -0,0 +1,136 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import gzip
+import json
+import random
+import socketserver
+import threading
+import time
+
+
+class _FakeServerMixin:
+    """Counts received points, sleeps `latency` seconds per request and fails `error_rate` of requests."""
+
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def setup_fake(self, latency: float=0, error_rate: float=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.points = 0
+        self.requests = 0
+        self.errors = 0
+        self.bytes_received = 0
+        self._counter_lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def count(self, points: int, size: int):
+        with self._counter_lock:
+            self.points += points
+            self.requests += 1
+            self.bytes_received += size
+
+    def inject(self) -> bool:
+        """Apply latency, return True if the request should fail."""
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            with self._counter_lock:
+                self.errors += 1
+            return True
+        return False
+
+    def wait_points(self, points: int, timeout: float=60) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.points < points:
+            if time.monotonic() > deadline:
+                return False
+            time.sleep(0.001)
+        return True
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *_):
+        self.stop()
+
+
+class _PutHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # headers and body are separate writes, with Nagle each response would wait for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.startswith('/api/version'):
+            self._reply(200, {'version': '2.4.0'})
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if not self.path.startswith('/api/put'):
+            self._reply(404, {'error': 'not found'})
+            return
+        if self.server.inject():
+            self._reply(503, {'error': 'injected error'})
+            return
+
+        size = len(body)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        points = json.loads(body.decode('utf-8'))
+        if isinstance(points, dict):
+            points = [points]
+        self.server.count(len(points), size)
+        self._reply(200, {'success': len(points), 'failed': 0, 'errors': []})
+
+
+class FakeHTTPServer(_FakeServerMixin, socketserver.ThreadingMixIn, HTTPServer):
+    """Stand-in for OpenTSDB /api/version and /api/put, injected errors are 503 responses."""
+
+    def __init__(self, host: str='127.0.0.1', port: int=0, latency: float=0, error_rate: float=0):
+        super().__init__((host, port), _PutHandler)
+        self.setup_fake(latency, error_rate)
+
+
+class _TelnetHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        while True:
+            data = self.request.recv(64 * 1024)
+            if not data:
+                return
+            if self.server.inject():
+                return  # the connection is dropped, as by a broken OpenTSDB
+            self.server.count(data.count(b'\n'), len(data))
+
+
+class FakeTelnetServer(_FakeServerMixin, socketserver.ThreadingMixIn, socketserver.TCPServer):
+    """Stand-in for OpenTSDB telnet `put`, latency is applied per read and injected errors close the connection."""
+
+    def __init__(self, host: str='127.0.0.1', port: int=0, latency: float=0, error_rate: float=0):
+        super().__init__((host, port), _TelnetHandler)
+        self.setup_fake(latency, error_rate)
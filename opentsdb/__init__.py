@@ -1,5 +1,13 @@
 from .tsdb_client import TSDBClient, TSDBConnectProtocols
-from .metrics import Counter, Gauge
+from .metrics import Counter, Gauge, Histogram, Summary
 from .exceptions import *
 
 __version__ = '0.6.0'
+
+
+def __getattr__(name: str):
+    # asyncio is imported only by the users of the asyncio client
+    if name == 'AsyncTSDBClient':
+        from .aio_client import AsyncTSDBClient
+        return AsyncTSDBClient
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
@@ -0,0 +1,50 @@
+from logging import getLogger
+import threading
+
+from opentsdb.datapoint import DataPoint
+
+logger = getLogger('opentsdb-py')
+
+
+class MetricsAggregator(threading.Thread):
+    """Collapse metric updates into one data point per series per interval.
+
+    Counter and Gauge send their current value on every update, so the latest
+    point of a series within the interval is the one worth pushing.
+    """
+
+    def __init__(self, push_metric, interval, close_client):
+        super().__init__()
+        self.push_metric = push_metric
+        self.interval = interval
+        self.close_client_flag = close_client
+
+        self._series = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def add(self, point: DataPoint):
+        with self._lock:
+            self._series[point.series] = point
+
+    def pending(self) -> int:
+        return len(self._series)
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                series, self._series = self._series, {}
+
+            for point in series.values():
+                self.push_metric(point)
+
+        if series:
+            logger.debug("Flushed %d aggregated series", len(series))
+        return len(series)
+
+    def run(self):
+        while not self.close_client_flag.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as error:
+                logger.exception(error)
@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import time
+
+from opentsdb.datapoint import points_count, report_sent
+from opentsdb.exceptions import TSDBClientException
+from opentsdb.metrics_queue import MetricsQueue, OverflowCounter
+from opentsdb.protocols import TSDBConnectProtocols
+from opentsdb.retry import Backoff, CircuitBreaker, is_transient_error, split_rejected
+from opentsdb.tsdb_client import TSDBClient
+
+logger = logging.getLogger('opentsdb-py')
+
+
+class AsyncTSDBClient(TSDBClient):
+    """TSDBClient for asyncio applications.
+
+    Metrics are queued with `send()` (or Counter / Gauge) without blocking the event loop
+    and pushed to OpenTSDB by a sender task over asyncio streams. Failed sends are retried
+    like in TSDBClient (max_retries, backoff, circuit breaker), points rejected by OpenTSDB
+    for transient reasons are retried alone. One connection is used: spool, several send
+    workers or endpoints, the `block` overflow policy, a bytes limit of the queue, rate
+    limits, aggregation and multiprocess mode are not supported.
+    """
+
+    WAIT_CIRCUIT_TIMEOUT = 1
+
+    def __init__(self, host: str=TSDBClient.TSDB_HOST, port: int=TSDBClient.TSDB_PORT,
+                 uri: str=TSDBClient.TSDB_URI, **kwargs):
+        kwargs['run_at_once'] = False
+        super().__init__(host, port, uri=uri, **kwargs)
+        unsupported = [name for name, used in (
+            ('spool_dir', self.spool is not None),
+            ('send_workers', self.send_workers > 1),
+            ('endpoints', bool(self.endpoints)),
+            ('queue_overflow=block', self.queue_overflow == MetricsQueue.BLOCK),
+            ('max_queue_bytes', self.max_queue_bytes > 0),
+            ('aggregation_interval', self.aggregation_interval > 0),
+            ('multiprocess_dir', bool(self.multiprocess_dir)),
+            ('send_metrics_limit', self.rate_limiter.points is not None),
+            ('send_bytes_limit', self.rate_limiter.bytes is not None),
+        ) if used]
+        if unsupported:
+            raise TSDBClientException("Not supported by AsyncTSDBClient: %s" % ', '.join(unsupported))
+
+        self._metrics_queue = None
+        self._sender = None
+        self._report_task = None
+        self._overflow = OverflowCounter(self.queue_overflow, MetricsQueue.LOG_INTERVAL)
+        self._sampled = 0
+        self.backoff = Backoff()
+        self.circuit_breaker = CircuitBreaker(self.circuit_breaker_threshold, self.circuit_breaker_timeout)
+
+    async def start(self):
+        host, port, uri = self._address
+        self._tsdb_connect = TSDBConnectProtocols.get_async_connect(
+            self.protocol, host, port, self.check_tsdb_alive,
+            compression=self.http_compression, uri=uri, max_write_bytes=self.telnet_max_write_bytes,
+            compression_level=self.http_compression_level, encoder=self.http_encoder
+        )
+        if self.check_tsdb_alive:
+            await self._tsdb_connect.is_alive(raise_error=True)
+
+        # bounded by _offer(), chunks of send_many() are queued beyond max_queue_size
+        self._metrics_queue = asyncio.Queue()
+        self._sender = asyncio.ensure_future(self._send_loop())
+        self._report_task = asyncio.ensure_future(self._report_loop())
+
+        self._load_predefined_metrics()
+        return self
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *_):
+        await self.aclose()
+
+    def is_connected(self) -> bool:
+        return self._sender is not None and not self._sender.done()
+
+    async def is_alive(self) -> bool:
+        return await self._tsdb_connect.is_alive()
+
+    def close(self, force=False):
+        if self._report_task:
+            self._report_task.cancel()
+            self._reporter.collect()
+        self._close_client.set()
+        if force and self._sender:
+            self._sender.cancel()
+        elif self._metrics_queue is not None:
+            self._metrics_queue.put_nowait(StopIteration)
+
+    async def wait(self):
+        if self._sender is None:
+            return
+        try:
+            await self._sender
+        except asyncio.CancelledError:
+            pass
+
+    async def flush(self):
+        await self._metrics_queue.join()
+
+    async def aclose(self, force=False):
+        self.close(force)
+        await self.wait()
+        if self._tsdb_connect:
+            self._tsdb_connect.disconnect()
+
+    def queue_size(self) -> int:
+        return self._metrics_queue.qsize() if self._metrics_queue is not None else 0
+
+    def _push_metric_to_queue(self, metric):
+        if self._metrics_queue is None:
+            raise TSDBClientException("AsyncTSDBClient is not started")
+
+        dropped = self._offer(metric)
+        if not dropped or dropped[-1] is not metric:
+            self.telemetry.inc('queued')
+        if dropped:
+            count = points_count(dropped)
+            self._overflow.add(count)
+            self.telemetry.inc('dropped', count)
+
+    def _push_points_to_queue(self, points: list):
+        for point in points:
+            self._push_metric_to_queue(point)
+
+    def _offer(self, item) -> tuple:
+        """Queue the item applying queue_overflow, return the dropped items like MetricsQueue.offer."""
+        metrics_queue = self._metrics_queue
+        if not self.max_queue_size or metrics_queue.qsize() < self.max_queue_size:
+            metrics_queue.put_nowait(item)
+            return ()
+
+        if self.queue_overflow == MetricsQueue.SAMPLE:
+            self._sampled += 1
+            if self._sampled % MetricsQueue.SAMPLE_EVERY:
+                return (item, )
+        elif self.queue_overflow == MetricsQueue.DROP_NEWEST:
+            return (item, )
+
+        oldest = metrics_queue.get_nowait()
+        metrics_queue.task_done()
+        metrics_queue.put_nowait(item)
+        return (oldest, )
+
+    def _push_chunk_to_queue(self, chunk):
+        if self._metrics_queue is None:
+            raise TSDBClientException("AsyncTSDBClient is not started")
+
+        # sync code can't wait for the sender task, bulk data is never dropped and goes beyond max_queue_size
+        self._metrics_queue.put_nowait(chunk)
+        self.telemetry.inc('queued', len(chunk))
+
+    async def _report_loop(self):
+        reporter = self._reporter
+        if not reporter.aligned:
+            while True:
+                await asyncio.sleep(self.report_interval)
+                reporter.collect()
+
+        tick = reporter.next_tick()
+        while True:
+            await asyncio.sleep(max(0.0, tick - time.time()))
+            reporter.collect(int(tick))
+            tick = max(tick + self.report_interval, reporter.next_tick())
+
+    async def _send_loop(self):
+        stop = False
+        while not stop:
+            metrics = [await self._metrics_queue.get()]
+            while len(metrics) < self.send_metrics_batch_limit and not self._metrics_queue.empty():
+                metrics.append(self._metrics_queue.get_nowait())
+
+            taken = len(metrics)
+            if StopIteration in metrics:
+                metrics.remove(StopIteration)
+                stop = True
+
+            try:
+                if metrics:
+                    await self._send(metrics)
+            finally:
+                for _ in range(taken):
+                    self._metrics_queue.task_done()
+
+    async def _send(self, metrics):
+        attempt = 0
+        while True:
+            wait_time = self.circuit_breaker.wait_time()
+            if wait_time > 0:
+                if self._close_client.is_set():
+                    self._drop(metrics, "client is closed and OpenTSDB is not available")
+                    return
+                await asyncio.sleep(min(wait_time, self.WAIT_CIRCUIT_TIMEOUT))
+                continue
+
+            try:
+                result = await self._tsdb_connect.sendall(*metrics)
+            except asyncio.CancelledError:
+                raise
+            except Exception as error:
+                logger.exception("Push metric failed: %s", error)
+                if not is_transient_error(error):
+                    self._drop(metrics, error)
+                    return
+                self.circuit_breaker.record_failure()
+                if 0 <= self.max_retries <= attempt:
+                    self._drop(metrics, "retries limit is reached")
+                    return
+                self.telemetry.inc('retried', points_count(metrics))
+                await asyncio.sleep(self.backoff.delay(attempt))
+                attempt += 1
+                continue
+
+            self.circuit_breaker.record_success()
+            if self.protocol != TSDBConnectProtocols.HTTP:
+                self.telemetry.inc('success', points_count(metrics))
+                report_sent(metrics)
+                return
+
+            failed = result.get('failed', 0)
+            self.telemetry.inc('success', result.get('success', 0))
+            self.telemetry.inc('failed', failed)
+            if not failed:
+                report_sent(metrics)
+                return
+
+            logger.warning("Push metrics are failed %d/%d" % (failed, points_count(metrics)),
+                           extra={'errors': result.get('errors')})
+            transient, invalid, retried = split_rejected(metrics, result.get('errors') or [])
+            report_sent(metrics, retried)
+            if invalid:
+                self._drop(invalid, "rejected by OpenTSDB as invalid")
+            if not transient:
+                return
+            if 0 <= self.max_retries <= attempt:
+                self._drop(transient, "retries limit is reached")
+                return
+            self.telemetry.inc('retried', points_count(transient))
+            await asyncio.sleep(self.backoff.delay(attempt))
+            metrics, attempt = transient, attempt + 1
+
+    def _drop(self, metrics, reason):
+        count = points_count(metrics)
+        logger.error("Drop %d metrics: %s", count, reason)
+        self.telemetry.inc('dropped', count)
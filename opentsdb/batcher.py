@@ -0,0 +1,101 @@
+from queue import Empty
+import time
+
+from opentsdb.datapoint import PointsChunk
+
+
+def estimate_size(point) -> int:
+    """Approximate payload size of a point: its put line, close enough to the JSON size as well."""
+    size = len(point.series.telnet_format) + 24
+    return size * len(point) if type(point) is PointsChunk else size
+
+
+class AdaptiveBatchSize:
+    """Batch size driven by send latency, additive increase / multiplicative decrease.
+
+    A full batch sent faster than `target_latency` grows the size by `step`,
+    a send slower than that halves it. Partial batches mean the queue is drained,
+    so there is nothing to learn from them and the size is kept. Only sends answered
+    by OpenTSDB are observed, a failure tells nothing about the batch size.
+    """
+
+    def __init__(self, initial: int, target_latency: float, minimum: int=1, maximum: int=5000, step: int=None):
+        self.target_latency = target_latency
+        self.minimum = minimum
+        self.maximum = max(maximum, initial)
+        self.step = step or initial
+        self.size = initial
+
+    def observe(self, batch_size: int, latency: float):
+        if latency > self.target_latency:
+            self.size = max(self.minimum, self.size // 2)
+        elif batch_size >= self.size:
+            self.size = min(self.maximum, self.size + self.step)
+
+
+class Batcher:
+    """Collect points from the queue into batches bounded by count, payload bytes and linger time.
+
+    Batch is sent as soon as one of the limits is reached: `max_points` points,
+    `max_bytes` estimated payload bytes (0 - unlimited) or `linger` seconds passed
+    since its first point arrived. With zero linger only already queued points are taken.
+    A chunk of points (`PointsChunk`) is sized by its producer and always makes a batch of its own.
+    """
+
+    def __init__(self, metrics_queue, max_points: int, max_bytes: int=0, linger: float=0,
+                 adaptive: AdaptiveBatchSize=None, point_size=estimate_size, clock=time.monotonic):
+        self.metrics_queue = metrics_queue
+        self.max_points = max_points
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.adaptive = adaptive
+        self.point_size = point_size
+        self._clock = clock
+        self.pending = None
+
+    @property
+    def batch_size(self) -> int:
+        return self.adaptive.size if self.adaptive is not None else self.max_points
+
+    def observe(self, batch_size: int, latency: float):
+        if self.adaptive is not None:
+            self.adaptive.observe(batch_size, latency)
+
+    def next_batch(self, wait_timeout: float) -> list:
+        """Wait up to `wait_timeout` for the first point (raise Empty), then fill the batch.
+
+        Raise StopIteration if the queue is closed and there is nothing to send,
+        a close marker found behind some points is put back for the next call.
+        """
+        item, self.pending = self.pending, None
+        if item is None:
+            item = self.metrics_queue.get(block=True, timeout=wait_timeout)
+        if item is StopIteration:
+            raise StopIteration
+        if type(item) is PointsChunk:
+            return [item]
+
+        batch_size = self.batch_size
+        batch = [item]
+        size = self.point_size(item) if self.max_bytes else 0
+        deadline = self._clock() + self.linger
+        while len(batch) < batch_size and (not self.max_bytes or size < self.max_bytes):
+            try:
+                remaining = deadline - self._clock()
+                if remaining > 0:
+                    item = self.metrics_queue.get(block=True, timeout=remaining)
+                else:
+                    item = self.metrics_queue.get_nowait()
+            except Empty:
+                break
+
+            if item is StopIteration:
+                self.metrics_queue.put(StopIteration)
+                break
+            if type(item) is PointsChunk:
+                self.pending = item
+                break
+            batch.append(item)
+            if self.max_bytes:
+                size += self.point_size(item)
+        return batch
@@ -0,0 +1,125 @@
+from logging import getLogger
+import threading
+import time
+
+from opentsdb.sketches import HyperLogLog
+
+logger = getLogger('opentsdb-py')
+
+
+class _TagValues:
+    __slots__ = ('values', 'sketch', 'throttled')
+
+    def __init__(self, precision: int):
+        self.values = set()
+        self.sketch = HyperLogLog(precision)
+        self.throttled = 0
+
+
+class CardinalityGuard:
+    """Limit distinct values per metric and tag key, and points per second per series.
+
+    The first `max_tag_values` values of a tag key of a metric are admitted and kept in
+    an exact set, series with any other value are collapsed (the value is replaced by
+    `other_value`) or rejected. A HyperLogLog sketch per tag key estimates how many distinct
+    values were really seen. Checks run only for new series, they are cached by the client.
+    """
+
+    COLLAPSE = 'collapse'
+    REJECT = 'reject'
+
+    def __init__(self, max_tag_values: int=0, action: str=COLLAPSE, other_value: str='other',
+                 max_series_rate: float=0, max_series_burst: float=None, precision: int=10, clock=time.monotonic):
+        assert action in (self.COLLAPSE, self.REJECT), 'Unsupported cardinality action: %s' % action
+        self.max_tag_values = max_tag_values
+        self.action = action
+        self.other_value = other_value
+        self.max_series_rate = max_series_rate
+        self.max_series_burst = max(1.0, max_series_burst or max_series_rate)
+        self.precision = precision
+        self.collapsed = 0
+        self.rejected = 0
+
+        self._clock = clock
+        self._tags = {}
+        self._rate_limited = {}
+        self._lock = threading.Lock()
+
+    def admit(self, metric: str, tags: dict):
+        """Return tags to send the series with (a new dict if some values were collapsed) or None to reject it."""
+        if not self.max_tag_values:
+            return tags
+
+        with self._lock:
+            over = []
+            for key, value in tags.items():
+                state = self._tags.get((metric, key))
+                if state is None:
+                    state = self._tags[(metric, key)] = _TagValues(self.precision)
+                state.sketch.add(value)
+                if value not in state.values and len(state.values) >= self.max_tag_values:
+                    over.append(key)
+                    if not state.throttled:
+                        logger.warning("Tag %s of metric %s is over %d distinct values, new values are %s",
+                                       key, metric, self.max_tag_values,
+                                       'collapsed' if self.action == self.COLLAPSE else 'rejected')
+                    state.throttled += 1
+
+            if over and self.action == self.REJECT:
+                self.rejected += 1
+                return None
+
+            for key, value in tags.items():
+                if key not in over:
+                    self._tags[(metric, key)].values.add(value)
+            if not over:
+                return tags
+
+            self.collapsed += 1
+            tags = dict(tags)
+            for key in over:
+                tags[key] = self.other_value
+            return tags
+
+    def allow(self, series) -> bool:
+        """Take a token of the series bucket, False if the series is over max_series_rate."""
+        if not self.max_series_rate:
+            return True
+
+        now = self._clock()
+        state = series.rate_state
+        if state is None:
+            state = series.rate_state = [self.max_series_burst, now]
+        tokens = min(self.max_series_burst, state[0] + (now - state[1]) * self.max_series_rate)
+        state[1] = now
+        if tokens >= 1:
+            state[0] = tokens - 1
+            return True
+
+        state[0] = tokens
+        with self._lock:
+            limited = self._rate_limited.get(series.metric, 0)
+            if not limited:
+                logger.warning("Series of metric %s are over %s points per second, extra points are dropped",
+                               series.metric, self.max_series_rate)
+            self._rate_limited[series.metric] = limited + 1
+        return False
+
+    def after_fork(self):
+        """Called in a forked child, admitted values stay admitted, the lock may be held by a parent thread."""
+        self._lock = threading.Lock()
+
+    def stats(self) -> dict:
+        """Throttled tag keys with their admitted and estimated distinct values, rate limited points per metric."""
+        with self._lock:
+            tags = {
+                '%s %s' % key: {'admitted': len(state.values), 'distinct': state.sketch.count(),
+                                'throttled': state.throttled}
+                for key, state in self._tags.items() if state.throttled
+            }
+            return {
+                'collapsed': self.collapsed,
+                'rejected': self.rejected,
+                'tags': tags,
+                'rate_limited': dict(self._rate_limited),
+            }
@@ -0,0 +1,148 @@
+from types import MappingProxyType
+import zlib
+
+
+class Series:
+    """Metric name with its final (merged) tags, shared by all data points of the series.
+
+    `stable_hash` is the same in every process (hash() of strings is salted per process),
+    it routes the series to a queue shard or an OpenTSDB node.
+    """
+
+    __slots__ = ('metric', 'tags', 'key', 'telnet_format', 'json_prefix', 'rate_state', 'stable_hash', '_hash')
+
+    def __init__(self, metric: str, tags: dict):
+        self.metric = metric
+        self.tags = tags
+        self.key = (metric, tuple(sorted(tags.items())))
+        self._hash = hash(self.key)
+        self.stable_hash = zlib.crc32(repr(self.key).encode('utf-8'))
+
+        tags_string = ' '.join(['%s=%s' % (key, value) for key, value in tags.items()])
+        self.json_prefix = None
+        self.rate_state = None
+        self.telnet_format = 'put %s %%d %%s %s\n' % (metric.replace('%', '%%'), tags_string.replace('%', '%%'))
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        return isinstance(other, Series) and self.key == other.key
+
+    def __repr__(self):
+        return 'Series(%r, %r)' % (self.metric, self.tags)
+
+
+class DataPoint:
+    """One value of a series, converted to JSON / telnet text only when it is sent.
+
+    Item access (`point['value']`) is kept for compatibility with the dict based points.
+    """
+
+    __slots__ = ('series', 'timestamp', 'value')
+
+    FIELDS = ('metric', 'timestamp', 'value', 'tags')
+
+    def __init__(self, series: Series, timestamp: int, value):
+        self.series = series
+        self.timestamp = timestamp
+        self.value = value
+
+    @property
+    def metric(self) -> str:
+        return self.series.metric
+
+    @property
+    def tags(self) -> MappingProxyType:
+        # read-only, the dict is shared by all points of the series
+        return MappingProxyType(self.series.tags)
+
+    def __getitem__(self, key):
+        if key not in self.FIELDS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def keys(self):
+        return self.FIELDS
+
+    def to_dict(self) -> dict:
+        return dict(metric=self.series.metric, timestamp=self.timestamp, value=self.value, tags=dict(self.series.tags))
+
+    @classmethod
+    def from_dict(cls, metric: dict):
+        return cls(Series(metric['metric'], metric['tags']), metric['timestamp'], metric['value'])
+
+    def __eq__(self, other):
+        return (isinstance(other, DataPoint) and self.series == other.series
+                and self.timestamp == other.timestamp and self.value == other.value)
+
+    def __repr__(self):
+        return 'DataPoint(%r, %r, %r, %r)' % (self.series.metric, self.timestamp, self.value, self.series.tags)
+
+
+class PointsChunk:
+    """Consecutive points of one series, queued and sent as a whole (see `TSDBClient.send_many`).
+
+    The chunk is encoded once for the protocol it is sent with and the text is kept,
+    so a retry does not encode it again. Iteration yields its points one by one.
+    `on_sent(points)` is called when OpenTSDB answered for points of the chunk (accepted
+    or rejected as invalid), points which are dropped or spooled are not reported.
+    """
+
+    __slots__ = ('series', 'timestamps', 'values', 'on_sent', '_json', '_telnet')
+
+    def __init__(self, series: Series, timestamps: list, values: list, on_sent=None):
+        self.series = series
+        self.timestamps = timestamps
+        self.values = values
+        self.on_sent = on_sent
+        self._json = None
+        self._telnet = None
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def __iter__(self):
+        series = self.series
+        for timestamp, value in zip(self.timestamps, self.values):
+            yield DataPoint(series, timestamp, value)
+
+    def json_text(self, encoder) -> str:
+        """Points as comma separated /api/put objects, formatted like `encoder` formats single points."""
+        if self._json is None:
+            point_format = encoder.series_prefix(self.series).replace('%', '%%') + '%d,"value":%s}'
+            values = encoder.format_values(self.values)
+            self._json = ','.join([point_format % item for item in zip(self.timestamps, values)])
+        return self._json
+
+    def telnet_text(self) -> str:
+        if self._telnet is None:
+            line_format = self.series.telnet_format
+            self._telnet = ''.join([line_format % item for item in zip(self.timestamps, self.values)])
+        return self._telnet
+
+    def __repr__(self):
+        return 'PointsChunk(%r, %d points, %r)' % (self.series.metric, len(self), self.series.tags)
+
+
+def points_count(items) -> int:
+    """Number of points in a batch of points and chunks."""
+    return sum(len(item) if type(item) is PointsChunk else 1 for item in items)
+
+
+def report_sent(items, retried: dict=None):
+    """Call `on_sent` of the chunks of an answered batch, minus their points `retried` ({id(chunk): points})."""
+    for item in items:
+        if type(item) is PointsChunk and item.on_sent is not None:
+            points = len(item) - (retried.get(id(item), 0) if retried else 0)
+            if points:
+                item.on_sent(points)
+
+
+def iter_points(items):
+    """Points of a batch with chunks expanded."""
+    for item in items:
+        if type(item) is PointsChunk:
+            yield from item
+        else:
+            yield item
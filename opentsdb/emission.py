@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class ChangeFilter:
+    """Emit a value of a series only when it moved by more than `deadband` since the last emitted one.
+
+    A value is emitted anyway when `heartbeat` seconds passed since the last emitted point
+    of the series (0 - no heartbeat), so unchanged series stay continuous on dashboards.
+    Series which stopped updating are listed by `due()` for the reporter to send their latest value.
+    The last emitted state is kept for at most `maxsize` series, least recently used ones are
+    forgotten and their next value is emitted.
+    """
+
+    def __init__(self, deadband: float=0, heartbeat: float=60, maxsize: int=10000, clock=time.monotonic):
+        self.deadband = deadband
+        self.heartbeat = heartbeat
+        self.maxsize = maxsize
+        self.emitted = 0
+        self.suppressed = 0
+        self.evictions = 0
+
+        self._clock = clock
+        self._last = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._last)
+
+    def should_emit(self, key, value) -> bool:
+        now = self._clock()
+        with self._lock:
+            last = self._last.get(key)
+            if last is not None and not self._changed(last[0], value) and (
+                    not self.heartbeat or now - last[1] < self.heartbeat):
+                # the latest value is sent by the heartbeat
+                self._last[key] = (last[0], last[1], value)
+                self._last.move_to_end(key)
+                self.suppressed += 1
+                return False
+
+            self._last[key] = (value, now, value)
+            self._last.move_to_end(key)
+            if len(self._last) > self.maxsize:
+                self._last.popitem(last=False)
+                self.evictions += 1
+            self.emitted += 1
+            return True
+
+    def due(self) -> list:
+        """(key, latest value) of series with no emitted point for `heartbeat` seconds, pass them to `should_emit`."""
+        if not self.heartbeat:
+            return []
+        now = self._clock()
+        with self._lock:
+            return [(key, latest) for key, (_, emitted_at, latest) in self._last.items()
+                    if now - emitted_at >= self.heartbeat]
+
+    def _changed(self, last, value) -> bool:
+        try:
+            # written so that NaN on either side is a change
+            return not abs(value - last) <= self.deadband
+        except TypeError:
+            return value != last
+
+    def clear(self):
+        with self._lock:
+            self._last.clear()
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._last),
+            'maxsize': self.maxsize,
+            'emitted': self.emitted,
+            'suppressed': self.suppressed,
+            'evictions': self.evictions,
+        }
+
+
+class Heartbeats:
+    """Collector which sends the latest value of `send()` series of a client when their heartbeat is due.
+
+    Heartbeat of a series which stopped updating is sent by the reporter, each report interval.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def collected(self, timestamp: int=None) -> list:
+        # the client may replace its change filter (e.g. in a forked child)
+        change_filter = self.client.change_filter
+        if change_filter is None:
+            return []
+        metrics = []
+        for series, value in change_filter.due():
+            tags = dict(series.tags)
+            if timestamp is not None:
+                tags['timestamp'] = timestamp
+            metrics.append((series.metric, value, tags))
+        return metrics
+
+    def collect(self, timestamp: int=None) -> int:
+        metrics = self.collected(timestamp)
+        if metrics:
+            self.client.send_collected(metrics)
+        return len(metrics)
+
+    def __str__(self):
+        return 'heartbeats'
@@ -16,6 +16,20 @@ class ValidationError(TSDBClientException):
     pass
 
 
+class QueryError(TSDBClientException):
+    pass
+
+
+class TransientError(TSDBClientException, ConnectionError):
+    """OpenTSDB is overloaded or failed (e.g. HTTP 503), the same request may succeed later."""
+    pass
+
+
+class RejectedError(TSDBClientException):
+    """OpenTSDB refused the request as a whole (e.g. HTTP 413), the same request will fail again."""
+    pass
+
+
 class UnknownTSDBConnectProtocol(TSDBClientException):
     def __init__(self, protocol):
         self.protocol = protocol
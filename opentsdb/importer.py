@@ -0,0 +1,313 @@
+"""Import `tsdb import` text files (`metric timestamp value tag=value ...` per line) into OpenTSDB.
+
+    opentsdb-import data.txt.gz --host opentsdb.address --checkpoint data.offset
+
+Files are split into chunks on line boundaries, which are parsed by a pool of processes
+(plain files are memory-mapped by the workers, gzip files are streamed by the main process).
+Parsed points are grouped by series and sent with `TSDBClient.send_many`.
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from logging import getLogger
+import argparse
+import gzip
+import logging
+import mmap
+import os
+import sys
+import threading
+import time
+
+from opentsdb.exceptions import ValidationError
+from opentsdb.protocols import TSDBConnectProtocols
+from opentsdb.tsdb_client import TSDBClient
+
+logger = getLogger('opentsdb-py')
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+
+def parse_value(text: str):
+    if '.' in text or 'e' in text or 'E' in text or 'n' in text or 'N' in text:
+        return float(text)
+    return int(text)
+
+
+def parse_lines(data: bytes) -> tuple:
+    """Parse import lines into ([(metric, tags text, timestamps, values), ...], lines, errors), grouped by series."""
+    groups = {}
+    lines = errors = 0
+    for line in data.decode('utf-8', 'replace').splitlines():
+        parts = line.split(None, 3)
+        if not parts or parts[0].startswith('#'):
+            continue
+        lines += 1
+        try:
+            metric, timestamp, value, tags = parts
+            timestamp, value = int(timestamp), parse_value(value)
+        except ValueError:
+            errors += 1
+            continue
+
+        group = groups.get((metric, tags))
+        if group is None:
+            group = groups[(metric, tags)] = ([], [])
+        group[0].append(timestamp)
+        group[1].append(value)
+    return [(metric, tags, timestamps, values) for (metric, tags), (timestamps, values) in groups.items()], lines, errors
+
+
+def parse_range(path: str, start: int, end: int) -> tuple:
+    """Parse bytes [start, end) of a plain file, the range must start and end on line boundaries."""
+    with open(path, 'rb') as file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        return parse_lines(data[start:end])
+
+
+def is_gzip(path: str) -> bool:
+    with open(path, 'rb') as file:
+        return file.read(2) == GZIP_MAGIC
+
+
+def parse_tags(text: str) -> dict:
+    tags = {}
+    for tag in text.split():
+        key, separator, value = tag.partition('=')
+        if not separator or not key or not value:
+            raise ValidationError("Metric not valid: incorrect tag '%s'" % tag)
+        tags[key] = value
+    return tags
+
+
+class Importer:
+    """Import files through `client`, `progress(dict)` is called at most every `progress_interval` seconds.
+
+    `offset` is the position in the file (uncompressed for gzip) up to which all points were
+    sent to OpenTSDB, so an interrupted import may be resumed from it: each parsed chunk counts
+    its points still to be answered (`send_many` on_sent), the offset is the end of the last
+    chunk before which all chunks are answered. Dropped points keep it before their chunk.
+    """
+
+    CHUNK_SIZE = 4 * 1024 * 1024
+
+    def __init__(self, client: TSDBClient, workers: int=None, chunk_size: int=CHUNK_SIZE,
+                 progress=None, progress_interval: float=1):
+        self.client = client
+        self.workers = workers if workers is not None else os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.progress_interval = progress_interval
+
+        self.offset = 0
+        self.size = 0
+        self.lines = 0
+        self.points = 0
+        self.errors = 0
+        self._parsed_offset = 0
+        self._started = 0.0
+        self._reported = 0.0
+        # [end offset, points not answered yet] of the chunks after the offset
+        self._unconfirmed = deque()
+        self._lock = threading.Lock()
+
+    def run(self, path: str, offset: int=0) -> dict:
+        """Import the file from `offset` (a line boundary, e.g. a previous `offset`), return the final stats."""
+        self.offset = self._parsed_offset = offset
+        self.lines = self.points = self.errors = 0
+        self._started = self._reported = time.monotonic()
+        self._unconfirmed.clear()
+
+        if is_gzip(path):
+            self.size = 0
+            tasks = self._gzip_tasks(path, offset)
+        else:
+            self.size = os.path.getsize(path)
+            tasks = self._file_tasks(path, offset)
+
+        if self.workers > 1:
+            with ProcessPoolExecutor(self.workers) as executor:
+                self._run_tasks(tasks, executor)
+        else:
+            self._run_tasks(tasks, None)
+        return self.stats()
+
+    def _run_tasks(self, tasks, executor):
+        # at most two chunks per worker are parsed ahead, the client queue bounds the rest
+        in_flight = deque()
+        for end, function, args in tasks:
+            if executor is None:
+                self._send(end, function(*args))
+                continue
+
+            in_flight.append((end, executor.submit(function, *args)))
+            if len(in_flight) >= self.workers * 2:
+                end, future = in_flight.popleft()
+                self._send(end, future.result())
+        while in_flight:
+            end, future = in_flight.popleft()
+            self._send(end, future.result())
+
+    def _file_tasks(self, path: str, offset: int):
+        with open(path, 'rb') as file:
+            if not self.size:
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                start = offset
+                if 0 < start < self.size and data[start - 1:start] != b'\n':
+                    start = self._line_end(data, start)
+                while start < self.size:
+                    end = self._line_end(data, start + self.chunk_size)
+                    yield end, parse_range, (path, start, end)
+                    start = end
+
+    def _line_end(self, data, position: int) -> int:
+        if position >= self.size:
+            return self.size
+        newline = data.find(b'\n', position)
+        return self.size if newline < 0 else newline + 1
+
+    def _gzip_tasks(self, path: str, offset: int):
+        with gzip.open(path, 'rb') as file:
+            end = offset
+            if offset > 0:
+                file.seek(offset - 1)
+                if file.read(1) != b'\n':
+                    end += len(file.readline())
+            while True:
+                data = file.read(self.chunk_size)
+                if not data:
+                    break
+                if not data.endswith(b'\n'):
+                    data += file.readline()
+                end += len(data)
+                yield end, parse_lines, (data, )
+
+    def _send(self, end: int, result: tuple):
+        groups, lines, errors = result
+        self.lines += lines
+        self.errors += errors
+        # one point more until all groups are queued, so the chunk can't be answered before
+        chunk = [end, 1]
+        with self._lock:
+            self._unconfirmed.append(chunk)
+        on_sent = partial(self._chunk_sent, chunk)
+        for metric, tags, timestamps, values in groups:
+            try:
+                points = self.client.send_many(metric, timestamps, values, on_sent, **parse_tags(tags))
+            except ValidationError as error:
+                logger.error("Skip %d points of %s %s: %s", len(values), metric, tags, error)
+                self.errors += len(values)
+                continue
+            self.points += points
+            with self._lock:
+                chunk[1] += points
+        self._chunk_sent(chunk, 1)
+
+        self._parsed_offset = end
+        self._update_offset()
+        if self.progress is not None and time.monotonic() - self._reported >= self.progress_interval:
+            self._reported = time.monotonic()
+            self.progress(self.stats())
+
+    def _chunk_sent(self, chunk: list, points: int):
+        # called by the push threads
+        with self._lock:
+            chunk[1] -= points
+
+    def _update_offset(self) -> int:
+        with self._lock:
+            while self._unconfirmed and self._unconfirmed[0][1] <= 0:
+                self.offset = self._unconfirmed.popleft()[0]
+            return self.offset
+
+    def finish(self) -> dict:
+        """Close the client, wait until queued points are sent and return the final stats."""
+        self.client.close()
+        self.client.wait()
+        self._update_offset()
+        return self.stats()
+
+    def stats(self) -> dict:
+        seconds = max(time.monotonic() - self._started, 1e-9)
+        return {
+            'offset': self._update_offset(),
+            'parsed_offset': self._parsed_offset,
+            'size': self.size,
+            'lines': self.lines,
+            'points': self.points,
+            'errors': self.errors,
+            'seconds': seconds,
+            'points_per_second': self.points / seconds,
+        }
+
+
+def format_stats(stats: dict) -> str:
+    position = '%d' % stats['parsed_offset']
+    if stats['size']:
+        position += '/%d (%.1f%%)' % (stats['size'], 100.0 * stats['parsed_offset'] / stats['size'])
+    return '%s bytes, %d points, %.0f points/s, %d errors, sent up to offset %d' % (
+        position, stats['points'], stats['points_per_second'], stats['errors'], stats['offset'])
+
+
+def _read_checkpoint(path: str) -> int:
+    try:
+        with open(path) as file:
+            return int(file.read().strip() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def _write_checkpoint(path: str, offset: int):
+    with open(path + '.tmp', 'w') as file:
+        file.write('%d\n' % offset)
+    os.replace(path + '.tmp', path)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(prog='opentsdb-import', description='Import `tsdb import` files into OpenTSDB')
+    parser.add_argument('path', help='file with `metric timestamp value tag=value ...` lines, may be gzipped')
+    parser.add_argument('--host', default=TSDBClient.TSDB_HOST)
+    parser.add_argument('--port', type=int, default=TSDBClient.TSDB_PORT)
+    parser.add_argument('--uri', default=TSDBClient.TSDB_URI, help='OpenTSDB URL instead of host and port')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1, help='parsing processes')
+    parser.add_argument('--send-workers', type=int, default=TSDBClient.TSDB_SEND_WORKERS,
+                        help='connections to OpenTSDB')
+    parser.add_argument('--chunk-size', type=int, default=Importer.CHUNK_SIZE, help='bytes parsed at once')
+    parser.add_argument('--offset', type=int, help='start from the byte offset (default: from the checkpoint or 0)')
+    parser.add_argument('--checkpoint', help='file to keep the offset of sent data in, for resuming')
+    parser.add_argument('-t', '--tag', action='append', default=[], help='static tag added to every point, k=v')
+    parser.add_argument('-q', '--quiet', action='store_true', help="don't report progress")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.WARNING)
+    offset = args.offset
+    if offset is None:
+        offset = _read_checkpoint(args.checkpoint) if args.checkpoint else 0
+
+    def progress(stats):
+        if not args.quiet:
+            print(format_stats(stats), file=sys.stderr)
+        if args.checkpoint:
+            _write_checkpoint(args.checkpoint, stats['offset'])
+
+    client = TSDBClient(args.host, args.port, uri=args.uri, protocol=TSDBConnectProtocols.HTTP, host_tag=False,
+                        static_tags=parse_tags(' '.join(args.tag)), send_workers=args.send_workers,
+                        max_queue_size=max(16, args.send_workers * 4))
+    importer = Importer(client, args.workers, args.chunk_size, progress)
+    interrupted = False
+    try:
+        importer.run(args.path, offset)
+    except KeyboardInterrupt:
+        interrupted = True
+        print('Interrupted, sending parsed points...', file=sys.stderr)
+
+    stats = importer.finish()
+    progress(stats)
+    if interrupted or stats['offset'] < stats['parsed_offset']:
+        print('Resume with --offset %d' % stats['offset'], file=sys.stderr)
+        return 1
+    return 1 if stats['errors'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
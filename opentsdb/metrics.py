@@ -1,27 +1,44 @@
-from threading import Lock
+from threading import Lock, local
 from functools import wraps
 from logging import getLogger
+from types import MappingProxyType
 import time
+import weakref
 
+from opentsdb.emission import ChangeFilter
 from opentsdb.exceptions import TagsError
+from opentsdb.multiprocess import MultiprocessAggregator, pending_clients, start_pending_clients
+from opentsdb.reporter import MetricsReporter
+from opentsdb.sketches import BucketHistogram, DDSketch
 
 logger = getLogger('opentsdb-py')
 
 
-def send_metric(func):
+def validate_tags(tag_values_length, tag_names_length, optional_tags):
+    if optional_tags is False and tag_values_length != tag_names_length:
+        raise TagsError("Tags is incorrect, expected %d != %d" % (tag_names_length, tag_values_length))
+
 
-    def validate_tags(tag_values_length, tag_names_length, optional_tags):
-        if optional_tags is False and tag_values_length != tag_names_length:
-            raise TagsError("Tags is incorrect, expected %d != %d" % (tag_names_length, tag_values_length))
+def send_metric(func):
 
     @wraps(func)
     def wrapper(self: Metric, *args, **kwargs):
+        if pending_clients:
+            start_pending_clients()
+        if self.client.report_mode == MetricsReporter.SNAPSHOT:
+            return self._update_snapshot(func, *args, **kwargs)
+
         with self._lock:
             try:
                 func(self, *args, **kwargs)
                 tags = self.pop_tags()
                 validate_tags(len(tags), self.tag_names_length, self.optional_tags)
-                return self.client.send(self.name, self._value.get(), **tags)
+                value = self._value.get()
+                if self.change_filter is not None and not self.change_filter.should_emit(
+                        tuple(sorted(tags.items())), value):
+                    self.client.telemetry.inc('suppressed')
+                    return None
+                return self.client.send(self.name, value, **tags)
             except ValueError as error:
                 logger.error(error)
 
@@ -29,6 +46,10 @@ def send_metric(func):
 
 
 class Metric:
+    # how values of processes are combined with TSDBClient multiprocess_dir
+    multiprocess_mode = 'last'
+    # updates which don't change the value enough are not sent, see Gauge
+    change_filter = None
 
     def __init__(self, name: str, tag_names=(), client=None, optional_tags=False):
         self.name = name
@@ -41,12 +62,82 @@ class Metric:
 
         self._value = None
         self._tags = None
+        self._children = {}
+        # the latest value per tags, sent each report interval in snapshot report mode
+        self._snapshot = {}
         self._lock = Lock()
 
+        if client is not None:
+            client.register_collector(self)
+
     @property
     def value(self):
         return self._value.get()
 
+    def labels(self, *tag_values):
+        """Return child metric bound to tag values, updates of a child are sent each client report interval."""
+        child = self._children.get(tag_values)
+        if child is None:
+            if len(tag_values) > self.tag_names_length:
+                raise TagsError("Too many tags is set, expected %d" % self.tag_names_length)
+            validate_tags(len(tag_values), self.tag_names_length, self.optional_tags)
+
+            with self._lock:
+                child = self._children.get(tag_values)
+                if child is None:
+                    child = self._children[tag_values] = self._new_child(dict(zip(self.tag_names, tag_values)))
+        return child
+
+    def _new_child(self, tags: dict):
+        raise NotImplementedError()
+
+    def _update_snapshot(self, func, *args, **kwargs):
+        """Update the value sent by `collect` in snapshot report mode, nothing is sent (returns None)."""
+        try:
+            with self._lock:
+                tags = self.pop_tags()
+                validate_tags(len(tags), self.tag_names_length, self.optional_tags)
+                if not tags:
+                    func(self, *args, **kwargs)
+                    self._snapshot[()] = ({}, self._value.get())
+                    return None
+            # each tag set keeps its own value, like a labeled child
+            getattr(self.labels(*tags.values()), func.__name__)(*args, **kwargs)
+        except ValueError as error:
+            logger.error(error)
+        return None
+
+    def collected(self, timestamp: int=None) -> list:
+        """(name, value, tags) of the snapshot and labeled children values, for `TSDBClient.send_collected`."""
+        with self._lock:
+            snapshot = list(self._snapshot.values())
+        children = list(self._children.values())
+        metrics = [(self.name, value, tags) for tags, value in snapshot]
+        metrics.extend((self.name, child.value, child.tags) for child in children)
+        if timestamp is not None:
+            metrics = [(name, value, dict(tags, timestamp=timestamp)) for name, value, tags in metrics]
+        return metrics
+
+    def collect(self, timestamp: int=None) -> int:
+        """Send the snapshot and labeled children values, all series of the metric as one batch."""
+        metrics = self.collected(timestamp)
+        if metrics:
+            self.client.send_collected(metrics)
+        return len(metrics)
+
+    def _after_fork(self, multiprocess: bool):
+        """Called in a forked child, in multiprocess mode summed values of the parent are already counted."""
+        self._lock = Lock()
+        self._snapshot = {}
+        if self.change_filter is not None:
+            self.change_filter = ChangeFilter(
+                self.change_filter.deadband, self.change_filter.heartbeat, self.change_filter.maxsize)
+        if multiprocess and self.multiprocess_mode in ('total', 'sum'):
+            if self._value is not None:
+                self._value = _MetricValue()
+            for child in self._children.values():
+                child._value = _ShardedValue()
+
     def tags(self, *tag_values):
         if len(tag_values) > self.tag_names_length:
             raise TagsError("Too many tags is set, expected %d" % self.tag_names_length)
@@ -61,6 +152,195 @@ class Metric:
         return tags
 
 
+class _CellOwner:
+    """Kept only in the thread-local, so it is collected when its thread ends."""
+
+    __slots__ = ('__weakref__', )
+
+
+def _release_cell(shards_ref, cell):
+    shards = shards_ref()
+    if shards is not None:
+        shards._release(cell)
+
+
+class _ThreadShards:
+    """Cells owned by threads: a cell is written only by its thread and read by the collector.
+
+    When a thread ends its cell is folded into the shared part and released, so short-lived
+    threads don't leave cells behind.
+    """
+
+    def __init__(self):
+        self._local = local()
+        self._cells = {}
+        self._cells_lock = Lock()
+
+    def _new_cell(self):
+        raise NotImplementedError()
+
+    def _fold(self, cell):
+        """Keep what the cell of an ended thread holds, called under the cells lock."""
+        raise NotImplementedError()
+
+    def _cell(self):
+        if pending_clients:
+            start_pending_clients()
+        try:
+            return self._local.cell
+        except AttributeError:
+            cell = self._local.cell = self._new_cell()
+            owner = self._local.owner = _CellOwner()
+            finalizer = weakref.finalize(owner, _release_cell, weakref.ref(self), cell)
+            finalizer.atexit = False
+            with self._cells_lock:
+                self._cells[id(cell)] = cell
+            return cell
+
+    def _release(self, cell):
+        with self._cells_lock:
+            if self._cells.pop(id(cell), None) is not None:
+                self._fold(cell)
+
+    def _all_cells(self):
+        with self._cells_lock:
+            return list(self._cells.values())
+
+
+class _ShardedValue(_ThreadShards):
+
+    def __init__(self):
+        super().__init__()
+        self._base = 0.0
+        self._generation = 0
+
+    def _new_cell(self):
+        return [self._generation, 0.0]
+
+    def _fold(self, cell):
+        if cell[0] == self._generation:
+            self._base += cell[1]
+
+    def inc(self, amount):
+        cell = self._cell()
+        generation = self._generation
+        if cell[0] != generation:
+            cell[0] = generation
+            cell[1] = 0.0
+        cell[1] += amount
+
+    def set(self, value):
+        with self._cells_lock:
+            self._base = value
+            self._generation += 1
+
+    def get(self):
+        with self._cells_lock:
+            generation, base, cells = self._generation, self._base, list(self._cells.values())
+        return base + sum(cell[1] for cell in cells if cell[0] == generation)
+
+
+class _ShardedState(_ThreadShards):
+
+    def __init__(self, new_state):
+        super().__init__()
+        self._new_state = new_state
+        self._released = None
+
+    def _new_cell(self):
+        return [Lock(), None]
+
+    def _fold(self, cell):
+        with cell[0]:
+            state, cell[1] = cell[1], None
+        if state is None:
+            return
+        if self._released is None:
+            self._released = state
+        else:
+            self._released.merge(state)
+
+    def add(self, value):
+        cell = self._cell()
+        with cell[0]:
+            if cell[1] is None:
+                cell[1] = self._new_state()
+            cell[1].add(value)
+
+    def pop(self):
+        with self._cells_lock:
+            merged, self._released = self._released, None
+            cells = list(self._cells.values())
+        for cell in cells:
+            with cell[0]:
+                state, cell[1] = cell[1], None
+            if state is None:
+                continue
+            if merged is None:
+                merged = state
+            else:
+                merged.merge(state)
+        return merged
+
+
+class _CounterChild:
+    __slots__ = ('_tags', '_value')
+
+    def __init__(self, tags: dict):
+        self._tags = MappingProxyType(tags)
+        self._value = _ShardedValue()
+
+    @property
+    def tags(self):
+        return self._tags
+
+    @property
+    def value(self):
+        return self._value.get()
+
+    def inc(self, amount=1):
+        if amount < 0:
+            raise ValueError('Counters can only be incremented by non-negative amounts.')
+        self._value.inc(amount)
+
+
+class _GaugeChild(_CounterChild):
+    __slots__ = ()
+
+    def inc(self, amount=1):
+        self._value.inc(amount)
+
+    def dec(self, amount=1):
+        self._value.inc(-amount)
+
+    def set(self, value: float):
+        self._value.set(float(value))
+
+    def timeit(self, timer=time.perf_counter):
+        return _Timer(self.set, timer)
+
+
+class _IntervalChild:
+    __slots__ = ('_tags', '_state')
+
+    def __init__(self, tags: dict, new_state):
+        self._tags = MappingProxyType(tags)
+        self._state = _ShardedState(new_state)
+
+    @property
+    def tags(self):
+        return self._tags
+
+    def observe(self, value: float):
+        self._state.add(value)
+
+    def time(self, timer=time.perf_counter):
+        return _Timer(self.observe, timer)
+
+    def pop_state(self):
+        return self._state.pop()
+
+
 class _MetricValue:
     def __init__(self):
         self._value = 0.0
@@ -80,12 +360,16 @@ class _MetricValue:
 
 
 class Counter(Metric):
+    multiprocess_mode = 'total'
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._value = _MetricValue()
         logger.info("Metric registered [type: Counter]: %s", self.name)
 
+    def _new_child(self, tags: dict):
+        return _CounterChild(tags)
+
     @send_metric
     def inc(self, amount=1):
         if amount < 0:
@@ -97,12 +381,38 @@ class Counter(Metric):
 
 
 class Gauge(Metric):
+    """Value which goes up and down, sent on every update.
 
-    def __init__(self, *args, **kwargs):
+    With `deadband` an update is sent only when the value moved by more than `deadband`
+    (0 - when it changed at all) since the last sent one, or `heartbeat` seconds passed.
+    """
+
+    def __init__(self, *args, multiprocess_mode: str='last', deadband: float=None, heartbeat: float=60, **kwargs):
+        assert multiprocess_mode in MultiprocessAggregator.MODES, 'Unsupported multiprocess mode: %s' % multiprocess_mode
+        self.multiprocess_mode = multiprocess_mode
+        if deadband is not None:
+            self.change_filter = ChangeFilter(deadband, heartbeat)
         super().__init__(*args, **kwargs)
         self._value = _MetricValue()
         logger.info("Metric registered [type: Gauge]: %s", self.name)
 
+    def _new_child(self, tags: dict):
+        return _GaugeChild(tags)
+
+    def collected(self, timestamp: int=None) -> list:
+        """Values of `collect` and, with `deadband`, the latest values of series whose heartbeat is due."""
+        metrics = super().collected(timestamp)
+        if self.change_filter is None:
+            return metrics
+        for key, value in self.change_filter.due():
+            if not self.change_filter.should_emit(key, value):
+                continue
+            tags = dict(key)
+            if timestamp is not None:
+                tags['timestamp'] = timestamp
+            metrics.append((self.name, value, tags))
+        return metrics
+
     @send_metric
     def inc(self, amount=1):
         self._value.inc(amount)
@@ -116,19 +426,123 @@ class Gauge(Metric):
         self._value.set(float(value))
 
     def timeit(self, timer=time.perf_counter):
-        return _GaugeTimer(self, timer)
+        return _Timer(self.set, timer)
+
+
+class _IntervalMetric(Metric):
+    """Metric which records observations locally and sends aggregates once per client report interval."""
+
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self, name: str, tag_names=(), client=None, optional_tags=False, quantiles=QUANTILES):
+        self.quantiles = tuple(quantiles)
+        self._states = {}
+        super().__init__(name, tag_names, client, optional_tags)
+
+    def _new_state(self):
+        raise NotImplementedError()
+
+    def observe(self, value: float):
+        if pending_clients:
+            start_pending_clients()
+        with self._lock:
+            tags = self.pop_tags()
+            validate_tags(len(tags), self.tag_names_length, self.optional_tags)
+            key = tuple(sorted(tags.items()))
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = self._new_state()
+            state.add(value)
+
+    def time(self, timer=time.perf_counter):
+        return _Timer(self.observe, timer)
+
+    def _new_child(self, tags: dict):
+        return _IntervalChild(tags, self._new_state)
+
+    def _after_fork(self, multiprocess: bool):
+        # observations of the parent are reported by the parent
+        super()._after_fork(multiprocess)
+        self._states = {}
+        for child in self._children.values():
+            child._state = _ShardedState(self._new_state)
+
+    def collected(self, timestamp: int=None) -> list:
+        """(name, value, tags) of count, sum, max and quantiles of each series, observations start anew."""
+        with self._lock:
+            states, self._states = self._states, {}
+
+        for child in list(self._children.values()):
+            state = child.pop_state()
+            if state is None:
+                continue
+            key = tuple(sorted(child.tags.items()))
+            if key in states:
+                states[key].merge(state)
+            else:
+                states[key] = state
+
+        metrics = []
+        for key, state in states.items():
+            tags = dict(key)
+            if timestamp is not None:
+                tags['timestamp'] = timestamp
+            metrics.append((self.name + '.count', state.count, tags))
+            metrics.append((self.name + '.sum', state.sum, tags))
+            metrics.append((self.name + '.max', state.max, tags))
+            for quantile in self.quantiles:
+                metrics.append(('%s.p%s' % (self.name, format(quantile * 100, 'g')), state.quantile(quantile), tags))
+        return metrics
+
+    def collect(self, timestamp: int=None) -> int:
+        """Send the aggregates of all series as one batch, return the number of series."""
+        metrics = self.collected(timestamp)
+        if metrics:
+            self.client.send_collected(metrics)
+        # count, sum, max and the quantiles of each series
+        return len(metrics) // (3 + len(self.quantiles))
+
+    def __str__(self):
+        return self.name
+
+
+class Histogram(_IntervalMetric):
+    """Observations counted in fixed buckets, quantiles are estimated from the buckets."""
+
+    BUCKETS = (.005, .01, .025, .05, .075, .1, .25, .5, .75, 1.0, 2.5, 5.0, 7.5, 10.0)
+
+    def __init__(self, *args, buckets=BUCKETS, **kwargs):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(*args, **kwargs)
+        logger.info("Metric registered [type: Histogram]: %s", self.name)
+
+    def _new_state(self):
+        return BucketHistogram(self.buckets)
+
+
+class Summary(_IntervalMetric):
+    """Observations kept in a DDSketch, quantiles are within `relative_accuracy` of the real ones."""
+
+    def __init__(self, *args, relative_accuracy: float=0.01, max_bins: int=2048, **kwargs):
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        super().__init__(*args, **kwargs)
+        logger.info("Metric registered [type: Summary]: %s", self.name)
+
+    def _new_state(self):
+        return DDSketch(self.relative_accuracy, self.max_bins)
 
 
-class _GaugeTimer:
-    def __init__(self, gauge, timer):
-        self._gauge = gauge
+class _Timer:
+    def __init__(self, callback, timer):
+        self._callback = callback
         self._timer = timer
 
     def __enter__(self):
         self._start = self._timer()
 
     def __exit__(self, *_):
-        self._gauge.set(max(self._timer() - self._start, 0))
+        self._callback(max(self._timer() - self._start, 0))
 
     def __call__(self, func):
         @wraps(func)
@@ -0,0 +1,284 @@
+from collections import deque
+from logging import getLogger
+import queue
+import threading
+import time
+import zlib
+
+from opentsdb.batcher import estimate_size
+from opentsdb.datapoint import Series, points_count
+
+logger = getLogger('opentsdb-py')
+
+
+def series_key(point):
+    return point.series
+
+
+def stable_hash(key) -> int:
+    """Hash of a shard key which is the same in every process."""
+    if type(key) is Series:
+        return key.stable_hash
+    return zlib.crc32(repr(key).encode('utf-8'))
+
+
+class OverflowCounter:
+    """Count metrics lost to a full queue and log them at most once per `log_interval` seconds."""
+
+    def __init__(self, policy: str, log_interval: float=10, clock=time.monotonic):
+        self.policy = policy
+        self.log_interval = log_interval
+        self.overflowed = 0
+        self._clock = clock
+        self._logged_at = clock()
+        self._logged_overflowed = 0
+
+    def add(self, count: int):
+        self.overflowed += count
+        now = self._clock()
+        if now - self._logged_at < self.log_interval:
+            return
+        overflowed, seconds = self.overflowed - self._logged_overflowed, now - self._logged_at
+        self._logged_at, self._logged_overflowed = now, self.overflowed
+        logger.warning("Queue is full, %d metrics overflowed (%s) in %.0f seconds", overflowed, self.policy, seconds)
+
+
+class MetricsQueue:
+    """FIFO of points bounded by count and estimated payload bytes, with a policy for overflow.
+
+    `put` / `get` follow `queue.Queue` (block or raise Full / Empty) and are used for
+    markers and bulk data. Producers of single points use `offer`, which never raises:
+    on overflow it drops the new point (drop_newest), the oldest ones (drop_oldest),
+    waits up to `block_timeout` for room and then drops the new point (block), or keeps
+    every `sample_every`-th new point in place of the oldest one (sample). One plain
+    lock guards the deque, conditions are signalled only when somebody waits.
+    Overflows are logged at most once per LOG_INTERVAL seconds.
+    """
+
+    DROP_NEWEST = 'drop_newest'
+    DROP_OLDEST = 'drop_oldest'
+    BLOCK = 'block'
+    SAMPLE = 'sample'
+    OVERFLOW_POLICIES = (DROP_NEWEST, DROP_OLDEST, BLOCK, SAMPLE)
+    LOG_INTERVAL = 10
+    SAMPLE_EVERY = 10
+
+    # set by RoutingQueue while the node of this queue is ejected: takes items, moves them
+    # to the healthy nodes and returns the ones it couldn't move
+    reroute = None
+
+    def __init__(self, maxsize: int=0, max_bytes: int=0, overflow: str=DROP_OLDEST, block_timeout: float=1.0,
+                 sample_every: int=SAMPLE_EVERY, item_size=estimate_size, clock=time.monotonic):
+        assert overflow in self.OVERFLOW_POLICIES, 'Unsupported queue overflow policy: %s' % overflow
+        self.maxsize = maxsize
+        self.max_bytes = max_bytes
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.sample_every = max(1, sample_every)
+        self.item_size = item_size
+        self.overflow_counter = OverflowCounter(overflow, self.LOG_INTERVAL, clock)
+
+        self._items = deque()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._not_empty = threading.Condition(self._lock)
+        self._not_full = threading.Condition(self._lock)
+        self._getters = 0
+        self._putters = 0
+        self._sampled = 0
+        self._clock = clock
+
+    @property
+    def overflowed(self) -> int:
+        return self.overflow_counter.overflowed
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def qsize(self) -> int:
+        return len(self._items)
+
+    def empty(self) -> bool:
+        return not self._items
+
+    def full(self) -> bool:
+        with self._lock:
+            return not self._fits(0)
+
+    def _size(self, item) -> int:
+        return self.item_size(item) if self.max_bytes and item is not StopIteration else 0
+
+    def _fits(self, size: int) -> bool:
+        items = len(self._items)
+        # a single item larger than max_bytes still goes into an empty queue
+        return (not self.maxsize or items < self.maxsize) and (
+            not self.max_bytes or not items or self._bytes + size <= self.max_bytes)
+
+    def _append(self, item, size: int):
+        self._items.append(item)
+        self._bytes += size
+        if self._getters:
+            self._not_empty.notify()
+
+    def _popleft(self):
+        item = self._items.popleft()
+        if self.max_bytes:
+            self._bytes -= self._size(item)
+        if self._putters:
+            self._not_full.notify()
+        return item
+
+    def put(self, item, block: bool=True, timeout: float=None):
+        size = self._size(item)
+        with self._lock:
+            if not self._fits(size):
+                if not block:
+                    raise queue.Full
+                self._wait_for_room(size, timeout)
+                if not self._fits(size):
+                    raise queue.Full
+            self._append(item, size)
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def _wait_for_room(self, size: int, timeout: float=None):
+        deadline = None if timeout is None else self._clock() + timeout
+        self._putters += 1
+        try:
+            while not self._fits(size):
+                remaining = None if deadline is None else deadline - self._clock()
+                if remaining is not None and remaining <= 0:
+                    return
+                self._not_full.wait(remaining)
+        finally:
+            self._putters -= 1
+
+    def get(self, block: bool=True, timeout: float=None):
+        with self._lock:
+            if not self._items:
+                if not block:
+                    raise queue.Empty
+                deadline = None if timeout is None else self._clock() + timeout
+                self._getters += 1
+                try:
+                    while not self._items:
+                        remaining = None if deadline is None else deadline - self._clock()
+                        if remaining is not None and remaining <= 0:
+                            raise queue.Empty
+                        self._not_empty.wait(remaining)
+                finally:
+                    self._getters -= 1
+            return self._popleft()
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def offer(self, item) -> tuple:
+        """Queue the item applying the overflow policy, return the dropped items (maybe the item itself)."""
+        with self._lock:
+            return self._offer(item)
+
+    def offer_many(self, items) -> tuple:
+        """Queue items as `offer` does, under one lock, return all the dropped items."""
+        dropped = []
+        with self._lock:
+            for item in items:
+                dropped.extend(self._offer(item))
+        return tuple(dropped)
+
+    def _offer(self, item) -> tuple:
+        size = self._size(item)
+        if self._fits(size):
+            self._append(item, size)
+            return ()
+
+        if self.overflow == self.BLOCK:
+            self._wait_for_room(size, self.block_timeout)
+            dropped = () if self._fits(size) else (item, )
+        elif self.overflow == self.DROP_OLDEST:
+            dropped = self._make_room(item, size)
+        elif self.overflow == self.SAMPLE:
+            self._sampled += 1
+            dropped = self._make_room(item, size) if self._sampled % self.sample_every == 0 else (item, )
+        else:
+            dropped = (item, )
+
+        if not dropped or dropped[-1] is not item:
+            self._append(item, size)
+        if dropped:
+            # counted under the lock, a warning is logged once per LOG_INTERVAL at most
+            self.overflow_counter.add(points_count(dropped))
+        return dropped
+
+    def _make_room(self, item, size: int) -> tuple:
+        dropped = []
+        while not self._fits(size):
+            if self._items[0] is StopIteration:
+                # close markers are never dropped, the new item is
+                dropped.append(item)
+                break
+            dropped.append(self._popleft())
+        return tuple(dropped)
+
+    def stats(self) -> dict:
+        return {
+            'size': len(self._items),
+            'maxsize': self.maxsize,
+            'bytes': self._bytes,
+            'max_bytes': self.max_bytes,
+            'overflow': self.overflow,
+            'overflowed': self.overflowed,
+        }
+
+
+class ShardedQueue:
+    """Set of queues where all metrics of one series always land in the same shard.
+
+    Each push thread drains its own shard, so points of a series are sent in order
+    even when several push threads work in parallel. Limits are split evenly between
+    shards, other `MetricsQueue` arguments apply to each shard.
+    """
+
+    def __init__(self, shards_count: int, maxsize: int=0, key=series_key, max_bytes: int=0, **queue_kwargs):
+        shard_maxsize = -(-maxsize // shards_count) if maxsize > 0 else 0
+        shard_max_bytes = -(-max_bytes // shards_count) if max_bytes > 0 else 0
+        self.shards = [MetricsQueue(shard_maxsize, shard_max_bytes, **queue_kwargs) for _ in range(shards_count)]
+        self.key = key
+
+    def shard_for(self, item) -> MetricsQueue:
+        return self.shards[stable_hash(self.key(item)) % len(self.shards)]
+
+    def put(self, item, block=True, timeout=None):
+        if item is StopIteration:
+            for shard in self.shards:
+                shard.put(item, block, timeout)
+        else:
+            self.shard_for(item).put(item, block, timeout)
+
+    def put_nowait(self, item):
+        self.put(item, False)
+
+    def offer(self, item) -> tuple:
+        return self.shard_for(item).offer(item)
+
+    def offer_many(self, items) -> tuple:
+        by_shard = {}
+        for item in items:
+            shard = self.shard_for(item)
+            by_shard.setdefault(id(shard), (shard, []))[1].append(item)
+        dropped = ()
+        for shard, shard_items in by_shard.values():
+            dropped += shard.offer_many(shard_items)
+        return dropped
+
+    def qsize(self) -> int:
+        return sum(shard.qsize() for shard in self.shards)
+
+    def empty(self) -> bool:
+        return all(shard.empty() for shard in self.shards)
+
+    @property
+    def overflowed(self) -> int:
+        return sum(shard.overflowed for shard in self.shards)
@@ -0,0 +1,333 @@
+from contextlib import contextmanager
+from logging import getLogger
+import json
+import mmap
+import os
+import struct
+import threading
+import weakref
+
+try:
+    import fcntl
+except ImportError:  # Windows, there is no fork either
+    fcntl = None
+
+from opentsdb.datapoint import DataPoint, Series
+from opentsdb.exceptions import ValidationError
+
+logger = getLogger('opentsdb-py')
+
+
+class MmapValues:
+    """Series values of one process in a memory mapped file.
+
+    Layout: 8 bytes of used size, then entries of key length (4 bytes), utf-8 key
+    padded to 8 bytes and value + timestamp (2 doubles). Entries are only appended
+    and the used size is updated after the entry is written, so a reader in another
+    process never sees a half written entry. There must be one writer per file.
+    """
+
+    HEADER = struct.Struct('<Q')
+    KEY_LENGTH = struct.Struct('<I')
+    VALUE = struct.Struct('<dd')
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path: str, initial_size: int=INITIAL_SIZE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._file = open(path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < self.HEADER.size:
+            self._file.truncate(max(initial_size, self.HEADER.size))
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+        self._used = max(self.HEADER.unpack_from(self._mmap, 0)[0], self.HEADER.size)
+        self._positions = {key: position for key, position, _, _ in self.read_entries(self._mmap)}
+
+    @classmethod
+    def read_entries(cls, data):
+        """Yield (key, value position, value, timestamp) of all entries in file data."""
+        used = cls.HEADER.unpack_from(data, 0)[0] if len(data) >= cls.HEADER.size else 0
+        position = cls.HEADER.size
+        while position < used:
+            key_length = cls.KEY_LENGTH.unpack_from(data, position)[0]
+            key_end = position + cls.KEY_LENGTH.size + key_length
+            key = bytes(data[position + cls.KEY_LENGTH.size:key_end]).decode('utf-8')
+            value_position = key_end + (-key_end % 8)
+            value, timestamp = cls.VALUE.unpack_from(data, value_position)
+            yield key, value_position, value, timestamp
+            position = value_position + cls.VALUE.size
+
+    @classmethod
+    def read_file(cls, path: str):
+        with open(path, 'rb') as values_file:
+            return list(cls.read_entries(values_file.read()))
+
+    def set(self, key: str, value: float, timestamp: float):
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._append(key)
+            self.VALUE.pack_into(self._mmap, position, value, timestamp)
+
+    def add(self, key: str, value: float, timestamp: float):
+        """Add to the value of the key, the timestamp is the latest one."""
+        with self._lock:
+            position = self._positions.get(key)
+            if position is None:
+                position = self._append(key)
+            current, current_timestamp = self.VALUE.unpack_from(self._mmap, position)
+            self.VALUE.pack_into(self._mmap, position, current + value, max(timestamp, current_timestamp))
+
+    def _append(self, key: str) -> int:
+        encoded = key.encode('utf-8')
+        key_end = self._used + self.KEY_LENGTH.size + len(encoded)
+        position = key_end + (-key_end % 8)
+        end = position + self.VALUE.size
+        if end > len(self._mmap):
+            self._grow(end)
+
+        self.KEY_LENGTH.pack_into(self._mmap, self._used, len(encoded))
+        self._mmap[self._used + self.KEY_LENGTH.size:key_end] = encoded
+        self.VALUE.pack_into(self._mmap, position, 0.0, 0.0)
+        self.HEADER.pack_into(self._mmap, 0, end)
+
+        self._used = end
+        self._positions[key] = position
+        return position
+
+    def _grow(self, required: int):
+        size = len(self._mmap)
+        while size < required:
+            size *= 2
+        self._mmap.close()
+        self._file.truncate(size)
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+    def close(self):
+        with self._lock:
+            self._mmap.close()
+            self._file.close()
+
+
+class MultiprocessAggregator(threading.Thread):
+    """Aggregate metrics of all processes of a pre-fork server and send them from one of them.
+
+    Each process writes the latest value of its series into its own mmap file in
+    `directory`. Every `interval` the process holding the exporter lock reads all
+    files, combines values of a series by its mode and pushes series updated since
+    the previous export: 'total' (counters, each process keeps its own total, totals
+    of exited processes are kept, see `mark_process_dead`), 'sum', 'max', 'min' or
+    'last' (the most recently updated value, default) of the live processes.
+    """
+
+    MODES = ('total', 'sum', 'max', 'min', 'last')
+    FILE_SUFFIX = '.db'
+    LOCK_FILE = 'exporter.lock'
+    # totals of exited processes
+    DEAD_FILE = 'tsdb_dead.db'
+    # held shared while files are read and exclusively while a dead process file is folded
+    FILES_LOCK_FILE = 'files.lock'
+
+    def __init__(self, directory: str, push_metric, interval, close_client, modes: dict=None):
+        super().__init__()
+        self.directory = directory
+        self.push_metric = push_metric
+        self.interval = interval
+        self.close_client_flag = close_client
+        self.modes = modes if modes is not None else {}
+
+        os.makedirs(directory, exist_ok=True)
+        self._values = MmapValues(self._process_path())
+        self._lock_file = None
+        self._series = {}
+        self._exported = {}
+        self._export_lock = threading.Lock()
+
+    def _process_path(self) -> str:
+        return os.path.join(self.directory, 'tsdb_%d%s' % (os.getpid(), self.FILE_SUFFIX))
+
+    def add(self, point: DataPoint):
+        mode = self.modes.get(point.series.metric, 'last')
+        try:
+            value = float(point.value)
+        except ValueError:
+            raise ValidationError("Metric not valid: multiprocess mode needs numeric values, got %r" % point.value)
+
+        key = json.dumps([point.series.metric, point.series.tags, mode], sort_keys=True)
+        self._values.set(key, value, point.timestamp)
+
+    def is_exporter(self) -> bool:
+        """Take the exporter lock if no other process holds it."""
+        if self._lock_file is not None:
+            return True
+        if fcntl is None:
+            return True
+
+        lock_file = open(os.path.join(self.directory, self.LOCK_FILE), 'a')
+        try:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+
+        logger.info("Process %d exports multiprocess metrics from %s", os.getpid(), self.directory)
+        self._lock_file = lock_file
+        return True
+
+    def collect(self) -> dict:
+        """Combine values of all process files into {key: (value, timestamp)}."""
+        combined = {}
+        with _files_lock(self.directory, exclusive=False):
+            names = [name for name in os.listdir(self.directory) if name.endswith(self.FILE_SUFFIX)]
+            for name in names:
+                try:
+                    entries = MmapValues.read_file(os.path.join(self.directory, name))
+                except (OSError, struct.error, UnicodeDecodeError) as error:
+                    logger.warning("Skip multiprocess values file %s: %s", name, error)
+                    continue
+
+                for key, _, value, timestamp in entries:
+                    if not timestamp:
+                        continue
+                    current = combined.get(key)
+                    combined[key] = (value, timestamp) if current is None else self._combine(
+                        key, current, value, timestamp)
+        return combined
+
+    def _combine(self, key, current, value, timestamp):
+        current_value, current_timestamp = current
+        mode = self._parse_key(key)[1]
+        if mode == 'sum' or mode == 'total':
+            value = current_value + value
+        elif mode == 'max':
+            value = max(current_value, value)
+        elif mode == 'min':
+            value = min(current_value, value)
+        elif timestamp < current_timestamp:
+            value = current_value
+        return value, max(timestamp, current_timestamp)
+
+    def flush(self) -> int:
+        """Push series updated since the last export, only in the exporter process."""
+        if not self.is_exporter():
+            return 0
+
+        with self._export_lock:
+            exported = 0
+            for key, (value, timestamp) in self.collect().items():
+                if self._exported.get(key) == (value, timestamp):
+                    continue
+                self._exported[key] = (value, timestamp)
+                self.push_metric(DataPoint(self._parse_key(key)[0], int(timestamp), value))
+                exported += 1
+
+        if exported:
+            logger.debug("Exported %d multiprocess series", exported)
+        return exported
+
+    def _parse_key(self, key: str):
+        parsed = self._series.get(key)
+        if parsed is None:
+            metric, tags, mode = json.loads(key)
+            parsed = self._series[key] = (Series(metric, tags), mode)
+        return parsed
+
+    def after_fork(self):
+        """Release what a forked child inherited, the child creates its own aggregator."""
+        if self._lock_file is not None:
+            # closing the inherited descriptor doesn't release the parent's lock, unlocking would
+            self._lock_file.close()
+            self._lock_file = None
+        self._values.close()
+
+    def run(self):
+        while not self.close_client_flag.wait(self.interval):
+            try:
+                self.flush()
+            except Exception as error:
+                logger.exception(error)
+
+
+@contextmanager
+def _files_lock(directory: str, exclusive: bool):
+    if fcntl is None:
+        yield
+        return
+    with open(os.path.join(directory, MultiprocessAggregator.FILES_LOCK_FILE), 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        yield
+
+
+def mark_process_dead(pid: int, directory: str=None) -> int:
+    """Remove the values file of an exited process from `directory` (TSDB_MULTIPROCESS_DIR by default).
+
+    Call it when a worker exits, e.g. from the gunicorn `child_exit` hook. Counter totals
+    ('total' mode) of the process are kept in the dead processes file, so the combined
+    counters don't go down, values of other modes are dropped. Returns the number of kept totals.
+    """
+    directory = directory or os.environ['TSDB_MULTIPROCESS_DIR']
+    path = os.path.join(directory, 'tsdb_%d%s' % (pid, MultiprocessAggregator.FILE_SUFFIX))
+    with _files_lock(directory, exclusive=True):
+        try:
+            entries = MmapValues.read_file(path)
+        except FileNotFoundError:
+            return 0
+
+        totals = [(key, value, timestamp) for key, _, value, timestamp in entries
+                  if timestamp and json.loads(key)[2] == 'total']
+        if totals:
+            dead_values = MmapValues(os.path.join(directory, MultiprocessAggregator.DEAD_FILE))
+            try:
+                for key, value, timestamp in totals:
+                    dead_values.add(key, value, timestamp)
+            finally:
+                dead_values.close()
+        os.remove(path)
+
+    logger.info("Multiprocess values of dead process %d removed, %d totals kept", pid, len(totals))
+    return len(totals)
+
+
+_fork_clients = weakref.WeakSet()
+_fork_handler_registered = False
+# clients rebuilt in a forked child, started by its first send or metric update
+pending_clients = []
+_start_lock = threading.RLock()
+
+
+def _after_fork_in_child():
+    global _start_lock
+    _start_lock = threading.RLock()
+    del pending_clients[:]
+    for client in list(_fork_clients):
+        try:
+            client._after_fork()
+        except Exception as error:
+            logger.exception("Restore TSDB client after fork failed: %s", error)
+            continue
+        if client._fork_pending:
+            pending_clients.append(client)
+
+
+def start_pending_clients():
+    """Start threads and connections of clients rebuilt after fork.
+
+    The at-fork handler only resets the state, so fork stays fast and never blocks on
+    network I/O, the first send or metric update in the child starts the client.
+    """
+    with _start_lock:
+        for client in list(pending_clients):
+            try:
+                client._start_after_fork()
+            except Exception as error:
+                logger.exception("Start TSDB client after fork failed: %s", error)
+        del pending_clients[:]
+
+
+def register_fork_handler(client):
+    """Call client._after_fork() in child processes, threads and connections don't survive fork."""
+    global _fork_handler_registered
+    if not _fork_handler_registered and hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=_after_fork_in_child)
+        _fork_handler_registered = True
+    _fork_clients.add(client)
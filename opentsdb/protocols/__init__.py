@@ -1,21 +1,58 @@
-from opentsdb.protocols.http_connect import HttpTSDBConnect
-from opentsdb.protocols.telnet_connect import TelnetTSDBConnect
-from opentsdb.push_thread import HTTPPushThread, TelnetPushThread
+from importlib import import_module
+
+from opentsdb.push_thread import HTTPPushThread, TelnetPushThread, PushThreadPool
+from opentsdb.metrics_queue import ShardedQueue
 from opentsdb.exceptions import UnknownTSDBConnectProtocol
 
-__all__ = ['HttpTSDBConnect', 'TelnetTSDBConnect', 'TSDBConnectProtocols']
+__all__ = ['HttpTSDBConnect', 'HttpClientTSDBConnect', 'TelnetTSDBConnect', 'AsyncHttpTSDBConnect',
+           'AsyncTelnetTSDBConnect', 'TSDBConnectProtocols']
+
+# connect classes are imported on first use, so that only the selected protocol
+# (and `requests` or `asyncio` only when needed) is loaded by `import opentsdb`
+_CONNECTS = {
+    'HttpTSDBConnect': 'opentsdb.protocols.http_connect',
+    'HttpClientTSDBConnect': 'opentsdb.protocols.http_client_connect',
+    'TelnetTSDBConnect': 'opentsdb.protocols.telnet_connect',
+    'AsyncHttpTSDBConnect': 'opentsdb.protocols.aio_connect',
+    'AsyncTelnetTSDBConnect': 'opentsdb.protocols.aio_connect',
+}
+
+
+def _connect_class(name: str):
+    return getattr(import_module(_CONNECTS[name]), name)
+
+
+def __getattr__(name: str):
+    if name in _CONNECTS:
+        return _connect_class(name)
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
 
 
 class TSDBConnectProtocols:
     HTTP = 'HTTP'
     TELNET = 'TELNET'
 
+    # HTTP transports
+    REQUESTS = 'requests'
+    HTTP_CLIENT = 'http.client'
+    HTTP_TRANSPORTS = (REQUESTS, HTTP_CLIENT)
+
     @classmethod
-    def get_connect(cls, protocol: str, *args, **kwargs):
+    def get_connect(cls, protocol: str, *args, http_transport: str=REQUESTS, **kwargs):
         if protocol == cls.HTTP:
-            return HttpTSDBConnect(*args, **kwargs)
+            if http_transport == cls.HTTP_CLIENT:
+                return _connect_class('HttpClientTSDBConnect')(*args, **kwargs)
+            return _connect_class('HttpTSDBConnect')(*args, **kwargs)
         elif protocol == cls.TELNET:
-            return TelnetTSDBConnect(*args, **kwargs)
+            return _connect_class('TelnetTSDBConnect')(*args, **kwargs)
+        raise UnknownTSDBConnectProtocol(protocol)
+
+    @classmethod
+    def get_async_connect(cls, protocol: str, *args, **kwargs):
+        if protocol == cls.HTTP:
+            return _connect_class('AsyncHttpTSDBConnect')(*args, **kwargs)
+        elif protocol == cls.TELNET:
+            return _connect_class('AsyncTelnetTSDBConnect')(*args, **kwargs)
         raise UnknownTSDBConnectProtocol(protocol)
 
     @classmethod
@@ -25,3 +62,12 @@ class TSDBConnectProtocols:
         elif protocol == cls.TELNET:
             return TelnetPushThread(*args, **kwargs)
         raise UnknownTSDBConnectProtocol(protocol)
+
+    @classmethod
+    def get_push_thread_pool(cls, protocol, connects, metrics_queue, *args, **kwargs):
+        # connects are grouped by queue shard: one shard per push thread or per node with its push threads
+        queues = metrics_queue.shards if isinstance(metrics_queue, ShardedQueue) else [metrics_queue]
+        per_queue = max(1, len(connects) // len(queues))
+        threads = [cls.get_push_thread(protocol, connect, queues[index // per_queue], *args, **kwargs)
+                   for index, connect in enumerate(connects)]
+        return PushThreadPool(threads, metrics_queue)
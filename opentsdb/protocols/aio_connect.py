@@ -0,0 +1,165 @@
+import asyncio
+import logging
+from typing import Optional
+from urllib.parse import urlsplit
+
+from opentsdb.protocols.http_connect import HttpTSDBConnect
+from opentsdb.protocols.telnet_connect import TelnetTSDBConnect
+from opentsdb.exceptions import TSDBNotAlive
+
+logger = logging.getLogger('opentsdb-py')
+
+
+class AsyncHttpTSDBConnect(HttpTSDBConnect):
+    """HTTP/1.1 keep-alive connection to OpenTSDB on top of asyncio streams."""
+
+    def __init__(self, host: str, port: int, check_tsdb_alive: bool,
+                 compression: str, uri: Optional[str], **kwargs):
+        super().__init__(host, port, False, compression, uri, **kwargs)
+        self.check_tsdb_alive = check_tsdb_alive
+        self._reader = None
+
+        put_url = urlsplit(self.tsdb_urls.put)
+        self._ssl = put_url.scheme == 'https'
+        self._http_host = put_url.hostname
+        self._http_port = put_url.port or (443 if self._ssl else 80)
+        self._put_path = self._request_path(self.tsdb_urls.put)
+        self._version_path = self._request_path(self.tsdb_urls.version)
+
+    @property
+    def connect(self):
+        return self._connect
+
+    async def is_alive(self, timeout=3, raise_error=False) -> bool:
+        try:
+            status, _ = await asyncio.wait_for(self.request('GET', self._version_path), timeout)
+            if status != 200:
+                raise ConnectionError("Bad status code")
+            return True
+        except Exception as error:
+            if raise_error:
+                raise TSDBNotAlive(str(error))
+            return False
+
+    async def open(self):
+        if self._connect is None or self._connect.is_closing():
+            logger.debug("Connect to OpenTSDB: %s:%s", self._http_host, self._http_port)
+            self._reader, self._connect = await asyncio.open_connection(
+                self._http_host, self._http_port, ssl=self._ssl or None)
+            self.connections += 1
+        return self._connect
+
+    def disconnect(self):
+        super().disconnect()
+        self._reader = None
+
+    async def request(self, method: str, path: str, body: bytes=b'', headers: dict=None):
+        try:
+            writer = await self.open()
+            head = ['%s %s HTTP/1.1' % (method, path),
+                    'Host: %s:%d' % (self._http_host, self._http_port),
+                    'Connection: keep-alive',
+                    'Content-Length: %d' % len(body)]
+            head.extend('%s: %s' % item for item in (headers or {}).items())
+            writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+            await writer.drain()
+
+            status, response_headers, response_body = await self._read_response()
+        except BaseException:
+            self.disconnect()
+            raise
+
+        if response_headers.get('connection', '').lower() == 'close':
+            self.disconnect()
+        return status, response_body
+
+    async def _read_response(self):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("Connection closed by OpenTSDB")
+        status = int(status_line.split()[1])
+
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            body = await self._read_chunked()
+        elif 'content-length' in headers:
+            body = await self._reader.readexactly(int(headers['content-length']))
+        elif status == 204 or status < 200:
+            body = b''
+        else:
+            body = await self._reader.read()
+            headers['connection'] = 'close'
+        return status, headers, body
+
+    async def _read_chunked(self):
+        chunks = []
+        while True:
+            size = int((await self._reader.readline()).split(b';')[0], 16)
+            if size == 0:
+                await self._reader.readline()
+                return b''.join(chunks)
+            chunks.append(await self._reader.readexactly(size))
+            await self._reader.readline()
+
+    async def sendall(self, *metrics) -> dict:
+        data = self.encode(metrics)
+        headers = {'Content-Type': 'application/json'}
+        if self.compression:
+            headers['Content-Encoding'] = self.compression
+
+        status, body = await asyncio.wait_for(self.request('POST', self._put_path, data, headers), self.SEND_TIMEOUT)
+        self.bytes_sent += len(data)
+        return self.parse_put_response(status, body)
+
+
+class AsyncTelnetTSDBConnect(TelnetTSDBConnect):
+    """Telnet style `put` connection to OpenTSDB on top of asyncio streams."""
+
+    CONNECT_TIMEOUT = 2
+
+    def __init__(self, host: str, port: int, check_tsdb_alive: bool=False, **kwargs):
+        super().__init__(host, port, False, **kwargs)
+        self.check_tsdb_alive = check_tsdb_alive
+
+    @property
+    def connect(self):
+        return self._connect
+
+    async def is_alive(self, timeout=3, raise_error=False) -> bool:
+        try:
+            _, writer = await asyncio.wait_for(asyncio.open_connection(self.tsdb_host, self.tsdb_port), timeout)
+            writer.close()
+        except (OSError, asyncio.TimeoutError) as error:
+            if raise_error:
+                raise TSDBNotAlive(str(error))
+            return False
+        else:
+            return True
+
+    async def open(self):
+        if self._connect is None or self._connect.is_closing():
+            logger.debug("Connect to OpenTSDB: %s:%s", self.tsdb_host, self.tsdb_port)
+            _, self._connect = await asyncio.wait_for(
+                asyncio.open_connection(self.tsdb_host, self.tsdb_port), self.CONNECT_TIMEOUT)
+            self.connections += 1
+        return self._connect
+
+    async def sendall(self, *metrics):
+        try:
+            writer = await self.open()
+            for buffer in self.encode(metrics):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Send metrics:\n%s", buffer.decode('utf-8'))
+                writer.write(buffer)
+                await writer.drain()
+                self.bytes_sent += len(buffer)
+        except BaseException:
+            self.disconnect()
+            raise
@@ -0,0 +1,78 @@
+import json
+import math
+import zlib
+
+from opentsdb.datapoint import PointsChunk
+
+
+class JSONBatchEncoder:
+    """Encode a batch of data points into the /api/put JSON body.
+
+    The part of a point which depends only on the series (metric and tags) is serialized
+    once and cached on the series, so each point costs a timestamp and value formatting.
+    Text is fed to the compressor in chunks instead of building the whole body first.
+    `dumps` may be replaced by a faster JSON backend returning str or bytes.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, compression: str=None, compression_level: int=6, dumps=json.dumps):
+        assert compression in ['gzip', None], 'Unsupported HTTP compression type: %s' % compression
+        self.compression = compression
+        self.compression_level = compression_level
+        self.dumps = dumps
+        # wbits=31 makes zlib write gzip header and trailer, the prototype is copied per batch
+        self._compressor = zlib.compressobj(compression_level, zlib.DEFLATED, 31) if compression else None
+
+    def _dumps(self, obj) -> str:
+        result = self.dumps(obj)
+        return result.decode('utf-8') if isinstance(result, bytes) else result
+
+    def series_prefix(self, series) -> str:
+        prefix = series.json_prefix
+        if prefix is None:
+            prefix = series.json_prefix = '{"metric":%s,"tags":%s,"timestamp":' % (
+                self._dumps(series.metric), self._dumps(series.tags))
+        return prefix
+
+    def format_value(self, value) -> str:
+        value_type = type(value)
+        if value_type is int or (value_type is float and math.isfinite(value)):
+            return repr(value)
+        return self._dumps(value)
+
+    def format_values(self, values) -> list:
+        """`format_value` of many values, plain numbers are formatted in bulk."""
+        if all(type(value) is int or type(value) is float for value in values):
+            texts = list(map(repr, values))
+            # 'nan' and 'inf' are the only number reprs with 'n' and need JSON formatting
+            if not any('n' in text for text in texts):
+                return texts
+        return [self.format_value(value) for value in values]
+
+    def iter_text(self, points):
+        chunk, size = ['['], 1
+        separator = ''
+        for point in points:
+            if type(point) is PointsChunk:
+                text = separator + point.json_text(self)
+            else:
+                text = '%s%s%d,"value":%s}' % (
+                    separator, self.series_prefix(point.series), point.timestamp, self.format_value(point.value))
+            separator = ','
+            chunk.append(text)
+            size += len(text)
+            if size >= self.CHUNK_SIZE:
+                yield ''.join(chunk)
+                chunk, size = [], 0
+        chunk.append(']')
+        yield ''.join(chunk)
+
+    def encode(self, points) -> bytes:
+        if self._compressor is None:
+            return ''.join(self.iter_text(points)).encode('utf-8')
+
+        compressor = self._compressor.copy()
+        data = [compressor.compress(text.encode('utf-8')) for text in self.iter_text(points)]
+        data.append(compressor.flush())
+        return b''.join(data)
@@ -0,0 +1,88 @@
+import logging
+import socket
+from http.client import HTTPConnection, HTTPException, HTTPSConnection
+from typing import Optional
+from urllib.parse import urlsplit
+
+from opentsdb.protocols.http_connect import HttpTSDBConnect
+from opentsdb.exceptions import TransientError, TSDBNotAlive
+
+logger = logging.getLogger('opentsdb-py')
+
+
+class HttpClientTSDBConnect(HttpTSDBConnect):
+    """HTTP/1.1 keep-alive connection to OpenTSDB on top of the standard `http.client`.
+
+    Needs nothing but the standard library and imports much faster than `requests`.
+    The connection is reused for all sends, a request which fails on a reused
+    connection (closed by OpenTSDB while idle) is sent once more on a new one.
+    """
+
+    def __init__(self, host: str, port: int, check_tsdb_alive: bool,
+                 compression: str, uri: Optional[str], **kwargs):
+        super().__init__(host, port, False, compression, uri, **kwargs)
+        put_url = urlsplit(self.tsdb_urls.put)
+        self._ssl = put_url.scheme == 'https'
+        self._http_host = put_url.hostname
+        self._http_port = put_url.port or (443 if self._ssl else 80)
+        self._put_path = self._request_path(self.tsdb_urls.put)
+        self._version_path = self._request_path(self.tsdb_urls.version)
+        self._put_headers = {'Content-Type': 'application/json'}
+        if self.compression:
+            self._put_headers['Content-Encoding'] = self.compression
+
+        if check_tsdb_alive:
+            self.is_alive(raise_error=True)
+
+    def is_alive(self, timeout=3, raise_error=False) -> bool:
+        # a connection of its own, is_alive is called by other threads than the one sending
+        connection = self._new_connection(timeout)
+        try:
+            connection.request('GET', self._version_path)
+            if connection.getresponse().status != 200:
+                raise ConnectionError("Bad status code")
+            return True
+        except Exception as error:
+            if raise_error:
+                raise TSDBNotAlive(str(error))
+            return False
+        finally:
+            connection.close()
+
+    def _new_connection(self, timeout: float) -> HTTPConnection:
+        connection_class = HTTPSConnection if self._ssl else HTTPConnection
+        return connection_class(self._http_host, self._http_port, timeout=timeout)
+
+    @property
+    def connect(self) -> HTTPConnection:
+        if not self._connect:
+            self._connect = self._new_connection(self.SEND_TIMEOUT)
+        return self._connect
+
+    def request(self, method: str, path: str, body: bytes=None, headers: dict=None) -> tuple:
+        while True:
+            connection = self.connect
+            reused = connection.sock is not None
+            if not reused:
+                self.connections += 1
+            try:
+                connection.request(method, path, body, headers or {})
+                response = connection.getresponse()
+                return response.status, response.read()
+            except (HTTPException, OSError) as error:
+                connection.close()
+                self._connect = None
+                if not reused or isinstance(error, socket.timeout):
+                    if isinstance(error, OSError):
+                        raise
+                    # a broken response (BadStatusLine, IncompleteRead, ...) is retried like a network error
+                    raise TransientError("Broken HTTP response: %r" % error) from error
+                logger.debug("Keep-alive connection was closed, reconnecting: %s", error)
+
+    def sendall(self, *metrics) -> dict:
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Send metrics:\n %s", '\n'.join(str(m) for m in metrics))
+        data = self.encode(metrics)
+        status, body = self.request('POST', self._put_path, data, self._put_headers)
+        self.bytes_sent += len(data)
+        return self.parse_put_response(status, body)
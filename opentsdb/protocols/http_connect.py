@@ -1,12 +1,13 @@
 import logging
 import json
-import gzip
+import time
 from typing import Optional
+from urllib.parse import urlsplit
 
-from requests import Session
-
+from opentsdb.protocols.encoders import JSONBatchEncoder
 from opentsdb.protocols.tsdb_connect import TSDBConnect
-from opentsdb.exceptions import TSDBNotAlive
+from opentsdb.exceptions import RejectedError, TransientError, TSDBNotAlive
+from opentsdb.retry import TRANSIENT_STATUS_CODES
 
 logger = logging.getLogger('opentsdb-py')
 
@@ -14,10 +15,14 @@ logger = logging.getLogger('opentsdb-py')
 class TSDBUrls:
     VERSION_ENDPOINT = '/api/version'
     PUT_ENDPOINT = '/api/put?details=true'
+    QUERY_ENDPOINT = '/api/query'
+    QUERY_LAST_ENDPOINT = '/api/query/last'
 
     def __init__(self, base_url):
         self.version = base_url + self.VERSION_ENDPOINT
         self.put = base_url + self.PUT_ENDPOINT
+        self.query = base_url + self.QUERY_ENDPOINT
+        self.query_last = base_url + self.QUERY_LAST_ENDPOINT
 
     @classmethod
     def from_host_and_port(cls, host, port):
@@ -30,18 +35,22 @@ class TSDBUrls:
 
 
 class HttpTSDBConnect(TSDBConnect):
+    """Connection to OpenTSDB HTTP API through a `requests` session (imported on first use)."""
 
     SEND_TIMEOUT = 2
+    COMPRESSION_LEVEL = 6
 
     def __init__(self, host: str, port: int, check_tsdb_alive: bool,
-                 compression: str, uri: Optional[str]):
+                 compression: str, uri: Optional[str], compression_level: int=COMPRESSION_LEVEL,
+                 encoder: Optional[JSONBatchEncoder]=None, **kwargs):
         if uri is None:
             self.tsdb_urls = TSDBUrls.from_host_and_port(host, int(port))
         else:
             self.tsdb_urls = TSDBUrls.from_uri(uri)
-        super().__init__(host, port, check_tsdb_alive)
         self.compression = compression
         assert self.compression in ['gzip', None], 'Unsupported HTTP compression type: %s' % self.compression
+        self.encoder = encoder or JSONBatchEncoder(compression, compression_level)
+        super().__init__(host, port, check_tsdb_alive)
         if self.compression:
             logger.info("Compression %s is enabled", self.compression)
 
@@ -56,18 +65,46 @@ class HttpTSDBConnect(TSDBConnect):
                 raise TSDBNotAlive(str(error))
             return False
 
+    @staticmethod
+    def _request_path(url):
+        parts = urlsplit(url)
+        return (parts.path or '/') + ('?' + parts.query if parts.query else '')
+
     @property
-    def connect(self) -> Session:
+    def connect(self):
         if not self._connect:
+            from requests import Session
             self._connect = Session()
+            self.connections += 1
             if self.compression:
                 self._connect.headers.update({'Content-Encoding': self.compression})
         return self._connect
 
+    def encode(self, metrics) -> bytes:
+        started = time.perf_counter()
+        data = self.encoder.encode(metrics)
+        self.encode_seconds += time.perf_counter() - started
+        return data
+
     def sendall(self, *metrics) -> dict:
-        logger.debug("Send metrics:\n %s", '\n'.join(str(m) for m in metrics))
-        response = self.connect.post(
-            self.tsdb_urls.put,
-            data=gzip.compress(json.dumps(metrics).encode()) if self.compression else json.dumps(metrics),
-            timeout=self.SEND_TIMEOUT)
-        return response.json()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Send metrics:\n %s", '\n'.join(str(m) for m in metrics))
+        data = self.encode(metrics)
+        response = self.connect.post(self.tsdb_urls.put, data=data, timeout=self.SEND_TIMEOUT)
+        self.bytes_sent += len(data)
+        return self.parse_put_response(response.status_code, response.content)
+
+    @staticmethod
+    def parse_put_response(status_code: int, body: bytes) -> dict:
+        if status_code >= 500 or status_code in TRANSIENT_STATUS_CODES:
+            raise TransientError("OpenTSDB responded with status code %d" % status_code)
+        try:
+            result = json.loads(body.decode('utf-8')) if body else {}
+        except ValueError:
+            if 200 <= status_code < 300:
+                raise TransientError("Unexpected OpenTSDB response with status code %d" % status_code)
+            result = {}
+        # 400 with details of rejected points is a normal result, other client errors reject the whole batch
+        if not 200 <= status_code < 300 and not ('success' in result or 'failed' in result):
+            raise RejectedError("OpenTSDB rejected the request with status code %d" % status_code)
+        return result
@@ -2,6 +2,7 @@ import logging
 import socket
 import time
 
+from opentsdb.datapoint import PointsChunk
 from opentsdb.protocols.tsdb_connect import TSDBConnect
 from opentsdb.exceptions import TSDBNotAlive
 
@@ -10,6 +11,13 @@ logger = logging.getLogger('opentsdb-py')
 
 class TelnetTSDBConnect(TSDBConnect):
 
+    MAX_WRITE_BYTES = 64 * 1024
+
+    def __init__(self, host: str, port: int, check_tsdb_alive: bool=False,
+                 max_write_bytes: int=MAX_WRITE_BYTES, **kwargs):
+        super().__init__(host, port, check_tsdb_alive)
+        self.max_write_bytes = max_write_bytes
+
     def is_alive(self, timeout=3, raise_error=False) -> bool:
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
@@ -39,17 +47,46 @@ class TelnetTSDBConnect(TSDBConnect):
                 self._connect = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
                 self._connect.settimeout(timeout)
                 self._connect.connect((self.tsdb_host, self.tsdb_port))
+                self.connections += 1
                 return
             except (ConnectionRefusedError, socket.timeout):
                 time.sleep(min(15, 2 ** attempt))
                 attempt += 1
 
-    def sendall(self, metric: dict):
+    @staticmethod
+    def format_metric(point) -> bytes:
+        if type(point) is PointsChunk:
+            return point.telnet_text().encode('utf-8')
+        return (point.series.telnet_format % (point.timestamp, point.value)).encode('utf-8')
+
+    def iter_buffers(self, metrics):
+        """Pack put lines into buffers of at most max_write_bytes (a single longer line is kept whole)."""
+        buffer, size = [], 0
+        for metric in metrics:
+            line = self.format_metric(metric)
+            if buffer and size + len(line) > self.max_write_bytes:
+                yield b''.join(buffer)
+                buffer, size = [], 0
+            buffer.append(line)
+            size += len(line)
+
+        if buffer:
+            yield b''.join(buffer)
+
+    def encode(self, metrics) -> list:
+        started = time.perf_counter()
+        buffers = list(self.iter_buffers(metrics))
+        self.encode_seconds += time.perf_counter() - started
+        return buffers
+
+    def sendall(self, *metrics):
         try:
-            tags_string = ' '.join(['%s=%s' % (key, value) for key, value in metric['tags'].items()])
-            metric_str = "put %s %d %s %s\n" % (metric['metric'], metric['timestamp'], metric['value'], tags_string)
-            logger.debug("Send metric: %s", metric_str)
-            self.connect.sendall(metric_str.encode('utf-8'))
+            for buffer in self.encode(metrics):
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("Send metrics:\n%s", buffer.decode('utf-8'))
+                self.connect.sendall(buffer)
+                self.bytes_sent += len(buffer)
         except Exception:
-            self._connect.close()
+            if self._connect:
+                self._connect.close()
             raise
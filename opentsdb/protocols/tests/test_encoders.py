@@ -0,0 +1,47 @@
+import gzip
+import json
+
+from opentsdb.datapoint import DataPoint, Series
+from opentsdb.protocols.encoders import JSONBatchEncoder
+
+
+def _points():
+    series = Series('test', {'tag1': 'val1', 'tag2': 2})
+    return [DataPoint(series, 1, 1), DataPoint(series, 2, 2.5), DataPoint(series, 3, 'str"value'),
+            DataPoint(Series('test2', {'tag1': 'é'}), 4, float('nan'))]
+
+
+def _expected():
+    return json.loads(json.dumps([point.to_dict() for point in _points()]))
+
+
+def test_encode_plain():
+    data = JSONBatchEncoder().encode(_points()[:3])
+    assert json.loads(data.decode()) == _expected()[:3]
+
+
+def test_encode_not_finite_value_like_json():
+    data = JSONBatchEncoder().encode(_points()[3:])
+    assert data.endswith(b'"timestamp":4,"value":NaN}]')
+
+
+def test_encode_gzip():
+    data = JSONBatchEncoder('gzip', compression_level=1).encode(_points()[:3])
+    assert json.loads(gzip.decompress(data).decode()) == _expected()[:3]
+
+
+def test_encode_in_chunks():
+    encoder = JSONBatchEncoder('gzip')
+    encoder.CHUNK_SIZE = 100
+    points = _points()[:3] * 100
+    assert len(list(encoder.iter_text(points))) > 1
+    assert json.loads(gzip.decompress(encoder.encode(points)).decode()) == _expected()[:3] * 100
+
+
+def test_empty_batch():
+    assert JSONBatchEncoder().encode([]) == b'[]'
+
+
+def test_pluggable_dumps():
+    encoder = JSONBatchEncoder(dumps=lambda obj: json.dumps(obj, separators=(',', ':')).encode())
+    assert json.loads(encoder.encode(_points()[:1]).decode()) == _expected()[:1]
@@ -10,3 +10,9 @@ def test_from_host_port():
 def test_from_uri():
     url = TSDBUrls.from_uri('https://127.0.0.1:4242/opentsdb')
     assert url.version == 'https://127.0.0.1:4242/opentsdb' + TSDBUrls.VERSION_ENDPOINT
+
+
+def test_query_urls():
+    url = TSDBUrls.from_host_and_port('127.0.0.1', 4242)
+    assert url.query == 'http://127.0.0.1:4242/api/query'
+    assert url.query_last == 'http://127.0.0.1:4242/api/query/last'
@@ -0,0 +1,21 @@
+from opentsdb.datapoint import DataPoint, Series
+from opentsdb.protocols.telnet_connect import TelnetTSDBConnect
+
+
+def _metrics(count):
+    return [DataPoint(Series('test', {'tag1': 'val1'}), 1, i) for i in range(count)]
+
+
+def test_single_buffer():
+    connect = TelnetTSDBConnect('127.0.0.1', 4242)
+    buffers = list(connect.iter_buffers(_metrics(3)))
+    assert len(buffers) == 1
+    assert buffers[0].splitlines() == [
+        b'put test 1 0 tag1=val1', b'put test 1 1 tag1=val1', b'put test 1 2 tag1=val1']
+
+
+def test_max_write_bytes():
+    line_length = len(TelnetTSDBConnect.format_metric(_metrics(1)[0]))
+    connect = TelnetTSDBConnect('127.0.0.1', 4242, max_write_bytes=line_length * 2)
+    buffers = list(connect.iter_buffers(_metrics(5)))
+    assert [len(buffer) // line_length for buffer in buffers] == [2, 2, 1]
@@ -10,6 +10,9 @@ class TSDBConnect:
         self.tsdb_host = host
         self.tsdb_port = int(port)
         self._connect = None
+        self.bytes_sent = 0
+        self.encode_seconds = 0.0
+        self.connections = 0
 
         if check_tsdb_alive:
             self.is_alive(raise_error=True)
@@ -30,5 +33,5 @@ class TSDBConnect:
             self._connect.close()
         self._connect = None
 
-    def sendall(self, metric: dict):
+    def sendall(self, *metrics):
         raise NotImplementedError()
@@ -1,8 +1,15 @@
 from logging import getLogger
 from queue import Empty
+import heapq
+import itertools
 import threading
-import random
 import time
+from typing import Optional
+
+from opentsdb.batcher import AdaptiveBatchSize, Batcher
+from opentsdb.datapoint import iter_points, points_count, report_sent
+from opentsdb.metrics_queue import ShardedQueue
+from opentsdb.retry import Backoff, CircuitBreaker, is_transient_error, split_rejected
 
 logger = getLogger('opentsdb-py')
 
@@ -10,31 +17,58 @@ logger = getLogger('opentsdb-py')
 class PushThread(threading.Thread):
 
     WAIT_NEXT_METRIC_TIMEOUT = 3
+    MAX_RETRIES = 5
 
     def __init__(self, tsdb_connect, metrics_queue, close_client,
-                 send_metrics_limit, send_metrics_batch_limit, statuses):
+                 rate_limiter, send_metrics_batch_limit, telemetry, spool=None,
+                 max_retries=MAX_RETRIES, circuit_breaker_threshold=5, circuit_breaker_timeout=30,
+                 send_batch_max_bytes=0, send_batch_linger=0, send_batch_target_latency=0):
         super().__init__()
         self.tsdb_connect = tsdb_connect
         self.metrics_queue = metrics_queue
         self.close_client_flag = close_client
-        self.send_metrics_limit = send_metrics_limit
+        self.rate_limiter = rate_limiter
         self.send_metrics_batch_limit = send_metrics_batch_limit
-        self.statuses = statuses
+        self.telemetry = telemetry
+        self.statuses = telemetry.statuses
+        self.spool = spool
+        self.max_retries = max_retries
+        self.backoff = Backoff()
+        self.circuit_breaker = CircuitBreaker(circuit_breaker_threshold, circuit_breaker_timeout)
+
+        adaptive = None
+        if send_batch_target_latency > 0:
+            adaptive = AdaptiveBatchSize(send_metrics_batch_limit, send_batch_target_latency)
+        self.batcher = Batcher(metrics_queue, send_metrics_batch_limit, send_batch_max_bytes,
+                               send_batch_linger, adaptive)
 
-        self._retry_send_metrics = None
+        self._retries = []
+        self._retries_sequence = itertools.count()
 
     def run(self):
         while not self._is_done():
-            start_time = time.time()
-
             try:
-                if self._retry_send_metrics:
-                    data = self._retry_send_metrics
-                    self._retry_send_metrics = None
-                else:
-                    data = self._next(self.WAIT_NEXT_METRIC_TIMEOUT)
+                wait_time = self.circuit_breaker.wait_time()
+                if wait_time > 0:
+                    self.tsdb_connect.stopped.wait(min(wait_time, self.WAIT_NEXT_METRIC_TIMEOUT))
+                    continue
 
-                self.send(data)
+                if self._retries and self._reroute() is not None:
+                    self._reroute_retries()
+                data, attempt = self._next_retry()
+                if data is not None:
+                    self._send_limited(data, attempt)
+                    continue
+
+                data = self.batcher.next_batch(self._next_wait_timeout())
+                points = points_count(data)
+                self.telemetry.observe('batch_size', points)
+                self.telemetry.observe_queue_depth(len(data) + self.metrics_queue.qsize())
+                latency = self._send_limited(data)
+                # chunks of send_many() are sized by the caller and a fast failure (e.g. connection
+                # refused) says nothing about the batch size, nothing to learn from them
+                if latency is not None and points == len(data):
+                    self.batcher.observe(len(data), latency)
             except StopIteration:
                 break
             except Empty:
@@ -42,84 +76,183 @@ class PushThread(threading.Thread):
             except Exception as error:
                 logger.exception(error)
 
-            if self.send_metrics_limit > 0:
-                self.__metrics_limit_timeout(start_time)
-
+        self._flush_retries()
         self.tsdb_connect.disconnect()
 
     def _is_done(self):
-        return self.tsdb_connect.stopped.is_set() or (self.close_client_flag.is_set() and self.metrics_queue.empty())
+        return self.tsdb_connect.stopped.is_set() or (
+            self.close_client_flag.is_set() and self.batcher.pending is None and self.metrics_queue.empty())
 
-    def _next(self, wait_timeout):
-        raise NotImplementedError()
+    def _next_retry(self):
+        if self._retries and self._retries[0][0] <= time.monotonic():
+            _, _, attempt, data = heapq.heappop(self._retries)
+            return data, attempt
+        return None, 0
 
-    def send(self, data):
-        raise NotImplementedError()
+    def _reroute(self):
+        # set while the node of the queue is ejected from routing
+        return getattr(self.metrics_queue, 'reroute', None)
 
-    def __metrics_limit_timeout(self, start_time):
-        pass
+    def _reroute_retries(self):
+        """Move postponed metrics of an ejected node to the healthy nodes."""
+        reroute, retries, self._retries = self._reroute(), self._retries, []
+        for ready_at, sequence, attempt, data in retries:
+            kept = reroute(data)
+            if kept:
+                heapq.heappush(self._retries, (ready_at, sequence, attempt, kept))
 
-    def _update_statuses(self, success, failed):
-        self.statuses['success'] += success
-        self.statuses['failed'] += failed
+    def _next_wait_timeout(self):
+        if not self._retries:
+            return self.WAIT_NEXT_METRIC_TIMEOUT
+        return min(self.WAIT_NEXT_METRIC_TIMEOUT, max(0.0, self._retries[0][0] - time.monotonic()))
 
+    def _flush_retries(self):
+        """Last attempt to send postponed metrics when the thread stops."""
+        retries, self._retries = self._retries, []
+        for _, _, _, data in retries:
+            if self.circuit_breaker.wait_time() > 0 or self.tsdb_connect.stopped.is_set():
+                self._drop(data, "client is closed")
+            else:
+                self.send(data, self.max_retries)
 
-class HTTPPushThread(PushThread):
+    def _send_limited(self, data, attempt=0) -> Optional[float]:
+        """Send data within rate limits, return the send latency (without waiting for the limiter), None if failed.
 
-    def _next(self, wait_timeout):
-        total_metrics = self.metrics_queue.qsize()
-        iter_count = total_metrics if total_metrics <= self.send_metrics_batch_limit else self.send_metrics_batch_limit
-        metrics = []
-        if total_metrics:
-            for _ in range(iter_count):
-                metrics.append(self.metrics_queue.get_nowait())
+        Sent points and bytes are counted by the limiter even when it's unlimited.
+        """
+        self.rate_limiter.acquire_points(points_count(data))
+        connect = self.tsdb_connect
+        bytes_sent, encode_seconds, connections = connect.bytes_sent, connect.encode_seconds, connect.connections
+        started = time.monotonic()
+        sent = self.send(data, attempt)
+        latency = time.monotonic() - started
+
+        serialization = connect.encode_seconds - encode_seconds
+        self.telemetry.observe('serialization_seconds', serialization)
+        self.telemetry.observe('round_trip_seconds', max(0.0, latency - serialization))
+        if connections and connect.connections > connections:
+            self.telemetry.inc('reconnects', connect.connections - connections)
+        self.rate_limiter.acquire_bytes(connect.bytes_sent - bytes_sent)
+        return latency if sent else None
+
+    def send(self, data, attempt=0) -> bool:
+        """Send the batch, return True if OpenTSDB answered (some points may be rejected), False if it failed."""
+        raise NotImplementedError()
+
+    def _send_failed(self, data, attempt, error):
+        # errors of network / server side are retried, others (e.g. unserializable value) will not go away
+        if not is_transient_error(error):
+            self._drop(data, error)
+            return
+
+        self.circuit_breaker.record_failure()
+        self._retry(data, attempt)
+
+    def _retry(self, data, attempt):
+        reroute = self._reroute()
+        if reroute is not None:
+            data = reroute(data)
+            if not data:
+                return
+        if self.spool is not None:
+            logger.warning("Spool %d metrics to disk", points_count(data))
+            self.spool.append(iter_points(data))
+        elif 0 <= self.max_retries <= attempt:
+            self._drop(data, "retries limit is reached")
         else:
-            metrics.append(self.metrics_queue.get(block=True, timeout=wait_timeout))
+            ready_at = time.monotonic() + self.backoff.delay(attempt)
+            heapq.heappush(self._retries, (ready_at, next(self._retries_sequence), attempt + 1, data))
+            self.telemetry.inc('retried', points_count(data))
 
-        if StopIteration in metrics and len(metrics) == 1:
-            raise StopIteration
-        elif StopIteration in metrics:
-            metrics.remove(StopIteration)
-            self.metrics_queue.put(StopIteration)
-        return metrics
+    def _drop(self, data, reason):
+        count = points_count(data)
+        logger.error("Drop %d metrics: %s", count, reason)
+        self.telemetry.inc('dropped', count)
+
+    def _update_statuses(self, success, failed):
+        self.telemetry.inc('success', success)
+        self.telemetry.inc('failed', failed)
 
-    def send(self, data):
+
+class HTTPPushThread(PushThread):
+
+    def send(self, data, attempt=0) -> bool:
         try:
             result = self.tsdb_connect.sendall(*data)
         except Exception as error:
             logger.exception("Push metric failed: %s", error)
-            self._retry_send_metrics = data
-            time.sleep(1)
-        else:
-            failed = result.get('failed', 0)
-            self._update_statuses(result.get('success', 0), failed)
-            if failed:
-                logger.warning("Push metrics are failed %d/%d" % (failed, len(data)),
-                               extra={'errors': result.get('errors')})
+            self._send_failed(data, attempt, error)
+            return False
 
+        self.circuit_breaker.record_success()
+        failed = result.get('failed', 0)
+        self._update_statuses(result.get('success', 0), failed)
+        retried = None
+        if failed:
+            logger.warning("Push metrics are failed %d/%d" % (failed, points_count(data)),
+                           extra={'errors': result.get('errors')})
+            retried = self._retry_rejected(data, attempt, result.get('errors') or [])
+        report_sent(data, retried)
+        return True
 
-class TelnetPushThread(PushThread):
+    def _retry_rejected(self, data, attempt, errors) -> dict:
+        """Retry points rejected for transient reasons (per /api/put?details=true errors), drop invalid ones.
 
-    def _next(self, wait_timeout):
-        metric = self.metrics_queue.get(block=True, timeout=wait_timeout)
+        Points of a chunk are retried as a chunk with the same `on_sent`, return {id(chunk): retried points}.
+        """
+        transient, invalid, retried = split_rejected(data, errors)
+        if invalid:
+            self._drop(invalid, "rejected by OpenTSDB as invalid")
+        if transient:
+            self._retry(transient, attempt)
+        return retried
 
-        if metric is StopIteration:
-            raise metric
-        return metric
 
-    def __metrics_limit_timeout(self, start_time):
-        duration = time.time() - start_time
-        wait_time = (2.0 * random.random()) / self.send_metrics_limit
-        if wait_time > duration:
-            logger.debug("Wait for %s", wait_time - duration)
-            time.sleep(wait_time - duration)
+class TelnetPushThread(PushThread):
 
-    def send(self, data):
+    def send(self, data, attempt=0) -> bool:
         try:
-            self.tsdb_connect.sendall(data)
+            self.tsdb_connect.sendall(*data)
         except Exception as error:
             logger.exception("Push metric failed: %s", error)
-            self._retry_send_metrics = data
-            time.sleep(1)
-        else:
-            self._update_statuses(1, 0)
+            self._send_failed(data, attempt, error)
+            return False
+        self.circuit_breaker.record_success()
+        self._update_statuses(points_count(data), 0)
+        report_sent(data)
+        return True
+
+
+class PushThreadPool:
+    """Group of push threads, each with its own TSDB connection, draining the metrics queue in parallel."""
+
+    def __init__(self, threads, metrics_queue, daemon=True):
+        self.threads = list(threads)
+        self.metrics_queue = metrics_queue
+        self.daemon = daemon
+
+    @property
+    def connects(self):
+        return [thread.tsdb_connect for thread in self.threads]
+
+    def start(self):
+        for thread in self.threads:
+            thread.daemon = self.daemon
+            thread.start()
+
+    def is_alive(self) -> bool:
+        return any(thread.is_alive() for thread in self.threads)
+
+    def join(self, timeout=None):
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def stop(self, force=False):
+        # one stop marker per thread, a sharded queue puts the marker into every shard
+        shards = len(self.metrics_queue.shards) if isinstance(self.metrics_queue, ShardedQueue) else 1
+        for _ in range(max(1, len(self.threads) // shards)):
+            self.metrics_queue.put(StopIteration)
+
+        if force:
+            for connect in self.connects:
+                connect.stopped.set()
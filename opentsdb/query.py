@@ -0,0 +1,477 @@
+from array import array
+from collections import OrderedDict
+from logging import getLogger
+import bisect
+import codecs
+import json
+import math
+import re
+import threading
+import time
+from typing import Optional
+from urllib.parse import urlsplit
+
+from opentsdb.datapoint import DataPoint, Series
+from opentsdb.exceptions import QueryError
+from opentsdb.protocols import TSDBConnectProtocols
+from opentsdb.protocols.http_connect import TSDBUrls
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+logger = getLogger('opentsdb-py')
+
+TIME_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800, 'n': 2592000, 'y': 31536000}
+DURATION = re.compile(r'^(\d+)(ms|s|m|h|d|w|n|y)')
+
+
+def parse_duration(duration: str) -> Optional[float]:
+    """Seconds of an OpenTSDB duration ('1h', '15m-avg'), None if it has no fixed length (e.g. '0all-sum')."""
+    match = DURATION.match(duration)
+    if match is None:
+        return None
+    return int(match.group(1)) * TIME_UNITS[match.group(2)]
+
+
+def to_timestamp(value, now: float=None) -> int:
+    """Absolute timestamp in seconds of int/float seconds or relative '<duration>-ago' time."""
+    if isinstance(value, str):
+        if value.endswith('-ago') and parse_duration(value[:-4]) is not None:
+            return int((time.time() if now is None else now) - parse_duration(value[:-4]))
+        return int(value)
+    return int(value)
+
+
+class QuerySeries:
+    """Result series of a query: timestamps (int64) and values (float64) arrays.
+
+    The arrays are NumPy arrays when NumPy is installed, `array.array` otherwise.
+    """
+
+    __slots__ = ('metric', 'tags', 'aggregated_tags', 'timestamps', 'values')
+
+    def __init__(self, metric: str, tags: dict, aggregated_tags: list, timestamps, values):
+        self.metric = metric
+        self.tags = tags
+        self.aggregated_tags = aggregated_tags
+        self.timestamps = timestamps
+        self.values = values
+
+    @property
+    def key(self) -> tuple:
+        return tuple(sorted(self.tags.items()))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    def slice(self, start: int, end: int):
+        """Points with start <= timestamp <= end."""
+        if numpy is not None and isinstance(self.timestamps, numpy.ndarray):
+            left = numpy.searchsorted(self.timestamps, start, 'left')
+            right = numpy.searchsorted(self.timestamps, end, 'right')
+        else:
+            left = bisect.bisect_left(self.timestamps, start)
+            right = bisect.bisect_right(self.timestamps, end)
+        return QuerySeries(self.metric, self.tags, self.aggregated_tags,
+                           self.timestamps[left:right], self.values[left:right])
+
+    def __repr__(self):
+        return 'QuerySeries(%r, %r, %d points)' % (self.metric, self.tags, len(self))
+
+
+def _to_arrays(timestamps: array, values: array):
+    if numpy is None:
+        return timestamps, values
+    return numpy.frombuffer(timestamps, dtype=numpy.int64), numpy.frombuffer(values, dtype=numpy.float64)
+
+
+def _concat(first, second):
+    if numpy is not None and isinstance(first, numpy.ndarray):
+        return numpy.concatenate((first, second))
+    return first + second
+
+
+class QueryResponseParser:
+    """Incremental parser of the /api/query response.
+
+    Text is fed in chunks as it arrives. Series fields are decoded with json, the
+    data points (`"dps": {"<ts>": value, ...}` or `[[ts, value], ...]`) are scanned
+    straight into typed arrays, so no dict per series or string per timestamp is built.
+    """
+
+    WHITESPACE = re.compile(r'\s*')
+    KEY = re.compile(r'\s*("(?:[^"\\]|\\.)*")\s*:')
+    # dps formats: (entry, end of dps, separator after a complete entry)
+    MAP_DPS = (re.compile(r'"(-?\d+)"\s*:\s*([^,}\s]+)'), re.compile(r'}'), ',')
+    ARRAY_DPS = (re.compile(r'\[\s*(-?\d+)\s*,\s*([^\],\s]+)\s*\]'), re.compile(r'\]\s*\]'), '],')
+
+    def __init__(self):
+        self.results = []
+        self._buffer = ''
+        self._position = 0
+        self._state = self._start
+        self._decoder = json.JSONDecoder()
+        self._fields = None
+        self._key = None
+        self._dps_format = None
+        self._timestamps = None
+        self._values = None
+
+    def feed(self, text: str):
+        self._buffer = self._buffer[self._position:] + text
+        self._position = 0
+        while self._state is not None and self._state():
+            pass
+
+    def close(self) -> list:
+        if self._state is not None:
+            raise QueryError("Incomplete OpenTSDB query response")
+        return self.results
+
+    def _next_char(self) -> Optional[str]:
+        self._position = self.WHITESPACE.match(self._buffer, self._position).end()
+        return self._buffer[self._position] if self._position < len(self._buffer) else None
+
+    def _expect(self, char: str, expected: str):
+        raise QueryError("Unexpected %r in OpenTSDB query response, expected %s" % (char, expected))
+
+    # each state returns True when it made progress and parsing may continue
+
+    def _start(self) -> bool:
+        char = self._next_char()
+        if char is None:
+            return False
+        if char != '[':
+            self._expect(char, "'['")
+        self._position += 1
+        self._state = self._series_or_end
+        return True
+
+    def _series_or_end(self) -> bool:
+        char = self._next_char()
+        if char is None:
+            return False
+        if char == ']':
+            self._state = None
+        elif char == '{':
+            self._fields = {}
+            self._state = self._field
+        else:
+            self._expect(char, "series or ']'")
+        self._position += 1
+        return True
+
+    def _after_series(self) -> bool:
+        char = self._next_char()
+        if char is None:
+            return False
+        if char == ',':
+            self._state = self._series_or_end
+        elif char == ']':
+            self._state = None
+        else:
+            self._expect(char, "',' or ']'")
+        self._position += 1
+        return True
+
+    def _field(self) -> bool:
+        char = self._next_char()
+        if char is None:
+            return False
+        if char == ',':
+            self._position += 1
+            return True
+        if char == '}':
+            self._position += 1
+            self._finish_series()
+            self._state = self._after_series
+            return True
+
+        match = self.KEY.match(self._buffer, self._position)
+        if match is None:
+            if char != '"':
+                self._expect(char, "field name")
+            return False
+        self._key = json.loads(match.group(1))
+        self._position = match.end()
+        self._state = self._dps if self._key == 'dps' else self._field_value
+        return True
+
+    def _field_value(self) -> bool:
+        if self._next_char() is None:
+            return False
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._position)
+        except ValueError:
+            return False
+        # a number at the end of the buffer may continue in the next chunk
+        if self.WHITESPACE.match(self._buffer, end).end() >= len(self._buffer):
+            return False
+        self._fields[self._key] = value
+        self._position = end
+        self._state = self._field
+        return True
+
+    def _dps(self) -> bool:
+        char = self._next_char()
+        if char is None:
+            return False
+        if char == '{':
+            self._dps_format, closing = self.MAP_DPS, '}'
+        elif char == '[':
+            self._dps_format, closing = self.ARRAY_DPS, ']'
+        else:
+            self._expect(char, "dps")
+        self._timestamps, self._values = array('q'), array('d')
+        self._position += 1
+        self._state = self._dps_entries
+
+        if self._next_char() == closing:
+            self._position += 1
+            self._state = self._field
+        return True
+
+    def _dps_entries(self) -> bool:
+        """Scan all complete entries in the buffer at once, the tail waits for the next chunk."""
+        entry, end, separator = self._dps_format
+        buffer, position = self._buffer, self._position
+        closed = end.search(buffer, position)
+        if closed is not None:
+            region_end = next_position = closed.end()
+        else:
+            region_end = buffer.rfind(separator, position) + 1
+            next_position = region_end
+            if region_end <= position:
+                return False
+
+        entries = entry.findall(buffer, position, region_end)
+        self._timestamps.extend([int(timestamp) for timestamp, _ in entries])
+        self._values.extend([math.nan if value == 'null' else float(value) for _, value in entries])
+        self._position = next_position
+        if closed is not None:
+            self._state = self._field
+        return closed is not None
+
+    def _finish_series(self):
+        timestamps, values = _to_arrays(self._timestamps or array('q'), self._values or array('d'))
+        self.results.append(QuerySeries(self._fields.get('metric'), self._fields.get('tags') or {},
+                                        self._fields.get('aggregateTags') or [], timestamps, values))
+        self._timestamps = self._values = None
+
+
+class QueryCache:
+    """LRU of query results by query (without time range), each keeps the last fetched window."""
+
+    def __init__(self, maxsize: int=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.partial_hits = 0
+        self.misses = 0
+        self._windows = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            window = self._windows.get(key)
+            if window is not None:
+                self._windows.move_to_end(key)
+            return window
+
+    def count(self, counter: str):
+        """Increment 'hits', 'partial_hits' or 'misses'."""
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def put(self, key, start: int, end: int, series: list):
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._windows[key] = (start, end, series)
+            self._windows.move_to_end(key)
+            while len(self._windows) > self.maxsize:
+                self._windows.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._windows.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'size': len(self._windows), 'maxsize': self.maxsize,
+                    'hits': self.hits, 'partial_hits': self.partial_hits, 'misses': self.misses}
+
+
+# post() takes the body as `json` like requests does, which hides the module
+_dumps = json.dumps
+
+
+class _HttpClientResponse:
+    """The part of `requests.Response` used by QueryClient, over an `http.client` response."""
+
+    def __init__(self, connection, response):
+        self.status_code = response.status
+        self._connection = connection
+        self._response = response
+
+    def iter_content(self, chunk_size: int):
+        while True:
+            chunk = self._response.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def json(self):
+        return json.loads(self._response.read().decode('utf-8'))
+
+    def close(self):
+        self._connection.close()
+
+
+class _HttpClientSession:
+    """The part of `requests.Session` used by QueryClient, over `http.client` with a connection per query."""
+
+    def post(self, url: str, json: dict, timeout: float, stream: bool=False) -> _HttpClientResponse:
+        from http.client import HTTPConnection, HTTPSConnection
+
+        parts = urlsplit(url)
+        connection_class = HTTPSConnection if parts.scheme == 'https' else HTTPConnection
+        connection = connection_class(parts.hostname, parts.port, timeout=timeout)
+        body = _dumps(json).encode('utf-8')
+        path = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        try:
+            connection.request('POST', path, body, {'Content-Type': 'application/json'})
+            return _HttpClientResponse(connection, connection.getresponse())
+        except Exception:
+            connection.close()
+            raise
+
+    def close(self):
+        pass
+
+
+class QueryClient:
+    """Read data from OpenTSDB /api/query and /api/query/last.
+
+    Results of a query are cached with their time range: a range inside the cached
+    one is served from the cache, a range overlapping its end (e.g. a dashboard
+    moving forward) fetches only the missing tail, from `REFETCH_SECONDS` (or one
+    downsample interval, if longer) before the cached end as the latest points may
+    still be arriving.
+    """
+
+    TIMEOUT = 30
+    CHUNK_SIZE = 64 * 1024
+    REFETCH_SECONDS = 60
+
+    def __init__(self, host: str, port: int, uri: Optional[str]=None, cache_size: int=128, timeout: float=TIMEOUT,
+                 http_transport: str=TSDBConnectProtocols.REQUESTS):
+        self.tsdb_urls = TSDBUrls.from_uri(uri) if uri else TSDBUrls.from_host_and_port(host, port)
+        self.cache = QueryCache(cache_size)
+        self.timeout = timeout
+        if http_transport == TSDBConnectProtocols.HTTP_CLIENT:
+            self._session = _HttpClientSession()
+        else:
+            # imported here, clients which only send metrics don't load requests
+            from requests import Session
+            self._session = Session()
+
+    def query(self, metric: str, start, end=None, aggregator: str='sum', tags: dict=None,
+              downsample: str=None, rate: bool=False, ms: bool=False) -> list:
+        """Return QuerySeries of the metric between start and end (default: now).
+
+        start / end are timestamps in seconds or relative times as '1h-ago'.
+        """
+        now = time.time()
+        start = to_timestamp(start, now)
+        end = int(now) if end is None else to_timestamp(end, now)
+        sub_query = {'aggregator': aggregator, 'metric': metric, 'tags': tags or {}, 'rate': rate}
+        if downsample:
+            sub_query['downsample'] = downsample
+
+        key = (metric, aggregator, tuple(sorted((tags or {}).items())), downsample, rate, ms)
+        # downsampling over the whole range ('0all-sum') can't be cut into windows
+        interval = parse_duration(downsample) if downsample else 0
+        window = self.cache.get(key)
+        if window is not None and interval is not None:
+            cached_start, cached_end, cached = window
+            if cached_start <= start and end <= cached_end:
+                self.cache.count('hits')
+                return self._slice(cached, start, end, ms)
+            if cached_start <= start <= cached_end < end:
+                self.cache.count('partial_hits')
+                fetch_start = max(start, int(cached_end - max(self.REFETCH_SECONDS, interval)))
+                tail = self._fetch(sub_query, fetch_start, end, ms)
+                # points before start are not cached, so a sliding window keeps the same size
+                series = self._slice(self._merge(cached, tail, fetch_start * (1000 if ms else 1)), start, end, ms)
+                self.cache.put(key, start, end, series)
+                return series
+        elif window is not None and window[:2] == (start, end):
+            self.cache.count('hits')
+            return window[2]
+
+        self.cache.count('misses')
+        series = self._fetch(sub_query, start, end, ms)
+        self.cache.put(key, start, end, series)
+        return series
+
+    @staticmethod
+    def _slice(series: list, start: int, end: int, ms: bool) -> list:
+        scale = 1000 if ms else 1
+        return [item.slice(start * scale, end * scale + scale - 1) for item in series]
+
+    @staticmethod
+    def _merge(cached: list, tail: list, tail_start: int) -> list:
+        merged = {item.key: item.slice(-2 ** 62, tail_start - 1) for item in cached}
+        for item in tail:
+            head = merged.get(item.key)
+            if head is None:
+                merged[item.key] = item
+            else:
+                merged[item.key] = QuerySeries(item.metric, item.tags, item.aggregated_tags,
+                                               _concat(head.timestamps, item.timestamps),
+                                               _concat(head.values, item.values))
+        return list(merged.values())
+
+    def _fetch(self, sub_query: dict, start: int, end: int, ms: bool) -> list:
+        body = {'start': start, 'end': end, 'msResolution': ms, 'queries': [sub_query]}
+        response = self._session.post(self.tsdb_urls.query, json=body, timeout=self.timeout, stream=True)
+        try:
+            if response.status_code >= 400:
+                raise QueryError(self._error_message(response))
+
+            parser = QueryResponseParser()
+            decoder = codecs.getincrementaldecoder('utf-8')()
+            for chunk in response.iter_content(self.CHUNK_SIZE):
+                parser.feed(decoder.decode(chunk))
+            parser.feed(decoder.decode(b'', final=True))
+            return parser.close()
+        finally:
+            response.close()
+
+    @staticmethod
+    def _error_message(response) -> str:
+        try:
+            error = response.json()['error']
+            return "OpenTSDB query failed (%d): %s" % (response.status_code, error.get('message', error))
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return "OpenTSDB query failed with status code %d" % response.status_code
+
+    def query_last(self, metric: str, tags: dict=None, back_scan: Optional[int]=None) -> list:
+        """Return the last DataPoint of each series of the metric."""
+        body = {'queries': [{'metric': metric, 'tags': tags or {}}], 'resolveNames': True}
+        if back_scan is not None:
+            body['backScan'] = back_scan
+        response = self._session.post(self.tsdb_urls.query_last, json=body, timeout=self.timeout)
+        try:
+            if response.status_code >= 400:
+                raise QueryError(self._error_message(response))
+
+            return [DataPoint(Series(item['metric'], item.get('tags') or {}), int(item['timestamp']),
+                              float(item['value'])) for item in response.json()]
+        finally:
+            response.close()
+
+    def close(self):
+        self._session.close()
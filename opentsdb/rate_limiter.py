@@ -0,0 +1,145 @@
+from logging import getLogger
+import threading
+import time
+
+logger = getLogger('opentsdb-py')
+
+
+class TokenBucket:
+    """Token bucket which lets bursts up to `capacity` through without waiting.
+
+    Consuming more tokens than available puts the bucket in debt, the caller
+    waits only for the time needed to pay the debt back at `rate` tokens/sec.
+    """
+
+    def __init__(self, rate: float, capacity: float=None, clock=time.monotonic):
+        assert rate > 0, "Rate must be positive: %s" % rate
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self._clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def consume(self, amount: float) -> float:
+        """Take tokens and return how long the caller has to wait (0 if the bucket was not empty)."""
+        with self._lock:
+            self._refill()
+            self._tokens -= amount
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self, amount: float, sleep=time.sleep) -> float:
+        wait_time = self.consume(amount)
+        if wait_time > 0:
+            logger.debug("Rate limit reached, wait for %.4f", wait_time)
+            sleep(wait_time)
+        return wait_time
+
+    @property
+    def tokens(self) -> float:
+        with self._lock:
+            self._refill()
+            return self._tokens
+
+    def state(self) -> dict:
+        return {'rate': self.rate, 'capacity': self.capacity, 'tokens': self.tokens}
+
+
+class RateMeter:
+    """Count of events and their rate per second over the last `window` seconds."""
+
+    def __init__(self, window: float=10, clock=time.monotonic):
+        self.window = window
+        self.total = 0
+        self._clock = clock
+        self._started = clock()
+        self._count = 0
+        self._rate = None
+
+    def _roll(self, now: float):
+        elapsed = now - self._started
+        if elapsed >= self.window:
+            self._rate = self._count / elapsed
+            self._started = now
+            self._count = 0
+
+    def add(self, count: float):
+        self._roll(self._clock())
+        self.total += count
+        self._count += count
+
+    def rate(self) -> float:
+        now = self._clock()
+        self._roll(now)
+        if self._rate is not None:
+            return self._rate
+        # the first window is not over yet
+        elapsed = now - self._started
+        return self._count / elapsed if elapsed > 0 else 0.0
+
+
+class RateLimiter:
+    """Limit sending by data points per second and, optionally, payload bytes per second.
+
+    Sent points and bytes are counted by several push threads, the counters are
+    guarded by a lock of their own so that waiting for tokens doesn't hold it.
+    """
+
+    RATE_WINDOW = 10
+
+    def __init__(self, points_per_second: float=0, bytes_per_second: float=0,
+                 points_burst: float=None, bytes_burst: float=None, clock=time.monotonic):
+        self.points = TokenBucket(points_per_second, points_burst, clock) if points_per_second > 0 else None
+        self.bytes = TokenBucket(bytes_per_second, bytes_burst, clock) if bytes_per_second > 0 else None
+
+        self._sent_points = RateMeter(self.RATE_WINDOW, clock)
+        self._sent_bytes = RateMeter(self.RATE_WINDOW, clock)
+        self._total_wait = 0.0
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return self.points is not None or self.bytes is not None
+
+    @property
+    def total_points(self) -> int:
+        return self._sent_points.total
+
+    @property
+    def total_bytes(self) -> int:
+        return self._sent_bytes.total
+
+    @property
+    def total_wait(self) -> float:
+        return self._total_wait
+
+    def acquire_points(self, count: int, sleep=time.sleep):
+        wait_time = self.points.acquire(count, sleep) if self.points else 0.0
+        with self._lock:
+            self._sent_points.add(count)
+            self._total_wait += wait_time
+
+    def acquire_bytes(self, count: int, sleep=time.sleep):
+        wait_time = self.bytes.acquire(count, sleep) if self.bytes else 0.0
+        with self._lock:
+            self._sent_bytes.add(count)
+            self._total_wait += wait_time
+
+    def state(self) -> dict:
+        """Buckets, totals and points / bytes per second over the last RATE_WINDOW seconds."""
+        with self._lock:
+            return {
+                'points': self.points.state() if self.points else None,
+                'bytes': self.bytes.state() if self.bytes else None,
+                'points_per_second': self._sent_points.rate(),
+                'bytes_per_second': self._sent_bytes.rate(),
+                'total_points': self._sent_points.total,
+                'total_bytes': self._sent_bytes.total,
+                'total_wait': self._total_wait,
+            }
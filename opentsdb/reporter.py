@@ -0,0 +1,71 @@
+from logging import getLogger
+import threading
+import time
+
+logger = getLogger('opentsdb-py')
+
+
+class MetricsReporter(threading.Thread):
+    """Periodically ask registered metrics (Histogram, Summary, ...) to send what they collected.
+
+    Aligned reporter runs at multiples of `interval` since the epoch and passes the tick
+    as `collect(timestamp)`, so all points of one report share the timestamp. Collectors with
+    `collected(timestamp)` (metrics) are sent together, one `send_collected` call per report.
+    """
+
+    # Counter / Gauge send a point on every update or only their current values once per interval
+    UPDATES = 'updates'
+    SNAPSHOT = 'snapshot'
+
+    def __init__(self, interval, close_client, aligned: bool=False, clock=time.time, send_collected=None):
+        super().__init__()
+        self.interval = interval
+        self.close_client_flag = close_client
+        self.aligned = aligned
+        self.send_collected = send_collected
+        self._clock = clock
+
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, collector):
+        with self._lock:
+            if collector not in self._collectors:
+                self._collectors.append(collector)
+
+    def collect(self, timestamp: int=None):
+        with self._lock:
+            collectors = list(self._collectors)
+
+        metrics = []
+        for collector in collectors:
+            try:
+                if self.send_collected is not None and hasattr(collector, 'collected'):
+                    metrics.extend(collector.collected(timestamp))
+                elif timestamp is None:
+                    collector.collect()
+                else:
+                    collector.collect(timestamp)
+            except Exception as error:
+                logger.exception("Collect metric %s failed: %s", collector, error)
+
+        if metrics:
+            try:
+                self.send_collected(metrics)
+            except Exception as error:
+                logger.exception("Send of %d collected metrics failed: %s", len(metrics), error)
+
+    def next_tick(self) -> float:
+        return (self._clock() // self.interval + 1) * self.interval
+
+    def run(self):
+        if not self.aligned:
+            while not self.close_client_flag.wait(self.interval):
+                self.collect()
+            return
+
+        tick = self.next_tick()
+        while not self.close_client_flag.wait(max(0.0, tick - self._clock())):
+            self.collect(int(tick))
+            # ticks missed by a slow collect are skipped
+            tick = max(tick + self.interval, self.next_tick())
@@ -0,0 +1,152 @@
+from logging import getLogger
+import random
+import re
+import sys
+import threading
+import time
+
+from opentsdb.datapoint import DataPoint, PointsChunk
+
+logger = getLogger('opentsdb-py')
+
+# statuses of an overloaded or failing OpenTSDB (or proxy in front of it), the request may pass later
+TRANSIENT_STATUS_CODES = frozenset((408, 425, 429, 500, 502, 503, 504))
+
+# errors of single points in /api/put?details=true responses: storage failures reported by OpenTSDB
+# ('Storage exception: ...', 'Please throttle writes: ...') or naming a transient HBase / asynchbase
+# exception type, all other errors (unknown metric, invalid value...) are the same on retry
+TRANSIENT_POINT_ERROR = re.compile(
+    r'^(Storage exception|Please throttle)|\b(PleaseThrottleException|RegionTooBusyException|'
+    r'NotServingRegionException|RegionMovedException|RpcTimedOutException|TimeoutException|'
+    r'ConnectionResetException)\b')
+
+
+def is_transient_error(error: BaseException) -> bool:
+    """Classify a send failure by its type: network errors, timeouts and transient statuses may pass on retry."""
+    # TransientError of bad statuses, requests and socket errors are all OSError
+    if isinstance(error, OSError):
+        return True
+    # broken responses of http.client (BadStatusLine, IncompleteRead...) and asyncio timeouts,
+    # checked only if these modules are used at all
+    http_client = sys.modules.get('http.client')
+    if http_client is not None and isinstance(error, http_client.HTTPException):
+        return True
+    asyncio = sys.modules.get('asyncio')
+    return asyncio is not None and isinstance(error, (asyncio.TimeoutError, asyncio.IncompleteReadError))
+
+
+def is_transient_point_error(error: str) -> bool:
+    return TRANSIENT_POINT_ERROR.search(str(error)) is not None
+
+
+def _point_key(metric: dict) -> tuple:
+    tags = metric.get('tags') or {}
+    return (str(metric.get('metric')), str(metric.get('timestamp')), str(metric.get('value')),
+            tuple(sorted((str(key), str(value)) for key, value in tags.items())))
+
+
+def split_rejected(data, errors) -> tuple:
+    """Split points rejected in /api/put?details=true `errors` of the batch `data` into transient and invalid ones.
+
+    Transient points of a chunk are grouped into a chunk with the same `on_sent`,
+    return (items to retry, invalid datapoints, {id(chunk): retried points}).
+    """
+    points = {}
+    for item in data:
+        chunk = item if type(item) is PointsChunk and item.on_sent is not None else None
+        for point in (item if type(item) is PointsChunk else (item, )):
+            points[_point_key(point.to_dict())] = (point, chunk)
+
+    transient, invalid, chunks = [], [], {}
+    for error in errors:
+        datapoint = error.get('datapoint') or {}
+        if not is_transient_point_error(error.get('error', '')):
+            invalid.append(datapoint)
+            continue
+
+        point, chunk = points.get(_point_key(datapoint), (None, None))
+        if chunk is not None:
+            retried = chunks.get(id(chunk))
+            if retried is None:
+                retried = chunks[id(chunk)] = PointsChunk(chunk.series, [], [], chunk.on_sent)
+                transient.append(retried)
+            retried.timestamps.append(point.timestamp)
+            retried.values.append(point.value)
+            continue
+        if point is None:
+            try:
+                point = DataPoint.from_dict(datapoint)
+            except (KeyError, TypeError):
+                invalid.append(datapoint)
+                continue
+        transient.append(point)
+
+    return transient, invalid, {key: len(chunk) for key, chunk in chunks.items()}
+
+
+class Backoff:
+    """Exponential backoff with jitter: attempt N waits between half and full of min(maximum, base * 2 ** N)."""
+
+    def __init__(self, base: float=0.5, maximum: float=30.0):
+        self.base = base
+        self.maximum = maximum
+
+    def delay(self, attempt: int) -> float:
+        delay = min(self.maximum, self.base * 2 ** attempt)
+        return delay / 2 + random.uniform(0, delay / 2)
+
+
+class CircuitBreaker:
+    """Stop sending to OpenTSDB after `failure_threshold` failures in a row.
+
+    After `reset_timeout` seconds one send is let through (half-open),
+    its success closes the circuit and its failure opens it again.
+    """
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+
+    def __init__(self, failure_threshold: int=5, reset_timeout: float=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened = 0
+
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        self.wait_time()
+        return self._state
+
+    def wait_time(self) -> float:
+        """Seconds until sending is allowed again, 0 if it's allowed now."""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            remaining = self._opened_at + self.reset_timeout - self._clock()
+            if remaining > 0:
+                return remaining
+            self._state = self.HALF_OPEN
+            return 0.0
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self._state != self.CLOSED:
+                logger.info("OpenTSDB is reachable again, circuit closed")
+                self._state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self._state == self.HALF_OPEN or (self._state == self.CLOSED and self.failures >= self.failure_threshold):
+                logger.warning("OpenTSDB failed %d times in a row, circuit opened for %s seconds",
+                               self.failures, self.reset_timeout)
+                self._state = self.OPEN
+                self._opened_at = self._clock()
+                self.opened += 1
@@ -0,0 +1,184 @@
+from logging import getLogger
+from urllib.parse import urlsplit
+import bisect
+import itertools
+import queue
+import threading
+import zlib
+
+from opentsdb.datapoint import points_count
+from opentsdb.metrics_queue import MetricsQueue, ShardedQueue, stable_hash
+
+logger = getLogger('opentsdb-py')
+
+
+def parse_endpoint(endpoint: str, default_port: int) -> tuple:
+    """Split 'host', 'host:port' or 'http(s)://host:port/path' into (host, port, uri)."""
+    if '://' in endpoint:
+        parts = urlsplit(endpoint)
+        return parts.hostname, parts.port or default_port, endpoint.rstrip('/')
+    host, _, port = endpoint.partition(':')
+    return host, int(port) if port else default_port, None
+
+
+class HashRing:
+    """Consistent hashing of keys to nodes, each node owns `replicas` points of the ring.
+
+    Removing a node moves only the keys it owned, to their next nodes on the ring.
+    """
+
+    def __init__(self, nodes=(), replicas: int=100):
+        self.replicas = replicas
+        self._ring = []
+        self._nodes = []
+        for node in nodes:
+            self.add(node)
+
+    @property
+    def nodes(self) -> list:
+        return list(self._nodes)
+
+    def add(self, node):
+        if node in self._nodes:
+            return
+        self._nodes.append(node)
+        ring = list(self._ring)
+        for replica in range(self.replicas):
+            ring.append((zlib.crc32(('%s-%d' % (node, replica)).encode('utf-8')), node))
+        ring.sort()
+        self._ring = ring
+
+    def remove(self, node):
+        if node not in self._nodes:
+            return
+        self._nodes.remove(node)
+        self._ring = [point for point in self._ring if point[1] != node]
+
+    def get(self, key_hash: int):
+        ring = self._ring
+        if not ring:
+            return None
+        index = bisect.bisect(ring, (key_hash & 0xffffffff, ))
+        return ring[index % len(ring)][1]
+
+
+class RoutingQueue(ShardedQueue):
+    """Queue per OpenTSDB node, points are routed to healthy nodes by series or round-robin.
+
+    With 'hash' routing all points of a series go to one node (consistent hashing,
+    so ejecting a node moves only its own series), with 'round_robin' points are
+    spread evenly. Points queued for an ejected node are routed to the other nodes,
+    and so are the points its push threads postpone for a retry (see `MetricsQueue.reroute`).
+    Moved points are queued with the overflow policy, the ones it drops are counted in `telemetry`.
+    """
+
+    HASH = 'hash'
+    ROUND_ROBIN = 'round_robin'
+
+    def __init__(self, nodes_count: int, maxsize: int=0, routing: str=HASH, telemetry=None, **queue_kwargs):
+        assert routing in (self.HASH, self.ROUND_ROBIN), 'Unsupported routing: %s' % routing
+        super().__init__(nodes_count, maxsize, **queue_kwargs)
+        self.routing = routing
+        self.telemetry = telemetry
+        self._ring = HashRing(range(nodes_count))
+        self._healthy = list(range(nodes_count))
+        self._round_robin = itertools.count()
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> list:
+        return list(self._healthy)
+
+    def shard_for(self, item) -> MetricsQueue:
+        if self.routing == self.HASH:
+            node = self._ring.get(stable_hash(self.key(item)))
+        else:
+            healthy = self._healthy
+            node = healthy[next(self._round_robin) % len(healthy)] if healthy else None
+        if node is None:
+            # all nodes are down, keep the points where they would go anyway
+            node = stable_hash(self.key(item)) % len(self.shards)
+        return self.shards[node]
+
+    def eject(self, node: int):
+        with self._lock:
+            if node not in self._healthy:
+                return
+            self._healthy = [index for index in self._healthy if index != node]
+            self._ring.remove(node)
+            self.shards[node].reroute = self.reroute
+            if self._healthy:
+                self._reroute(node)
+
+    def rejoin(self, node: int):
+        with self._lock:
+            if node in self._healthy:
+                return
+            self._healthy = sorted(self._healthy + [node])
+            self._ring.add(node)
+            self.shards[node].reroute = None
+
+    def reroute(self, items) -> list:
+        """Route items of an ejected node to the healthy nodes, return the items left where they are."""
+        kept, dropped = [], 0
+        for item in items:
+            shard = self.shard_for(item)
+            if shard.reroute is not None:
+                # all nodes are down
+                kept.append(item)
+                continue
+            dropped += points_count(shard.offer(item))
+        if dropped:
+            logger.warning("Drop %d metrics moved from ejected node because the queue is full", dropped)
+            if self.telemetry is not None:
+                self.telemetry.inc('dropped', dropped)
+        return kept
+
+    def _reroute(self, node: int):
+        shard, items = self.shards[node], []
+        stop = False
+        while True:
+            try:
+                item = shard.get_nowait()
+            except queue.Empty:
+                break
+            if item is StopIteration:
+                stop = True
+            else:
+                items.append(item)
+        self.reroute(items)
+        if stop:
+            shard.put(StopIteration)
+        if items:
+            logger.info("Moved %d metrics from ejected node %d", len(items), node)
+
+
+class HealthChecker(threading.Thread):
+    """Check nodes with `is_alive` every `interval`, eject failing nodes from routing and rejoin recovered ones."""
+
+    def __init__(self, connects, metrics_queue: RoutingQueue, interval: float, close_client, timeout: float=3):
+        super().__init__()
+        self.connects = connects
+        self.metrics_queue = metrics_queue
+        self.interval = interval
+        self.close_client_flag = close_client
+        self.timeout = timeout
+
+    def check(self) -> list:
+        """Return indexes of healthy nodes after the check."""
+        for node, connect in enumerate(self.connects):
+            if connect.is_alive(timeout=self.timeout):
+                if node not in self.metrics_queue.healthy:
+                    logger.info("OpenTSDB node %s:%s is back", connect.tsdb_host, connect.tsdb_port)
+                self.metrics_queue.rejoin(node)
+            elif node in self.metrics_queue.healthy:
+                logger.warning("OpenTSDB node %s:%s is not alive, ejected", connect.tsdb_host, connect.tsdb_port)
+                self.metrics_queue.eject(node)
+        return self.metrics_queue.healthy
+
+    def run(self):
+        while not self.close_client_flag.wait(self.interval):
+            try:
+                self.check()
+            except Exception as error:
+                logger.exception(error)
@@ -0,0 +1,53 @@
+from collections import OrderedDict
+import threading
+
+from opentsdb.datapoint import Series
+
+
+class SeriesCache:
+    """Bounded LRU of validated series, keyed by metric name and the tags given to `send()`."""
+
+    def __init__(self, maxsize: int=10000):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        self._series = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._series)
+
+    def get(self, key) -> Series:
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._series.move_to_end(key)
+            return series
+
+    def put(self, key, series: Series) -> Series:
+        with self._lock:
+            self._series[key] = series
+            if len(self._series) > self.maxsize:
+                self._series.popitem(last=False)
+                self.evictions += 1
+            return series
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            'size': len(self._series),
+            'maxsize': self.maxsize,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_ratio': self.hits / total if total else 0.0,
+        }
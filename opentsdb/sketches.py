@@ -0,0 +1,175 @@
+import bisect
+import hashlib
+import heapq
+import math
+
+
+class _Stats:
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _add_stats(self, value, count=1):
+        self.count += count
+        self.sum += value * count
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def _merge_stats(self, other):
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+
+class BucketHistogram(_Stats):
+    """Counts of observations in fixed buckets, quantiles are interpolated inside a bucket."""
+
+    def __init__(self, buckets):
+        super().__init__()
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._add_stats(value)
+
+    def merge(self, other):
+        assert self.buckets == other.buckets, "Can't merge histograms with different buckets"
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self._merge_stats(other)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return math.nan
+
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index > 0 else self.min
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                lower, upper = max(lower, self.min), min(upper, self.max)
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+class DDSketch(_Stats):
+    """Mergeable quantile sketch with relative error guarantee (DDSketch, Masson et al. 2019).
+
+    Values are counted in logarithmic bins, memory is bounded by `max_bins` per sign,
+    when the limit is hit the bins of the smallest magnitudes are collapsed.
+    """
+
+    MIN_VALUE = 1e-9
+
+    def __init__(self, relative_accuracy: float=0.01, max_bins: int=2048):
+        super().__init__()
+        self.relative_accuracy = relative_accuracy
+        self.max_bins = max_bins
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        # min-heaps of the keys of the stores, only the smallest key is ever removed
+        self._positive_keys = []
+        self._negative_keys = []
+
+    def _key(self, value: float) -> int:
+        return int(math.ceil(math.log(value) / self._log_gamma))
+
+    def _value(self, key: int) -> float:
+        return 2.0 * self.gamma ** key / (self.gamma + 1)
+
+    def add(self, value: float, count: int=1):
+        if value > self.MIN_VALUE:
+            self._add_to_store(self.positive, self._positive_keys, self._key(value), count)
+        elif value < -self.MIN_VALUE:
+            self._add_to_store(self.negative, self._negative_keys, self._key(-value), count)
+        else:
+            self.zero_count += count
+        self._add_stats(value, count)
+
+    def _add_to_store(self, store: dict, keys: list, key: int, count: int):
+        if key in store:
+            store[key] += count
+            return
+        store[key] = count
+        heapq.heappush(keys, key)
+        if len(store) > self.max_bins:
+            self._collapse(store, keys)
+
+    @staticmethod
+    def _collapse(store: dict, keys: list):
+        collapsed = store.pop(heapq.heappop(keys))
+        store[keys[0]] += collapsed
+
+    def merge(self, other):
+        assert self.gamma == other.gamma, "Can't merge sketches with different accuracy"
+        for key, count in other.positive.items():
+            self._add_to_store(self.positive, self._positive_keys, key, count)
+        for key, count in other.negative.items():
+            self._add_to_store(self.negative, self._negative_keys, key, count)
+        self.zero_count += other.zero_count
+        self._merge_stats(other)
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return math.nan
+
+        rank = q * (self.count - 1)
+        seen = 0
+        for key in sorted(self.negative, reverse=True):
+            seen += self.negative[key]
+            if seen > rank:
+                return max(-self._value(key), self.min)
+
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+
+        for key in sorted(self.positive):
+            seen += self.positive[key]
+            if seen > rank:
+                return min(self._value(key), self.max)
+        return self.max
+
+
+class HyperLogLog:
+    """Approximate count of distinct values in 2 ** precision bytes, standard error 1.04 / sqrt(2 ** precision)."""
+
+    def __init__(self, precision: int=10):
+        assert 4 <= precision <= 16, 'Unsupported precision: %s' % precision
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        size = len(self.registers)
+        self._alpha = 0.7213 / (1 + 1.079 / size) if size >= 128 else {16: 0.673, 32: 0.697, 64: 0.709}[size]
+
+    def add(self, value):
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=8).digest()
+        hashed = int.from_bytes(digest, 'big')
+        index = hashed >> (64 - self.precision)
+        rest = hashed & ((1 << (64 - self.precision)) - 1)
+        rank = 64 - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        assert self.precision == other.precision, "Can't merge HyperLogLog with different precision"
+        self.registers = bytearray(max(pair) for pair in zip(self.registers, other.registers))
+
+    def count(self) -> int:
+        size = len(self.registers)
+        estimate = self._alpha * size * size / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * size and zeros:
+            # linear counting is more accurate for small cardinalities
+            estimate = size * math.log(size / zeros)
+        return int(round(estimate))
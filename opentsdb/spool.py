@@ -0,0 +1,281 @@
+from collections import deque
+from logging import getLogger
+import json
+import os
+import threading
+
+from opentsdb.datapoint import DataPoint
+from opentsdb.rate_limiter import TokenBucket
+
+logger = getLogger('opentsdb-py')
+
+
+class DiskSpool:
+    """Append-only on-disk buffer of metrics split into segment files.
+
+    Records are JSON lines, a line without trailing newline is an interrupted write
+    and is skipped. The replay position is kept in a cursor file which is replaced
+    atomically and committed only after the records were sent, so after a crash replay
+    resumes from the last delivered record: delivery is at-least-once, records sent
+    right before a crash may be sent again.
+
+    Producers (`send()`) spool with `append_nowait`, which only queues records in memory,
+    the replay thread writes them to disk. Up to `max_pending` records wait in memory, above
+    it the oldest ones are dropped. Dropped records (of the memory queue and of the oldest
+    segments removed above `max_size`) are counted in telemetry 'dropped'.
+    """
+
+    SEGMENT_SUFFIX = '.spool'
+    CURSOR_FILE = 'cursor'
+    MAX_PENDING = 100000
+
+    def __init__(self, directory: str, segment_size: int=8 * 1024 * 1024,
+                 max_size: int=256 * 1024 * 1024, fsync: bool=False, max_pending: int=MAX_PENDING,
+                 telemetry=None):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.max_size = max_size
+        self.fsync = fsync
+        self.max_pending = max_pending
+        self.telemetry = telemetry
+        self.dropped_bytes = 0
+
+        self._lock = threading.RLock()
+        self._pending = deque()
+        self._pending_count = 0
+        self._pending_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = self._list_segments()
+        self._sizes = {seq: os.path.getsize(self._path(seq)) for seq in self._segments}
+        self._cursor = self._load_cursor()
+
+        self._write_seq = (self._segments[-1] + 1) if self._segments else 0
+        self._write_file = None
+
+        if self._segments:
+            logger.info("Recovered %d spool segments (%d bytes) from %s",
+                        len(self._segments), self.size, self.directory)
+
+    def _path(self, seq: int) -> str:
+        return os.path.join(self.directory, '%020d%s' % (seq, self.SEGMENT_SUFFIX))
+
+    def _list_segments(self):
+        return sorted(int(name[:-len(self.SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(self.SEGMENT_SUFFIX) and name[:-len(self.SEGMENT_SUFFIX)].isdigit())
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, self.CURSOR_FILE)) as cursor_file:
+                seq, offset = (int(value) for value in cursor_file.read().split())
+        except (OSError, ValueError):
+            seq, offset = None, 0
+
+        if seq not in self._segments:
+            return (self._segments[0], 0) if self._segments else (0, 0)
+        return seq, offset
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, self.CURSOR_FILE)
+        with open(path + '.tmp', 'w') as cursor_file:
+            cursor_file.write('%d %d' % self._cursor)
+        os.replace(path + '.tmp', path)
+
+    @property
+    def size(self) -> int:
+        return sum(self._sizes.values())
+
+    def empty(self) -> bool:
+        with self._lock:
+            seq, offset = self._cursor
+            return all(self._sizes[segment] <= (offset if segment == seq else 0)
+                       for segment in self._segments if segment >= seq)
+
+    def append(self, metrics):
+        data = ''.join(json.dumps(point.to_dict()) + '\n' for point in metrics).encode('utf-8')
+        with self._lock:
+            if self._write_file is None or self._sizes.get(self._write_seq, 0) >= self.segment_size:
+                self._rotate()
+
+            self._write_file.write(data)
+            self._write_file.flush()
+            if self.fsync:
+                os.fsync(self._write_file.fileno())
+            self._sizes[self._write_seq] += len(data)
+
+            self._apply_max_size()
+
+    def append_nowait(self, metrics):
+        """Spool metrics without file I/O in the calling thread, they are written by `flush_pending`."""
+        batch, dropped = list(metrics), 0
+        with self._pending_lock:
+            self._pending.append(batch)
+            self._pending_count += len(batch)
+            while self._pending_count > self.max_pending:
+                oldest = self._pending.popleft()
+                self._pending_count -= len(oldest)
+                dropped += len(oldest)
+        if dropped:
+            logger.warning("Spool writes fall behind, drop %d oldest metrics", dropped)
+            self._dropped(dropped)
+        self._wakeup.set()
+
+    def flush_pending(self):
+        with self._pending_lock:
+            batches, self._pending = self._pending, deque()
+            self._pending_count = 0
+        if batches:
+            self.append(metric for batch in batches for metric in batch)
+
+    def _dropped(self, count: int):
+        if self.telemetry is not None:
+            self.telemetry.inc('dropped', count)
+
+    def wait(self, timeout: float):
+        """Wait until metrics are spooled with append_nowait, `wake` is called or the timeout passes."""
+        self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def wake(self):
+        self._wakeup.set()
+
+    def _rotate(self):
+        if self._write_file is not None:
+            self._write_file.close()
+            self._write_file = None
+
+        if self._sizes.get(self._write_seq, 0) >= self.segment_size:
+            self._write_seq += 1
+        if self._write_seq not in self._sizes:
+            self._segments.append(self._write_seq)
+            self._sizes[self._write_seq] = 0
+
+        self._write_file = open(self._path(self._write_seq), 'ab')
+
+    def _apply_max_size(self):
+        while self.size > self.max_size and len(self._segments) > 1:
+            seq = self._segments[0]
+            # records before the cursor were already delivered
+            cursor_seq, offset = self._cursor
+            dropped = 0 if cursor_seq > seq else self._count_records(seq, offset if cursor_seq == seq else 0)
+            logger.warning("Spool is full, drop oldest segment %s with %d metrics", self._path(seq), dropped)
+            self.dropped_bytes += self._sizes[seq]
+            self._dropped(dropped)
+            self._remove_segment(seq)
+            if self._cursor[0] <= seq:
+                self._cursor = (self._segments[0], 0)
+
+    def _count_records(self, seq: int, offset: int) -> int:
+        try:
+            with open(self._path(seq), 'rb') as segment_file:
+                segment_file.seek(offset)
+                return sum(chunk.count(b'\n') for chunk in iter(lambda: segment_file.read(65536), b''))
+        except OSError as error:
+            logger.error("Can't read spool segment: %s", error)
+            return 0
+
+    def _remove_segment(self, seq):
+        self._segments.remove(seq)
+        del self._sizes[seq]
+        try:
+            os.remove(self._path(seq))
+        except OSError as error:
+            logger.error("Can't remove spool segment: %s", error)
+
+    def read(self, max_count: int):
+        """Return up to max_count records as (metric, position) pairs starting from the cursor."""
+        records = []
+        with self._lock:
+            seq, offset = self._cursor
+            for segment in [segment for segment in self._segments if segment >= seq]:
+                if segment != seq:
+                    offset = 0
+
+                with open(self._path(segment), 'rb') as segment_file:
+                    segment_file.seek(offset)
+                    for line in segment_file:
+                        if not line.endswith(b'\n'):
+                            break
+                        offset += len(line)
+                        try:
+                            metric = DataPoint.from_dict(json.loads(line.decode('utf-8')))
+                        except (ValueError, KeyError, TypeError):
+                            logger.warning("Skip broken spool record in %s", self._path(segment))
+                            continue
+                        records.append((metric, (segment, offset)))
+                        if len(records) >= max_count:
+                            return records
+        return records
+
+    def commit(self, position):
+        """Mark records up to position as delivered and drop fully replayed segments."""
+        with self._lock:
+            self._cursor = position
+            for seq in [seq for seq in self._segments if seq < position[0]]:
+                self._remove_segment(seq)
+            self._save_cursor()
+
+    def close(self):
+        self.flush_pending()
+        with self._lock:
+            if self._write_file is not None:
+                self._write_file.close()
+                self._write_file = None
+
+
+class SpoolReplayThread(threading.Thread):
+    """Write metrics spooled by producers and send spooled metrics once OpenTSDB is reachable.
+
+    Records are sent through a connection of the thread and committed only after OpenTSDB
+    answered, a failed send leaves them in the spool for the next attempt.
+    """
+
+    CHECK_INTERVAL = 5
+    BATCH_SIZE = 500
+
+    def __init__(self, spool: DiskSpool, tsdb_connect, close_client, replay_limit: float, telemetry=None):
+        super().__init__()
+        self.spool = spool
+        self.tsdb_connect = tsdb_connect
+        self.close_client_flag = close_client
+        self.rate_limit = TokenBucket(replay_limit) if replay_limit > 0 else None
+        self.telemetry = telemetry
+        self.replayed = 0
+
+    def run(self):
+        while not self.close_client_flag.is_set():
+            try:
+                self.spool.flush_pending()
+                if self.spool.empty() or not self.tsdb_connect.is_alive() or not self.replay(self.BATCH_SIZE):
+                    self.spool.wait(self.CHECK_INTERVAL)
+            except Exception as error:
+                logger.exception(error)
+                self.spool.wait(self.CHECK_INTERVAL)
+
+        self.spool.close()
+        self.tsdb_connect.disconnect()
+
+    def replay(self, batch_size: int) -> int:
+        """Send up to batch_size records, return how many were delivered (0 if the send failed)."""
+        records = self.spool.read(batch_size)
+        if not records:
+            return 0
+        if self.rate_limit:
+            self.rate_limit.acquire(len(records))
+
+        metrics = [metric for metric, _ in records]
+        try:
+            result = self.tsdb_connect.sendall(*metrics)
+        except Exception as error:
+            logger.warning("Replay of %d spooled metrics failed: %s", len(metrics), error)
+            return 0
+
+        self.spool.commit(records[-1][1])
+        if self.telemetry is not None:
+            # points rejected by OpenTSDB as invalid are committed as well, they would fail again
+            failed = result.get('failed', 0) if isinstance(result, dict) else 0
+            self.telemetry.inc('success', len(metrics) - failed)
+            self.telemetry.inc('failed', failed)
+        self.replayed += len(metrics)
+        return len(metrics)
@@ -0,0 +1,92 @@
+from logging import getLogger
+import threading
+
+from opentsdb.sketches import BucketHistogram
+
+logger = getLogger('opentsdb-py')
+
+
+class Telemetry:
+    """Counters and distributions of the client pipeline, safe to update from any thread.
+
+    `statuses` keeps the counters as a plain dict for reading. Distributions and the
+    queue high-water mark cover the current window, which is restarted when they are
+    reported to OpenTSDB (`collect`); without self-reporting they cover the client lifetime.
+    """
+
+    COUNTERS = ('success', 'failed', 'queued', 'retried', 'dropped', 'reconnects', 'suppressed',
+                'collapsed', 'rejected', 'rate_limited')
+    SECONDS_BUCKETS = (.00001, .00005, .0001, .0005, .001, .005, .01, .05, .1, .5, 1.0, 5.0)
+    HISTOGRAMS = {
+        'enqueue_seconds': SECONDS_BUCKETS,
+        'serialization_seconds': SECONDS_BUCKETS,
+        'round_trip_seconds': SECONDS_BUCKETS,
+        'batch_size': (1, 5, 10, 50, 100, 500, 1000, 5000, 10000),
+    }
+    QUANTILES = (0.5, 0.9, 0.99)
+    ENQUEUE_SAMPLING = 16
+
+    def __init__(self, prefix: str=None, tags: dict=None, send=None):
+        self.prefix = prefix
+        self.tags = tags or {}
+        self.send = send
+        self.statuses = dict.fromkeys(self.COUNTERS, 0)
+        self.queue_high_water = 0
+
+        self._histograms = self._new_histograms()
+        self._lock = threading.Lock()
+
+    def _new_histograms(self) -> dict:
+        return {name: BucketHistogram(buckets) for name, buckets in self.HISTOGRAMS.items()}
+
+    def inc(self, name: str, amount: int=1):
+        with self._lock:
+            self.statuses[name] += amount
+
+    def observe(self, name: str, value: float):
+        with self._lock:
+            self._histograms[name].add(value)
+
+    def observe_queue_depth(self, depth: int):
+        if depth > self.queue_high_water:
+            with self._lock:
+                self.queue_high_water = max(self.queue_high_water, depth)
+
+    def snapshot(self, reset: bool=False) -> dict:
+        with self._lock:
+            histograms, high_water = self._histograms, self.queue_high_water
+            snapshot = dict(self.statuses)
+            if reset:
+                self._histograms, self.queue_high_water = self._new_histograms(), 0
+            else:
+                histograms = {name: self._copy(histogram) for name, histogram in histograms.items()}
+
+        snapshot['queue_high_water'] = high_water
+        for name, histogram in histograms.items():
+            snapshot[name] = self._summary(histogram)
+        return snapshot
+
+    @staticmethod
+    def _copy(histogram: BucketHistogram) -> BucketHistogram:
+        copy = BucketHistogram(histogram.buckets)
+        copy.merge(histogram)
+        return copy
+
+    def _summary(self, histogram: BucketHistogram) -> dict:
+        summary = {'count': histogram.count, 'sum': histogram.sum, 'max': histogram.max if histogram.count else 0}
+        for quantile in self.QUANTILES:
+            summary['p%s' % format(quantile * 100, 'g')] = histogram.quantile(quantile) if histogram.count else 0
+        return summary
+
+    def collect(self, timestamp: int=None) -> int:
+        """Send the snapshot as `<prefix>.<name>` metrics with `send(name, value, **tags)` and start a new window."""
+        sent = 0
+        for name, value in self.snapshot(reset=True).items():
+            if not isinstance(value, dict):
+                self.send('%s.%s' % (self.prefix, name), value, timestamp=timestamp, **self.tags)
+                sent += 1
+            elif value['count']:
+                for field, field_value in value.items():
+                    self.send('%s.%s.%s' % (self.prefix, name, field), field_value, timestamp=timestamp, **self.tags)
+                    sent += 1
+        return sent
@@ -37,3 +37,13 @@ def http_client3(tsdb_host, tsdb_port):
 @pytest.fixture
 def telnet_client(tsdb_host, tsdb_port):
     return TSDBClient(tsdb_host, tsdb_port, protocol=TSDBConnectProtocols.TELNET, host_tag=True)
+
+
+@pytest.fixture
+def aggregated_client(tsdb_host, tsdb_port):
+    return TSDBClient(tsdb_host, tsdb_port, host_tag=True, aggregation_interval=60)
+
+
+@pytest.fixture
+def http_pool_client(tsdb_host, tsdb_port):
+    return TSDBClient(tsdb_host, tsdb_port, host_tag=False, send_workers=4)
@@ -0,0 +1,42 @@
+import threading
+
+from opentsdb import TSDBClient, Counter
+from opentsdb.aggregator import MetricsAggregator
+from opentsdb.datapoint import DataPoint
+
+
+def _point(**metric):
+    return DataPoint.from_dict(metric)
+
+
+def test_one_point_per_series():
+    pushed = []
+    aggregator = MetricsAggregator(pushed.append, 60, threading.Event())
+    for value in range(100):
+        aggregator.add(_point(metric='test', timestamp=1, value=value, tags={'a': '1'}))
+    aggregator.add(_point(metric='test', timestamp=1, value=5, tags={'a': '2'}))
+
+    assert aggregator.pending() == 2
+    assert aggregator.flush() == 2
+    assert sorted(m['value'] for m in pushed) == [5, 99]
+    assert aggregator.flush() == 0
+
+
+def test_tags_order_does_not_split_series():
+    pushed = []
+    aggregator = MetricsAggregator(pushed.append, 60, threading.Event())
+    aggregator.add(_point(metric='test', timestamp=1, value=1, tags={'a': '1', 'b': '2'}))
+    aggregator.add(_point(metric='test', timestamp=1, value=2, tags={'b': '2', 'a': '1'}))
+    aggregator.flush()
+    assert len(pushed) == 1
+
+
+def test_client_aggregation(aggregated_client: TSDBClient):
+    aggregated_client.TEST_METRIC = Counter('test.metric.aggregated')
+    for _ in range(1000):
+        aggregated_client.TEST_METRIC.inc()
+
+    assert aggregated_client.queue_size() == 0
+    aggregated_client.close()
+    aggregated_client.wait()
+    assert aggregated_client.statuses['success'] == 1
@@ -0,0 +1,127 @@
+import asyncio
+import logging
+
+import pytest
+
+from opentsdb import AsyncTSDBClient, TSDBConnectProtocols, Counter
+from opentsdb.exceptions import TSDBClientException
+from opentsdb.retry import Backoff
+
+
+def _run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+def test_send_metric_through_http(tsdb_host, tsdb_port):
+    _run(_test_sending_metrics(AsyncTSDBClient(tsdb_host, tsdb_port, host_tag=True)))
+
+
+def test_send_metric_through_telnet(tsdb_host, tsdb_port):
+    _run(_test_sending_metrics(
+        AsyncTSDBClient(tsdb_host, tsdb_port, protocol=TSDBConnectProtocols.TELNET, host_tag=True)))
+
+
+async def _test_sending_metrics(client: AsyncTSDBClient):
+    async with client:
+        assert client.is_connected()
+        assert await client.is_alive()
+        client.TEST_METRIC = Counter('test.metric.async')
+        for _ in range(120):
+            client.TEST_METRIC.inc()
+        await client.flush()
+        assert client.queue_size() == 0
+        assert client.statuses['success'] == 120
+
+        client.send('test', 1, tag1=1)
+
+    assert client.is_connected() is False
+    assert client.statuses['success'] == 121
+
+
+def test_force_close(tsdb_host, tsdb_port):
+    async def _test():
+        client = await AsyncTSDBClient('127.0.0.2', 42424, host_tag=True).start()
+        client.send('test', 1)
+        await asyncio.sleep(0)
+        await client.aclose(force=True)
+        assert client.is_connected() is False
+        assert client.statuses['success'] == 0
+
+    _run(_test())
+
+
+def test_close_gives_up_when_not_available():
+    async def _test():
+        client = await AsyncTSDBClient('127.0.0.2', 42424, host_tag=True, max_retries=1).start()
+        client.send('test', 1)
+        await client.aclose()
+        assert client.statuses['retried'] == 1
+        assert client.statuses['dropped'] == 1
+
+    _run(_test())
+
+
+def test_queue_overflow(caplog):
+    async def _test():
+        client = await AsyncTSDBClient('127.0.0.2', 42424, host_tag=False, max_queue_size=2,
+                                       queue_overflow='drop_newest').start()
+        for value in range(5):
+            client.send('test', value, tag1='val1')
+        assert client.queue_size() == 2
+        assert client.statuses['queued'] == 2 and client.statuses['dropped'] == 3
+
+        client.send_many('test.bulk', [1, 2, 3], [1, 2, 3], tag1='val1')
+        assert client.queue_size() == 3
+        await client.aclose(force=True)
+
+    with caplog.at_level(logging.WARNING, logger='opentsdb-py'):
+        _run(_test())
+    assert not [record for record in caplog.records if 'overflowed' in record.getMessage()]
+
+
+def test_unsupported_arguments():
+    with pytest.raises(TSDBClientException, match='send_workers, queue_overflow=block'):
+        AsyncTSDBClient(send_workers=2, queue_overflow='block')
+    with pytest.raises(TSDBClientException, match='aggregation_interval, multiprocess_dir, send_metrics_limit'):
+        AsyncTSDBClient(aggregation_interval=10, multiprocess_dir='/tmp', send_metrics_limit=100)
+
+
+class FakeAsyncConnect:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.sent = []
+
+    async def sendall(self, *metrics):
+        self.sent.append(metrics)
+        return self.results.pop(0)
+
+    def disconnect(self):
+        pass
+
+
+def test_retry_transient_rejected_points():
+    def error(value, message):
+        return {'datapoint': {'metric': 'test', 'timestamp': 1, 'value': value, 'tags': {'tag1': 'val1'}},
+                'error': message}
+
+    async def _test():
+        client = await AsyncTSDBClient(check_tsdb_alive=False, host_tag=False).start()
+        client.backoff = Backoff(0.01)
+        client._tsdb_connect = FakeAsyncConnect(
+            {'success': 1, 'failed': 2, 'errors': [error(1, 'Please throttle writes'), error(2, 'Unknown metric')]},
+            {'success': 1, 'failed': 0},
+        )
+        for value in range(3):
+            client.send('test', value, timestamp=1, tag1='val1')
+        await client.aclose()
+        return client
+
+    client = _run(_test())
+    assert [point.value for point in client._tsdb_connect.sent[1]] == [1]
+    assert client.statuses['success'] == 2
+    assert client.statuses['retried'] == 1
+    assert client.statuses['dropped'] == 1
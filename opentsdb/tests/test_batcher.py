@@ -0,0 +1,90 @@
+import queue
+import threading
+import time
+
+import pytest
+
+from opentsdb.batcher import AdaptiveBatchSize, Batcher, estimate_size
+from opentsdb.datapoint import DataPoint, PointsChunk, Series
+
+
+def _queue(count):
+    metrics_queue = queue.Queue()
+    series = Series('test.batcher', {'tag1': 'val1'})
+    for value in range(count):
+        metrics_queue.put(DataPoint(series, 1, value))
+    return metrics_queue
+
+
+def test_batch_limited_by_points():
+    batcher = Batcher(_queue(120), max_points=50)
+    assert [len(batcher.next_batch(0)) for _ in range(3)] == [50, 50, 20]
+    with pytest.raises(queue.Empty):
+        batcher.next_batch(0)
+
+
+def test_batch_limited_by_bytes():
+    metrics_queue = _queue(100)
+    point_size = estimate_size(metrics_queue.queue[0])
+    batcher = Batcher(metrics_queue, max_points=100, max_bytes=point_size * 10)
+    assert len(batcher.next_batch(0)) == 10
+
+
+def test_linger_waits_for_more_points():
+    now = [0.0]
+    metrics_queue = _queue(3)
+    batcher = Batcher(metrics_queue, max_points=50, linger=0.01, clock=lambda: now[0])
+    assert len(batcher.next_batch(0)) == 3
+
+
+def test_linger_gathers_points_arriving_in_window():
+    metrics_queue = _queue(1)
+    late = DataPoint(Series('test.batcher', {'tag1': 'val2'}), 1, 1)
+    timer = threading.Timer(0.05, metrics_queue.put, args=(late, ))
+    timer.start()
+    batcher = Batcher(metrics_queue, max_points=50, linger=1)
+    started = time.monotonic()
+    batch = batcher.next_batch(0)
+    timer.join()
+    assert len(batch) == 2 and batch[-1] is late
+    # the batch waits the whole linger for more points
+    assert time.monotonic() - started >= 1
+
+
+def test_stop_marker_put_back():
+    metrics_queue = _queue(3)
+    metrics_queue.put(StopIteration)
+    batcher = Batcher(metrics_queue, max_points=50)
+    assert len(batcher.next_batch(0)) == 3
+    with pytest.raises(StopIteration):
+        batcher.next_batch(0)
+
+
+def test_adaptive_batch_size():
+    adaptive = AdaptiveBatchSize(50, target_latency=0.1, maximum=200)
+    adaptive.observe(50, 0.01)
+    assert adaptive.size == 100
+    adaptive.observe(10, 0.01)
+    assert adaptive.size == 100
+    adaptive.observe(100, 0.01)
+    adaptive.observe(150, 0.01)
+    assert adaptive.size == 200
+    adaptive.observe(200, 0.5)
+    assert adaptive.size == 100
+
+    batcher = Batcher(_queue(300), max_points=50, adaptive=adaptive)
+    assert len(batcher.next_batch(0)) == 100
+
+
+def test_chunk_is_batch_of_its_own():
+    metrics_queue = _queue(3)
+    chunk = PointsChunk(Series('test.batcher', {'tag1': 'val1'}), [1, 2], [1, 2])
+    metrics_queue.put(chunk)
+    metrics_queue.put(chunk)
+    batcher = Batcher(metrics_queue, max_points=50)
+    assert len(batcher.next_batch(0)) == 3
+    assert batcher.pending is chunk
+    assert batcher.next_batch(0) == [chunk]
+    assert batcher.next_batch(0) == [chunk]
+    with pytest.raises(queue.Empty):
+        batcher.next_batch(0)
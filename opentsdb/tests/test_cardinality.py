@@ -0,0 +1,56 @@
+from opentsdb.cardinality import CardinalityGuard
+from opentsdb.datapoint import Series
+from opentsdb.tsdb_client import TSDBClient
+
+
+def test_collapse_over_limit():
+    guard = CardinalityGuard(max_tag_values=2)
+    tags = {'request_id': 'a', 'host': 'web01'}
+    assert guard.admit('test.requests', tags) is tags
+    assert guard.admit('test.requests', {'request_id': 'b', 'host': 'web01'}) == {'request_id': 'b', 'host': 'web01'}
+    assert guard.admit('test.requests', {'request_id': 'c', 'host': 'web01'}) == {'request_id': 'other', 'host': 'web01'}
+    assert guard.admit('test.requests', {'request_id': 'a', 'host': 'web02'}) == {'request_id': 'a', 'host': 'web02'}
+    assert guard.admit('test.other', {'request_id': 'c'}) == {'request_id': 'c'}
+
+    stats = guard.stats()
+    assert stats['collapsed'] == 1
+    assert stats['tags'] == {'test.requests request_id': {'admitted': 2, 'distinct': 3, 'throttled': 1}}
+
+
+def test_reject_over_limit():
+    guard = CardinalityGuard(max_tag_values=1, action=CardinalityGuard.REJECT)
+    assert guard.admit('test.requests', {'request_id': 'a', 'host': 'web01'}) is not None
+    assert guard.admit('test.requests', {'request_id': 'b', 'host': 'web02'}) is None
+    # values of a rejected series don't take the free places
+    assert guard.admit('test.requests', {'request_id': 'a', 'host': 'web01'}) is not None
+    assert guard.stats()['rejected'] == 1
+
+
+def test_series_rate():
+    now = [0.0]
+    guard = CardinalityGuard(max_series_rate=2, clock=lambda: now[0])
+    series = Series('test.rate', {'tag1': 'val1'})
+    assert [guard.allow(series) for _ in range(3)] == [True, True, False]
+    now[0] = 0.5
+    assert [guard.allow(series) for _ in range(2)] == [True, False]
+    assert guard.allow(Series('test.rate', {'tag1': 'val2'}))
+    assert guard.stats()['rate_limited'] == {'test.rate': 2}
+
+
+def test_client_cardinality_limit(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, run_at_once=False, max_tag_values=10, max_series_rate=5)
+    points = [client.send('test.requests', 1, request_id=index) for index in range(100)]
+    assert len({point.series for point in points}) == 11
+    assert points[-1].tags == {'request_id': 'other'}
+    # all collapsed series are limited as one
+    assert client.queue_size() == 15
+    assert client.statuses['collapsed'] == 90
+    assert client.statuses['rate_limited'] == 85
+
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, run_at_once=False, max_tag_values=1,
+                        cardinality_action='reject')
+    assert client.send('test.requests', 1, request_id=1) is not None
+    assert client.send('test.requests', 1, request_id=2) is None
+    assert client.send_many('test.requests', [1, 2], [1, 2], request_id=3) == 0
+    assert client.statuses['rejected'] == 3
+    assert client.queue_size() == 1
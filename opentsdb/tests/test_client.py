@@ -70,3 +70,43 @@ def _test_sending_metric(client: TSDBClient):
 
 def test_predefined_metrics(http_client3: TSDBClient):
     assert http_client3.PREDEFINED_METRIC.client is not None
+
+
+def test_series_merged_once(http_client: TSDBClient):
+    http_client.static_tags = {'node': 'test'}
+    point1 = http_client.send('test', 1, tag1='val1', timestamp=100)
+    point2 = http_client.send('test', 2, tag1='val1')
+    assert point1.series is point2.series
+    assert point1['tags'] == {'tag1': 'val1', 'node': 'test'}
+    assert point1['timestamp'] == 100
+    assert point1.to_dict() == dict(metric='test', timestamp=100, value=1, tags={'tag1': 'val1', 'node': 'test'})
+
+
+def test_returned_tags_read_only(http_client: TSDBClient):
+    point = http_client.send('test', 1, tag1='val1')
+    with pytest.raises(TypeError):
+        point.tags['tag1'] = 'changed'
+    point.to_dict()['tags']['tag1'] = 'changed'
+    assert http_client.send('test', 2, tag1='val1').tags == {'tag1': 'val1'}
+
+
+def test_static_tags_change_clears_series_cache(http_client: TSDBClient):
+    assert http_client.send('test', 1, tag1='val1').tags == {'tag1': 'val1'}
+    http_client.static_tags = {'node': 'test'}
+    assert http_client.send('test', 2, tag1='val1').tags == {'tag1': 'val1', 'node': 'test'}
+    with pytest.raises(TypeError):
+        http_client.static_tags['node'] = 'other'
+
+
+def test_rates_counted_without_limits(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, send_metrics_batch_limit=50)
+    for value in range(200):
+        client.send('test.rates', value, tag1='val1')
+    client.close()
+    client.wait()
+    state = client.rate_limiter.state()
+    assert state['points'] is None and state['bytes'] is None
+    assert state['total_points'] == 200
+    assert state['total_bytes'] > 0
+    assert state['points_per_second'] > 0
+    assert state['total_wait'] == 0
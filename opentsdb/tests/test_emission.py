@@ -0,0 +1,91 @@
+from opentsdb import TSDBClient, Gauge
+from opentsdb.emission import ChangeFilter
+
+
+def test_change_filter_deadband_and_heartbeat():
+    now = [0.0]
+    change_filter = ChangeFilter(deadband=0.5, heartbeat=60, clock=lambda: now[0])
+    assert [change_filter.should_emit('a', value) for value in (10, 10, 10.4, 9.6, 11, 11)] == \
+        [True, False, False, False, True, False]
+    now[0] = 60
+    assert change_filter.should_emit('a', 11)
+    assert not change_filter.should_emit('a', 11)
+    assert change_filter.should_emit('b', 11)
+    assert change_filter.stats() == {'size': 2, 'maxsize': 10000, 'emitted': 4, 'suppressed': 5, 'evictions': 0}
+
+
+def test_change_filter_values():
+    change_filter = ChangeFilter(heartbeat=0)
+    assert [change_filter.should_emit('a', value) for value in ('on', 'on', 'off', 1, 1.0)] == \
+        [True, False, True, True, False]
+    assert change_filter.should_emit('a', float('nan'))
+    assert change_filter.should_emit('a', 1)
+
+
+def test_change_filter_due():
+    now = [0.0]
+    change_filter = ChangeFilter(deadband=0.5, heartbeat=60, clock=lambda: now[0])
+    change_filter.should_emit('a', 10)
+    change_filter.should_emit('a', 10.2)
+    change_filter.should_emit('b', 1)
+    now[0] = 30
+    change_filter.should_emit('b', 5)
+    assert change_filter.due() == []
+
+    now[0] = 60
+    # the latest value of a series, also a suppressed one
+    assert change_filter.due() == [('a', 10.2)]
+    assert change_filter.should_emit('a', 10.2)
+    assert change_filter.due() == []
+
+
+def test_change_filter_bounded():
+    change_filter = ChangeFilter(maxsize=2)
+    for key in ('a', 'b', 'c'):
+        change_filter.should_emit(key, 1)
+    assert len(change_filter) == 2 and change_filter.evictions == 1
+    # the state of 'a' was evicted, so its value is emitted again
+    assert change_filter.should_emit('a', 1)
+    assert not change_filter.should_emit('c', 1)
+
+
+def test_send_deadband(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, run_at_once=False, send_deadband=0)
+    for value in (1, 1, 1, 2, 2):
+        client.send('test.deadband', value, tag1='val1')
+    client.send('test.deadband', 2, tag1='val2')
+    assert client.queue_size() == 3
+    assert client.statuses['suppressed'] == 3
+
+
+def test_gauge_deadband(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=True, run_at_once=False)
+    client.POOL_SIZE = Gauge('test.pool.size', ['pool'], deadband=1)
+    assert client.POOL_SIZE.tags('db').set(10)['value'] == 10
+    assert client.POOL_SIZE.tags('db').set(11) is None
+    assert client.POOL_SIZE.tags('cache').set(11) is not None
+    assert client.POOL_SIZE.tags('db').set(12) is not None
+    assert client.queue_size() == 3
+    assert client.statuses['suppressed'] == 1
+
+
+def test_heartbeat_of_stopped_series(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, run_at_once=False, send_deadband=0, send_heartbeat=60)
+    client.POOL_SIZE = Gauge('test.pool.size', ['pool'], deadband=0, heartbeat=60)
+    now = [0.0]
+    client.change_filter._clock = client.POOL_SIZE.change_filter._clock = lambda: now[0]
+    client.send('test.heartbeat', 1, tag1='val1')
+    client.POOL_SIZE.tags('db').set(10)
+    assert client.queue_size() == 2
+
+    client._reporter.collect(1500000000)
+    assert client.queue_size() == 2
+
+    # no updates came, the reporter sends the heartbeats
+    now[0] = 60
+    client._reporter.collect(1500000060)
+    assert client.queue_size() == 4
+    points = [client._metrics_queue.get_nowait() for _ in range(4)][2:]
+    assert sorted((point.series.metric, point.timestamp, point.value) for point in points) == [
+        ('test.heartbeat', 1500000060, 1), ('test.pool.size', 1500000060, 10.0)]
+    assert client.change_filter.due() == [] and client.POOL_SIZE.change_filter.due() == []
@@ -0,0 +1,129 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from opentsdb import TSDBClient, TSDBConnectProtocols
+from opentsdb.datapoint import DataPoint
+from opentsdb.exceptions import TransientError, TSDBNotAlive
+from opentsdb.protocols import HttpClientTSDBConnect
+
+
+class _BrokenHandler(BaseHTTPRequestHandler):
+    """Answers with a status line http.client can't parse."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.wfile.write(b'garbage\r\n\r\n')
+        self.close_connection = True
+
+
+class _ClosingHandler(BaseHTTPRequestHandler):
+    """Answers a put and closes the connection without telling the client, like an idle timeout."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({'success': 1, 'failed': 0}).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.close_connection = True
+
+
+class _TooLargeHandler(BaseHTTPRequestHandler):
+    """Rejects every put like a proxy with a body size limit."""
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(413)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+def _point(value):
+    return DataPoint.from_dict(dict(metric='test.transport', timestamp=1, value=value, tags={'tag1': 'val1'}))
+
+
+def test_send_with_http_client(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, http_transport=TSDBConnectProtocols.HTTP_CLIENT,
+                        send_metrics_batch_limit=10)
+    assert isinstance(client._tsdb_connect, HttpClientTSDBConnect)
+    assert client.is_alive()
+    for value in range(100):
+        client.send('test.transport', value, tag1='val1')
+    client.close()
+    client.wait()
+    assert client.statuses['success'] == 100
+    # all batches went through one keep-alive connection
+    assert client._tsdb_connect.connections == 1
+
+
+def test_reconnect_after_server_closed_connection():
+    server = HTTPServer(('127.0.0.1', 0), _ClosingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connect = HttpClientTSDBConnect('127.0.0.1', server.server_address[1], False, None, None)
+        assert connect.sendall(_point(1)) == {'success': 1, 'failed': 0}
+        assert connect.sendall(_point(2)) == {'success': 1, 'failed': 0}
+        assert connect.connections == 2
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_broken_response_is_transient():
+    server = HTTPServer(('127.0.0.1', 0), _BrokenHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        connect = HttpClientTSDBConnect('127.0.0.1', server.server_address[1], False, None, None)
+        with pytest.raises(TransientError):
+            connect.sendall(_point(1))
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.mark.parametrize('transport', TSDBConnectProtocols.HTTP_TRANSPORTS)
+def test_rejected_request_is_dropped(transport):
+    server = HTTPServer(('127.0.0.1', 0), _TooLargeHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = TSDBClient('127.0.0.1', server.server_address[1], check_tsdb_alive=False, host_tag=False,
+                            http_transport=transport, send_metrics_batch_limit=5)
+        for value in range(10):
+            client.send('test.transport', value, tag1='val1')
+        client.close()
+        client.wait()
+        assert client.statuses['dropped'] == 10
+        assert client.statuses['success'] == 0
+        assert client.statuses['retried'] == 0
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_not_alive():
+    connect = HttpClientTSDBConnect('127.0.0.1', 1, False, None, None)
+    assert connect.is_alive(timeout=1) is False
+    with pytest.raises(TSDBNotAlive):
+        connect.is_alive(timeout=1, raise_error=True)
+
+
+def test_import_loads_no_transport():
+    code = "import sys, opentsdb; print(' '.join(sorted(set(sys.modules) & {'requests', 'asyncio', 'http.client', 'numpy'})))"
+    assert subprocess.check_output([sys.executable, '-c', code]).strip() == b''
@@ -0,0 +1,81 @@
+from functools import partial
+import gzip
+
+from opentsdb.importer import Importer, main, parse_lines
+from opentsdb.tsdb_client import TSDBClient
+
+LINES = ''.join('test.import %d %s host=web%02d dc=1\n' % (1500000000 + index, index * 0.5, index % 3)
+                for index in range(1000))
+
+
+def test_parse_lines():
+    groups, lines, errors = parse_lines(b'# comment\n\nm 1 2 a=b\nm 2 3.5 a=b\nm 3 1e3 a=c\nm x 1 a=b\nm 1 1\n')
+    assert (lines, errors) == (5, 2)
+    assert sorted(groups) == [('m', 'a=b', [1, 2], [2, 3.5]), ('m', 'a=c', [3], [1000.0])]
+
+
+def _import(tsdb_host, tsdb_port, path, workers=1, offset=0) -> dict:
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False)
+    importer = Importer(client, workers=workers, chunk_size=4096)
+    importer.run(str(path), offset)
+    stats = importer.finish()
+    assert client.statuses['success'] == stats['points']
+    return stats
+
+
+def test_import_file(tsdb_host, tsdb_port, tmpdir):
+    path = tmpdir.join('data.txt')
+    path.write(LINES + 'broken line\n')
+    stats = _import(tsdb_host, tsdb_port, path, workers=2)
+    assert (stats['points'], stats['errors'], stats['offset']) == (1000, 1, len(LINES) + 12)
+
+
+def test_import_gzip_from_offset(tsdb_host, tsdb_port, tmpdir):
+    path = tmpdir.join('data.txt.gz')
+    with gzip.open(str(path), 'wt') as file:
+        file.write(LINES)
+    plain = tmpdir.join('data.txt')
+    plain.write(LINES)
+    offset = LINES.index('\n', len(LINES) // 2) + 1
+    for data in (path, plain):
+        assert _import(tsdb_host, tsdb_port, data, offset=offset)['points'] == LINES[offset:].count('\n')
+        # an offset inside a line skips the rest of it
+        assert _import(tsdb_host, tsdb_port, data, offset=5)['points'] == 999
+
+
+def test_import_command(tsdb_host, tsdb_port, tmpdir):
+    path, checkpoint = tmpdir.join('data.txt'), tmpdir.join('offset')
+    path.write(LINES)
+    args = [str(path), '--host', tsdb_host, '--port', str(tsdb_port), '-w', '1', '-q', '--checkpoint', str(checkpoint)]
+    assert main(args) == 0
+    assert int(checkpoint.read()) == len(LINES)
+
+
+class FakeClient:
+    """Keeps on_sent of every send_many call to answer them in any order."""
+
+    def __init__(self):
+        self.answers = []
+
+    def send_many(self, name, timestamps, values, on_sent=None, **tags):
+        self.answers.append(partial(on_sent, len(values)))
+        return len(values)
+
+
+def test_offset_of_chunks_answered_out_of_order(tmpdir):
+    path = tmpdir.join('data.txt')
+    path.write(LINES)
+    client = FakeClient()
+    importer = Importer(client, workers=1, chunk_size=len(LINES) // 4)
+    stats = importer.run(str(path))
+    assert stats['offset'] == 0 and stats['parsed_offset'] == len(LINES)
+
+    chunk_ends = [end for end, _ in importer._unconfirmed]
+    calls_per_chunk = len(client.answers) // len(chunk_ends)
+    # the last chunks are answered first, the offset waits for the first one
+    for answer in reversed(client.answers[calls_per_chunk:]):
+        answer()
+    assert importer.stats()['offset'] == 0
+    for answer in client.answers[:calls_per_chunk]:
+        answer()
+    assert importer.stats()['offset'] == len(LINES)
@@ -1,4 +1,10 @@
-from opentsdb import TSDBClient, Counter, Gauge
+import threading
+
+import pytest
+
+from opentsdb import TSDBClient, Counter, Gauge, Histogram, Summary
+from opentsdb.exceptions import TagsError
+from opentsdb.reporter import MetricsReporter
 
 
 def test_count(http_client2: TSDBClient):
@@ -26,3 +32,151 @@ def test_gauge(http_client2: TSDBClient):
     assert metric['value'] == 10
     metric = http_client2.TEST_METRIC.dec()
     assert metric['value'] == 9
+
+
+def test_histogram(http_client2: TSDBClient):
+    http_client2.TEST_HISTOGRAM = Histogram('test.metric.histogram', ['tag1'], buckets=(1, 2, 5))
+    for value in (0.5, 1.5, 3, 4):
+        http_client2.TEST_HISTOGRAM.tags('val1').observe(value)
+    http_client2.TEST_HISTOGRAM.tags('val2').observe(1)
+
+    queue_size = http_client2.queue_size()
+    assert http_client2.TEST_HISTOGRAM.collect() == 2
+    assert http_client2.queue_size() - queue_size == 12
+    assert http_client2.TEST_HISTOGRAM.collect() == 0
+
+
+def test_summary_timer(http_client2: TSDBClient):
+    summary = Summary('test.metric.summary', client=http_client2, quantiles=(0.5, 0.999))
+
+    @summary.time()
+    def do_job():
+        pass
+
+    for _ in range(10):
+        do_job()
+
+    points = []
+    http_client2.send_collected = lambda metrics: points.extend((name, value) for name, value, _ in metrics)
+    summary.collect()
+    assert [name for name, _ in points] == [
+        'test.metric.summary.count', 'test.metric.summary.sum', 'test.metric.summary.max',
+        'test.metric.summary.p50', 'test.metric.summary.p99.9']
+    assert points[0][1] == 10
+
+
+def test_labels(http_client2: TSDBClient):
+    http_client2.TEST_LABELED = Counter('test.metric.labeled', ['tag1'])
+    child = http_client2.TEST_LABELED.labels('val1')
+    assert http_client2.TEST_LABELED.labels('val1') is child
+    pytest.raises(TagsError, http_client2.TEST_LABELED.labels)
+    pytest.raises(AttributeError, setattr, child, 'tags', {})
+
+    def inc_many():
+        for _ in range(1000):
+            child.inc()
+
+    threads = [threading.Thread(target=inc_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert child.value == 8000
+    queue_size = http_client2.queue_size()
+    assert http_client2.TEST_LABELED.collect() == 1
+    assert http_client2.queue_size() - queue_size == 1
+
+
+def test_cells_of_ended_threads_released(http_client2: TSDBClient):
+    child = Counter('test.metric.released', ['tag1'], client=http_client2).labels('val1')
+    summary = Summary('test.metric.summary.released', ['tag1'], client=http_client2).labels('val1')
+
+    def work(value):
+        child.inc(value)
+        summary.observe(value)
+
+    for value in range(1, 101):
+        thread = threading.Thread(target=work, args=(value, ))
+        thread.start()
+        thread.join()
+
+    # cells of the ended threads are folded into the shared value and state
+    assert not child._value._cells and not summary._state._cells
+    assert child.value == 5050
+    assert summary._state.pop().count == 100
+
+
+def test_gauge_labels(http_client2: TSDBClient):
+    gauge = Gauge('test.metric.gauge.labeled', ['tag1'], client=http_client2).labels('val1')
+    gauge.inc(5)
+    gauge.set(10)
+    gauge.dec()
+    assert gauge.value == 9
+
+
+def test_summary_labels(http_client2: TSDBClient):
+    summary = Summary('test.metric.summary.labeled', ['tag1'], client=http_client2)
+    child = summary.labels('val1')
+    threads = [threading.Thread(target=child.observe, args=(value,)) for value in range(1, 11)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    summary.tags('val1').observe(100)
+
+    points = {}
+    http_client2.send_collected = lambda metrics: [points.setdefault(name, value) for name, value, _ in metrics]
+    assert summary.collect() == 1
+    assert points['test.metric.summary.labeled.count'] == 11
+    assert points['test.metric.summary.labeled.max'] == 100
+    assert summary.collect() == 0
+
+
+def test_snapshot_report_mode(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=True, run_at_once=False, report_mode='snapshot')
+    client.REQUESTS = Counter('test.snapshot.requests', ['handler'])
+    client.ACTIVE = Gauge('test.snapshot.active')
+    for _ in range(1000):
+        assert client.REQUESTS.tags('index').inc() is None
+    client.REQUESTS.tags('login').inc()
+    client.ACTIVE.set(5)
+    assert client.queue_size() == 0
+
+    client.LATENCY = Histogram('test.snapshot.latency', buckets=(1, 2, 5))
+    client.LATENCY.observe(1.5)
+
+    points, batches = [], []
+    send_collected = client.send_collected
+
+    def collected(metrics):
+        batches.append(len(metrics))
+        points.extend((name, value, tags['timestamp'], {k: v for k, v in tags.items() if k != 'timestamp'})
+                      for name, value, tags in metrics)
+        return send_collected(metrics)
+
+    client._reporter.send_collected = collected
+    client._reporter.collect(1500000000)
+    # each tag set counts on its own, all series of the report are queued as one batch
+    latency = [point for point in points if point[0].startswith('test.snapshot.latency.')]
+    assert sorted(point for point in points if point not in latency) == [
+        ('test.snapshot.active', 5.0, 1500000000, {}),
+        ('test.snapshot.requests', 1, 1500000000, {'handler': 'login'}),
+        ('test.snapshot.requests', 1000, 1500000000, {'handler': 'index'})]
+    assert len(latency) == 3 + len(client.LATENCY.quantiles)
+    assert all(point[2] == 1500000000 for point in latency)
+    assert batches == [len(points)]
+    assert client.queue_size() == len(points)
+
+    # unchanged series are sent again each interval, histograms only with new observations
+    points.clear()
+    client._reporter.collect(1500000010)
+    assert len(points) == 3 and all(point[2] == 1500000010 for point in points)
+
+
+def test_aligned_reporter_tick():
+    now = [1500000003.5]
+    reporter = MetricsReporter(10, threading.Event(), aligned=True, clock=lambda: now[0])
+    assert reporter.next_tick() == 1500000010
+    now[0] = 1500000010
+    assert reporter.next_tick() == 1500000020
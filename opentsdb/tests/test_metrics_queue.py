@@ -0,0 +1,133 @@
+import logging
+import queue
+import threading
+
+import pytest
+
+from opentsdb import TSDBClient
+from opentsdb.batcher import estimate_size
+from opentsdb.datapoint import DataPoint, Series
+from opentsdb.metrics_queue import MetricsQueue
+
+SERIES = Series('test.queue', {'tag1': 'val1'})
+
+
+def _points(count):
+    return [DataPoint(SERIES, 1, value) for value in range(count)]
+
+
+def _values(metrics_queue):
+    values = []
+    while not metrics_queue.empty():
+        values.append(metrics_queue.get_nowait().value)
+    return values
+
+
+def test_queue_semantics():
+    metrics_queue = MetricsQueue(2)
+    first, second, third = _points(3)
+    metrics_queue.put(first)
+    metrics_queue.put_nowait(second)
+    assert metrics_queue.full()
+    with pytest.raises(queue.Full):
+        metrics_queue.put_nowait(third)
+    with pytest.raises(queue.Full):
+        metrics_queue.put(third, timeout=0.01)
+
+    assert metrics_queue.get() is first
+    assert metrics_queue.get_nowait() is second
+    with pytest.raises(queue.Empty):
+        metrics_queue.get(timeout=0.01)
+
+
+def test_overflow_drop_newest():
+    metrics_queue = MetricsQueue(3, overflow=MetricsQueue.DROP_NEWEST)
+    points = _points(5)
+    assert [metrics_queue.offer(point) for point in points[:3]] == [(), (), ()]
+    assert metrics_queue.offer(points[3]) == (points[3], )
+    assert metrics_queue.offer(points[4]) == (points[4], )
+    assert _values(metrics_queue) == [0, 1, 2]
+    assert metrics_queue.overflowed == 2
+
+
+def test_overflow_drop_oldest():
+    metrics_queue = MetricsQueue(3, overflow=MetricsQueue.DROP_OLDEST)
+    points = _points(5)
+    dropped = [metrics_queue.offer(point) for point in points]
+    assert dropped[3] == (points[0], ) and dropped[4] == (points[1], )
+    assert _values(metrics_queue) == [2, 3, 4]
+
+
+def test_overflow_block():
+    metrics_queue = MetricsQueue(1, overflow=MetricsQueue.BLOCK, block_timeout=0.01)
+    first, second, third = _points(3)
+    metrics_queue.offer(first)
+    assert metrics_queue.offer(second) == (second, )
+
+    metrics_queue.block_timeout = 5
+    threading.Timer(0.05, metrics_queue.get).start()
+    assert metrics_queue.offer(third) == ()
+    assert _values(metrics_queue) == [2]
+
+
+def test_overflow_sample():
+    metrics_queue = MetricsQueue(2, overflow=MetricsQueue.SAMPLE, sample_every=3)
+    for point in _points(8):
+        metrics_queue.offer(point)
+    # every third overflowing point replaces the oldest one
+    assert _values(metrics_queue) == [4, 7]
+    assert metrics_queue.overflowed == 6
+
+
+def test_bounded_by_bytes():
+    point_size = estimate_size(_points(1)[0])
+    metrics_queue = MetricsQueue(max_bytes=point_size * 3)
+    for point in _points(5):
+        metrics_queue.offer(point)
+    assert metrics_queue.qsize() == 3 and metrics_queue.bytes == point_size * 3
+    assert _values(metrics_queue) == [2, 3, 4]
+    assert metrics_queue.bytes == 0
+
+    # a point larger than the whole limit still goes into an empty queue
+    metrics_queue.max_bytes = point_size // 2
+    metrics_queue.put_nowait(_points(1)[0])
+    assert metrics_queue.qsize() == 1
+
+
+def test_close_marker_never_dropped():
+    metrics_queue = MetricsQueue(1)
+    metrics_queue.put(StopIteration)
+    point = _points(1)[0]
+    assert metrics_queue.offer(point) == (point, )
+    assert metrics_queue.get_nowait() is StopIteration
+
+
+def test_overflow_logged_once_per_interval(caplog):
+    now = [0.0]
+    metrics_queue = MetricsQueue(1, overflow=MetricsQueue.DROP_NEWEST, clock=lambda: now[0])
+    with caplog.at_level(logging.WARNING, logger='opentsdb-py'):
+        for point in _points(100):
+            metrics_queue.offer(point)
+        assert not caplog.records
+        now[0] = MetricsQueue.LOG_INTERVAL
+        metrics_queue.offer(_points(1)[0])
+    assert len(caplog.records) == 1
+    assert '100 metrics overflowed' in caplog.records[0].getMessage()
+
+
+def test_client_queue_overflow(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, run_at_once=False, max_queue_size=3,
+                        queue_overflow='drop_newest')
+    for value in range(5):
+        client.send('test.overflow', value, tag1='val1')
+    assert client.queue_size() == 3
+    assert client.statuses['queued'] == 3 and client.statuses['dropped'] == 2
+    assert _values(client._metrics_queue) == [0, 1, 2]
+
+
+def test_offer_many():
+    metrics_queue = MetricsQueue(3, overflow=MetricsQueue.DROP_OLDEST)
+    points = _points(5)
+    assert metrics_queue.offer_many(points) == tuple(points[:2])
+    assert _values(metrics_queue) == [2, 3, 4]
+    assert metrics_queue.overflowed == 2
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+from opentsdb import TSDBClient, Counter, Gauge, ValidationError
+from opentsdb.datapoint import DataPoint, Series
+from opentsdb.multiprocess import MmapValues, MultiprocessAggregator, mark_process_dead
+
+
+def test_mmap_values_grow_and_reopen(tmpdir):
+    path = str(tmpdir.join('values.db'))
+    values = MmapValues(path, initial_size=64)
+    for index in range(100):
+        values.set('series.%d' % index, index, 1)
+    values.set('series.0', 42, 2)
+    values.close()
+
+    entries = MmapValues.read_file(path)
+    assert len(entries) == 100
+    assert entries[0][0] == 'series.0' and entries[0][2:] == (42, 2)
+
+    values = MmapValues(path)
+    values.set('series.1', 7, 3)
+    values.close()
+    assert len(MmapValues.read_file(path)) == 100
+
+
+def test_combine_processes(tmpdir):
+    pushed = []
+    aggregator = MultiprocessAggregator(str(tmpdir), pushed.append, 10, None, {'test.counter': 'sum'})
+    counter, gauge = Series('test.counter', {'tag1': 'val1'}), Series('test.gauge', {'tag1': 'val1'})
+    aggregator.add(DataPoint(counter, 100, 5))
+    aggregator.add(DataPoint(gauge, 100, 1))
+
+    other_process = MultiprocessAggregator(str(tmpdir), pushed.append, 10, None, {'test.counter': 'sum'})
+    other_process._values = MmapValues(str(tmpdir.join('tsdb_0.db')))
+    other_process.add(DataPoint(counter, 101, 3))
+    other_process.add(DataPoint(gauge, 99, 2))
+
+    assert aggregator.flush() == 2
+    assert sorted((point.metric, point.timestamp, point.value) for point in pushed) == [
+        ('test.counter', 101, 8), ('test.gauge', 100, 1)]
+
+    assert aggregator.flush() == 0
+    other_process.add(DataPoint(gauge, 102, 3))
+    assert aggregator.flush() == 1
+    assert pushed[-1].value == 3
+
+
+def test_mark_process_dead(tmpdir):
+    counter, gauge = Series('test.counter', {'tag1': 'val1'}), Series('test.gauge', {'tag1': 'val1'})
+    for pid in (1, 2):
+        aggregator = MultiprocessAggregator(str(tmpdir), None, 10, None, {'test.counter': 'total'})
+        aggregator._values = MmapValues(str(tmpdir.join('tsdb_%d.db' % pid)))
+        aggregator.add(DataPoint(counter, 100 + pid, 5))
+        aggregator.add(DataPoint(gauge, 100 + pid, 1))
+        aggregator._values.close()
+        assert mark_process_dead(pid, str(tmpdir)) == 1
+    assert mark_process_dead(3, str(tmpdir)) == 0
+
+    entries = MmapValues.read_file(str(tmpdir.join(MultiprocessAggregator.DEAD_FILE)))
+    assert [entry[2:] for entry in entries] == [(10, 102)]
+
+
+def test_non_numeric_value_rejected(tmpdir):
+    aggregator = MultiprocessAggregator(str(tmpdir), None, 10, None)
+    with pytest.raises(ValidationError):
+        aggregator.add(DataPoint(Series('test.value', {'tag1': 'val1'}), 1, 'text'))
+
+
+@pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs fork")
+def test_forked_workers_aggregated(tsdb_host, tsdb_port, tmpdir):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, static_tags={'tag1': 'val1'},
+                        multiprocess_dir=str(tmpdir))
+    client.REQUESTS = Counter('test.multiprocess.requests')
+    client.WORKERS = Gauge('test.multiprocess.workers', multiprocess_mode='sum')
+    client.REQUESTS.inc()
+    client.WORKERS.inc()
+    assert client._aggregator.is_exporter()
+
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            # nothing is started in the at-fork handler, the first update starts the client
+            assert client._fork_pending and client._aggregator is None
+            client.REQUESTS.inc(2)
+            assert client._metric_send_thread.is_alive()
+            assert not client._aggregator.is_exporter()
+            client.WORKERS.inc()
+            code = 0
+        finally:
+            os._exit(code)
+    _, status = os.waitpid(pid, 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+
+    assert sorted(value for value, _ in client._aggregator.collect().values()) == [2, 3]
+    assert client._aggregator.flush() == 2
+    values = {key: value for key, _, value, _ in MmapValues.read_file(
+        str(tmpdir.join('tsdb_%d.db' % pid)))}
+    assert sorted(values.values()) == [1, 2]
+
+    # counter total of the dead worker is kept, its gauge is dropped
+    assert mark_process_dead(pid, str(tmpdir)) == 1
+    assert not tmpdir.join('tsdb_%d.db' % pid).exists()
+    assert sorted(value for value, _ in client._aggregator.collect().values()) == [1, 3]
+    client.close()
+    client.wait()
+    assert client.statuses['success'] == 3
@@ -0,0 +1,37 @@
+from opentsdb import TSDBClient
+from opentsdb.datapoint import DataPoint
+from opentsdb.metrics_queue import ShardedQueue
+
+
+def _metric(name, value, **tags):
+    return DataPoint.from_dict(dict(metric=name, timestamp=1, value=value, tags=tags))
+
+
+def test_sharded_queue_keeps_series_in_one_shard():
+    sharded_queue = ShardedQueue(4, maxsize=100)
+    for value in range(10):
+        sharded_queue.put(_metric('test', value, tag1='val1', tag2='val2'))
+        sharded_queue.put(_metric('test', value, tag2='val2', tag1='val1'))
+
+    assert sharded_queue.qsize() == 20
+    assert sorted(shard.qsize() for shard in sharded_queue.shards) == [0, 0, 0, 20]
+    assert all(shard.maxsize == 25 for shard in sharded_queue.shards)
+
+
+def test_sharded_queue_stop_all_shards():
+    sharded_queue = ShardedQueue(3)
+    sharded_queue.put(StopIteration)
+    assert all(shard.get_nowait() is StopIteration for shard in sharded_queue.shards)
+    assert sharded_queue.empty()
+
+
+def test_send_through_pool(http_pool_client: TSDBClient):
+    assert len(http_pool_client._metric_send_thread.threads) == 4
+    for index in range(200):
+        http_pool_client.send('test.pool', index, series=index)
+
+    http_pool_client.close()
+    http_pool_client.wait()
+    assert http_pool_client.is_connected() is False
+    assert http_pool_client.queue_size() == 0
+    assert http_pool_client.statuses['success'] == 200
@@ -0,0 +1,138 @@
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import json
+import math
+import threading
+
+import pytest
+
+from opentsdb import QueryError
+from opentsdb.query import QueryClient, QueryResponseParser, QuerySeries, parse_duration, to_timestamp
+
+RESPONSE = json.dumps([
+    {'metric': 'sys.cpu', 'tags': {'host': 'web1'}, 'aggregateTags': ['core'],
+     'dps': {'1500000000': 1.5, '1500000060': 2, '1500000120': None}},
+    {'metric': 'sys.cpu', 'tags': {'host': 'web2'}, 'aggregateTags': [], 'dps': {}},
+], indent=1)
+
+
+def _parse(text: str, chunk_size: int) -> list:
+    parser = QueryResponseParser()
+    for index in range(0, len(text), chunk_size):
+        parser.feed(text[index:index + chunk_size])
+    return parser.close()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 4096])
+def test_parse_in_chunks(chunk_size):
+    first, second = _parse(RESPONSE, chunk_size)
+    assert (first.metric, first.tags, first.aggregated_tags) == ('sys.cpu', {'host': 'web1'}, ['core'])
+    assert list(first.timestamps) == [1500000000, 1500000060, 1500000120]
+    assert list(first.values[:2]) == [1.5, 2.0] and math.isnan(first.values[2])
+    assert second.tags == {'host': 'web2'} and len(second) == 0
+
+
+def test_parse_arrays_format():
+    text = '[{"metric":"m","tags":{},"dps":[[1500000000000,1],[1500000000500,-2.5e3]]}]'
+    series, = _parse(text, 5)
+    assert list(series.timestamps) == [1500000000000, 1500000000500]
+    assert list(series.values) == [1, -2500]
+
+
+def test_parse_incomplete_response():
+    with pytest.raises(QueryError):
+        _parse(RESPONSE[:-10], 100)
+
+
+def test_durations():
+    assert parse_duration('15m-avg') == 900
+    assert parse_duration('0all-sum') is None
+    assert to_timestamp('1h-ago', now=10000) == 6400
+    assert to_timestamp(1500000000.5) == 1500000000
+
+
+class FakeQueryClient(QueryClient):
+    REFETCH_SECONDS = 0
+
+    def __init__(self):
+        super().__init__('127.0.0.1', 4242)
+        self.fetches = []
+
+    def _fetch(self, sub_query, start, end, ms):
+        self.fetches.append((start, end))
+        timestamps = list(range(start - start % 10, end + 1, 10))
+        return [QuerySeries('m', {'host': 'web1'}, [], timestamps, [float(ts) for ts in timestamps])]
+
+
+def test_query_cache_reuses_windows():
+    client = FakeQueryClient()
+    series, = client.query('m', 1000, 2000)
+    assert len(series) == 101
+
+    series, = client.query('m', 1500, 1600)
+    assert (series.timestamps[0], series.timestamps[-1]) == (1500, 1600)
+    assert client.fetches == [(1000, 2000)]
+
+    series, = client.query('m', 1500, 2500)
+    assert client.fetches[-1] == (2000, 2500)
+    assert list(series.timestamps) == list(range(1500, 2501, 10))
+    assert client.cache.stats()['hits'] == 1 and client.cache.stats()['partial_hits'] == 1
+
+    client.query('m', 1500, 2500, downsample='0all-sum')
+    client.query('m', 1500, 2500, downsample='0all-sum')
+    assert client.fetches[-1] == (1500, 2500) and len(client.fetches) == 3
+
+
+class FakeResponse:
+    status_code = 200
+
+    def json(self):
+        return [{'metric': 'm', 'timestamp': 1500000000, 'value': '3.5', 'tags': {'host': 'web1'}}]
+
+    def close(self):
+        pass
+
+
+def test_query_last(monkeypatch):
+    client = QueryClient('127.0.0.1', 4242)
+    monkeypatch.setattr(client._session, 'post', lambda url, json, timeout: FakeResponse())
+    point, = client.query_last('m', back_scan=24)
+    assert (point.metric, point.timestamp, point.value, point.tags) == ('m', 1500000000, 3.5, {'host': 'web1'})
+
+
+def test_query_cache_sliding_window():
+    client = FakeQueryClient()
+    for start in range(1000, 5000, 100):
+        series, = client.query('m', start, start + 1000)
+        assert (series.timestamps[0], series.timestamps[-1]) == (start, start + 1000)
+    # the cached window moves with the queries instead of growing
+    cached_start, cached_end, (cached, ) = next(iter(client.cache._windows.values()))
+    assert (cached_start, cached_end) == (4900, 5900) and len(cached) == 101
+    assert client.cache.stats()['partial_hits'] == 39
+
+
+class _QueryHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        query = json.loads(self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8'))
+        body = RESPONSE.encode('utf-8') if 'start' in query else json.dumps(FakeResponse().json()).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_query_with_http_client():
+    server = HTTPServer(('127.0.0.1', 0), _QueryHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        client = QueryClient('127.0.0.1', server.server_address[1], http_transport='http.client')
+        first, second = client.query('sys.cpu', 1500000000, 1500000200)
+        assert list(first.timestamps) == [1500000000, 1500000060, 1500000120] and len(second) == 0
+        point, = client.query_last('m')
+        assert (point.metric, point.value) == ('m', 3.5)
+    finally:
+        server.shutdown()
+        server.server_close()
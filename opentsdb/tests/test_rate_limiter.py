@@ -0,0 +1,86 @@
+import threading
+
+from opentsdb.rate_limiter import TokenBucket, RateLimiter
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def test_burst_without_waiting():
+    clock = FakeClock()
+    bucket = TokenBucket(100, 10, clock=clock)
+    assert all(bucket.acquire(1, clock.sleep) == 0 for _ in range(10))
+    assert clock.now == 0
+
+
+def test_wait_when_bucket_empty():
+    clock = FakeClock()
+    bucket = TokenBucket(100, 10, clock=clock)
+    bucket.acquire(10, clock.sleep)
+    assert bucket.acquire(50, clock.sleep) == 0.5
+    assert clock.now == 0.5
+    assert bucket.tokens == 0
+
+
+def test_refill_up_to_capacity():
+    clock = FakeClock()
+    bucket = TokenBucket(100, 10, clock=clock)
+    bucket.acquire(10, clock.sleep)
+    clock.now += 60
+    assert bucket.state() == {'rate': 100, 'capacity': 10, 'tokens': 10}
+
+
+def test_rate_limiter_points_and_bytes():
+    clock = FakeClock()
+    limiter = RateLimiter(points_per_second=10, bytes_per_second=1000, clock=clock)
+    limiter.acquire_points(20, clock.sleep)
+    limiter.acquire_bytes(3000, clock.sleep)
+
+    state = limiter.state()
+    assert state['total_points'] == 20
+    assert state['total_bytes'] == 3000
+    assert state['total_wait'] == 3.0
+
+
+def test_disabled_rate_limiter():
+    assert not RateLimiter()
+    assert RateLimiter(points_per_second=1)
+
+
+def test_rate_limiter_rates():
+    clock = FakeClock()
+    limiter = RateLimiter(clock=clock)
+    clock.now = 2
+    limiter.acquire_points(100)
+    limiter.acquire_bytes(5000)
+    assert limiter.state()['points_per_second'] == 50
+    clock.now = 10
+    limiter.acquire_points(100)
+    clock.now = 15
+    state = limiter.state()
+    # points of the last full window (0-10s), no bytes were sent since the first ones
+    assert state['points_per_second'] == 10 and state['bytes_per_second'] == 5000 / 15
+    assert state['total_points'] == 200
+
+
+def test_rate_limiter_counts_from_threads():
+    limiter = RateLimiter()
+
+    def acquire():
+        for _ in range(10000):
+            limiter.acquire_points(1)
+
+    threads = [threading.Thread(target=acquire) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.total_points == 40000
@@ -0,0 +1,184 @@
+from http.client import BadStatusLine, IncompleteRead
+import queue
+import threading
+
+import pytest
+
+from opentsdb.datapoint import DataPoint, PointsChunk, Series
+from opentsdb.exceptions import RejectedError, TransientError
+from opentsdb.protocols.http_connect import HttpTSDBConnect
+from opentsdb.push_thread import HTTPPushThread
+from opentsdb.rate_limiter import RateLimiter
+from opentsdb.retry import Backoff, CircuitBreaker, is_transient_error, is_transient_point_error
+from opentsdb.telemetry import Telemetry
+
+
+class FakeConnect:
+    def __init__(self, *results):
+        self.results = list(results)
+        self.stopped = threading.Event()
+        self.bytes_sent = 0
+
+    def sendall(self, *metrics):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    def disconnect(self):
+        pass
+
+
+def _push_thread(connect, max_retries=5):
+    return HTTPPushThread(connect, queue.Queue(), threading.Event(), RateLimiter(), 50, Telemetry(),
+                          max_retries=max_retries, circuit_breaker_threshold=2)
+
+
+def _points(count):
+    series = Series('test', {'tag1': 'val1'})
+    return [DataPoint(series, 1, value) for value in range(count)]
+
+
+def test_retry_only_transient_rejected_points():
+    points = _points(3)
+    connect = FakeConnect({'success': 1, 'failed': 2, 'errors': [
+        {'datapoint': points[1].to_dict(), 'error': 'Unable to write to HBase: RegionTooBusyException'},
+        {'datapoint': points[2].to_dict(), 'error': 'Unknown metric'},
+    ]})
+    push_thread = _push_thread(connect)
+    push_thread.send(points)
+
+    assert push_thread.statuses['dropped'] == 1
+    assert push_thread.statuses['retried'] == 1
+    assert push_thread._retries[0][2:] == (1, [points[1]])
+    assert push_thread.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_rejected_chunk_points_retried_as_chunk():
+    sent = []
+    points = _points(3)
+    chunk = PointsChunk(points[0].series, [1, 1, 1], [0, 1, 2], sent.append)
+    connect = FakeConnect({'success': 1, 'failed': 2, 'errors': [
+        {'datapoint': points[1].to_dict(), 'error': 'Unable to write to HBase: RegionTooBusyException'},
+        {'datapoint': points[2].to_dict(), 'error': 'Unknown metric'},
+    ]}, {'success': 1, 'failed': 0})
+    push_thread = _push_thread(connect)
+    push_thread.send([chunk])
+    # the accepted and the invalid point are answered, the retried one is not yet
+    assert sent == [2]
+
+    retried, = push_thread._retries[0][3]
+    assert type(retried) is PointsChunk and retried.values == [1] and retried.on_sent is chunk.on_sent
+    push_thread.send([retried], 1)
+    assert sent == [2, 1]
+
+
+def test_transient_exception_is_retried_with_backoff():
+    connect = FakeConnect(ConnectionError('refused'))
+    push_thread = _push_thread(connect)
+    push_thread.send(_points(2))
+
+    assert push_thread.statuses['retried'] == 2
+    assert push_thread._next_retry() == (None, 0)
+    assert 0 < push_thread._next_wait_timeout() <= 0.5
+
+
+def test_failed_send_does_not_grow_batch():
+    connect = FakeConnect(ConnectionRefusedError(), {'success': 50, 'failed': 0}, {'success': 50, 'failed': 0})
+    connect.encode_seconds, connect.connections = 0.0, 0
+    close_client = threading.Event()
+    push_thread = HTTPPushThread(connect, queue.Queue(), close_client, RateLimiter(), 50, Telemetry(),
+                                 max_retries=0, send_batch_target_latency=10)
+    for point in _points(150):
+        push_thread.metrics_queue.put(point)
+    close_client.set()
+    push_thread.run()
+
+    assert push_thread.statuses['dropped'] == 50 and push_thread.statuses['success'] == 100
+    # only the first answered batch grew the size, the last one was partial
+    assert push_thread.batcher.batch_size == 100
+
+
+def test_poisoned_batch_is_dropped():
+    connect = FakeConnect(TypeError('not serializable'), TypeError('not serializable'))
+    push_thread = _push_thread(connect)
+    push_thread.send(_points(2))
+    push_thread.send(_points(2))
+
+    assert push_thread.statuses['dropped'] == 4
+    assert not push_thread._retries
+    assert push_thread.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_drop_after_max_retries():
+    push_thread = _push_thread(FakeConnect(ConnectionError('refused')), max_retries=2)
+    push_thread.send(_points(2), attempt=2)
+    assert push_thread.statuses['dropped'] == 2
+
+
+def test_retry_forever():
+    push_thread = _push_thread(FakeConnect(ConnectionError('refused')), max_retries=-1)
+    push_thread.send(_points(2), attempt=100)
+    assert push_thread.statuses['dropped'] == 0 and push_thread.statuses['retried'] == 2
+
+
+@pytest.mark.parametrize('error, transient', [
+    (ConnectionRefusedError(), True),
+    (TransientError('503'), True),
+    (BadStatusLine(''), True),
+    (IncompleteRead(b''), True),
+    (TypeError('not serializable'), False),
+    (ValueError('invalid'), False),
+])
+def test_transient_error_types(error, transient):
+    assert is_transient_error(error) is transient
+
+
+@pytest.mark.parametrize('status, error', [(503, TransientError), (429, TransientError), (502, TransientError)])
+def test_transient_statuses(status, error):
+    with pytest.raises(error):
+        HttpTSDBConnect.parse_put_response(status, b'')
+    assert HttpTSDBConnect.parse_put_response(400, b'{"failed": 1}') == {'failed': 1}
+
+
+@pytest.mark.parametrize('status, body', [(413, b''), (400, b'{"error": {"code": 400}}'), (404, b'<html></html>')])
+def test_rejected_statuses(status, body):
+    with pytest.raises(RejectedError):
+        HttpTSDBConnect.parse_put_response(status, body)
+    assert not is_transient_error(RejectedError())
+
+
+def test_transient_point_errors():
+    assert is_transient_point_error('Storage exception: org.hbase.async.RemoteException')
+    assert is_transient_point_error('Please throttle writes: 10000 RPCs waiting on "tsdb"')
+    assert is_transient_point_error('Unable to write: org.hbase.async.RegionTooBusyException: too busy')
+    assert not is_transient_point_error('Unknown metric')
+    # words of the message are not enough, an exception type or a storage failure is
+    assert not is_transient_point_error('Invalid value: rpc timeout')
+
+
+def test_circuit_breaker():
+    now = [0.0]
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    assert breaker.wait_time() == 10
+
+    now[0] = 10
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+    now[0] = 20
+    assert breaker.wait_time() == 0
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_backoff_bounds():
+    backoff = Backoff(base=1, maximum=8)
+    assert 0.5 <= backoff.delay(0) <= 1
+    assert 4 <= backoff.delay(3) <= 8
+    assert 4 <= backoff.delay(10) <= 8
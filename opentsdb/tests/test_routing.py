@@ -0,0 +1,136 @@
+import os
+import subprocess
+import sys
+import threading
+
+from opentsdb import TSDBClient
+from opentsdb.datapoint import DataPoint, Series
+from opentsdb.push_thread import HTTPPushThread
+from opentsdb.rate_limiter import RateLimiter
+from opentsdb.routing import HashRing, HealthChecker, RoutingQueue, parse_endpoint
+from opentsdb.telemetry import Telemetry
+
+
+def _point(index, value=1):
+    return DataPoint(Series('test.routing', {'series': str(index)}), 1, value)
+
+
+def test_parse_endpoint():
+    assert parse_endpoint('tsdb1', 4242) == ('tsdb1', 4242, None)
+    assert parse_endpoint('tsdb1:4343', 4242) == ('tsdb1', 4343, None)
+    assert parse_endpoint('https://tsdb1:8443/opentsdb/', 4242) == ('tsdb1', 8443, 'https://tsdb1:8443/opentsdb')
+
+
+def test_hash_ring_moves_only_removed_node_keys():
+    ring = HashRing(range(4))
+    before = {key: ring.get(hash('series-%d' % key)) for key in range(1000)}
+    assert set(before.values()) == {0, 1, 2, 3}
+
+    ring.remove(2)
+    after = {key: ring.get(hash('series-%d' % key)) for key in range(1000)}
+    assert all(after[key] == node for key, node in before.items() if node != 2)
+    assert 2 not in after.values()
+
+
+def test_hash_routing_keeps_series_on_node():
+    routing_queue = RoutingQueue(3, maxsize=300)
+    for value in range(10):
+        routing_queue.put(_point(7, value))
+    assert sorted(shard.qsize() for shard in routing_queue.shards) == [0, 0, 10]
+
+
+def test_round_robin_routing():
+    routing_queue = RoutingQueue(3, routing=RoutingQueue.ROUND_ROBIN)
+    for value in range(30):
+        routing_queue.put(_point(7, value))
+    assert [shard.qsize() for shard in routing_queue.shards] == [10, 10, 10]
+
+
+def test_eject_reroutes_queued_points():
+    routing_queue = RoutingQueue(3)
+    for index in range(100):
+        routing_queue.put(_point(index))
+    node = max(range(3), key=lambda index: routing_queue.shards[index].qsize())
+
+    routing_queue.eject(node)
+    assert routing_queue.healthy == sorted(set(range(3)) - {node})
+    assert routing_queue.shards[node].qsize() == 0
+    assert routing_queue.qsize() == 100
+
+    routing_queue.rejoin(node)
+    assert routing_queue.healthy == [0, 1, 2]
+
+
+def test_rerouted_overflow_counted_as_dropped():
+    telemetry = Telemetry()
+    routing_queue = RoutingQueue(2, maxsize=10, overflow='drop_newest', telemetry=telemetry)
+    points = [_point(index) for index in range(100)]
+    for node in range(2):
+        for point in [point for point in points if routing_queue.shard_for(point) is routing_queue.shards[node]][:5]:
+            routing_queue.put(point)
+
+    routing_queue.eject(0)
+    assert routing_queue.shards[1].qsize() == 5
+    assert telemetry.statuses['dropped'] == 5
+
+
+def test_routing_same_in_all_processes():
+    code = ("from opentsdb.datapoint import Series; from opentsdb.routing import RoutingQueue; "
+            "from opentsdb.tests.test_routing import _point; routing_queue = RoutingQueue(5); "
+            "print([routing_queue.shards.index(routing_queue.shard_for(_point(index))) for index in range(50)])")
+    routes = set()
+    for seed in ('1', '2'):
+        env = dict(os.environ, PYTHONHASHSEED=seed)
+        routes.add(subprocess.check_output([sys.executable, '-c', code], env=env))
+    assert len(routes) == 1
+
+
+def test_ejected_node_retries_rerouted():
+    routing_queue = RoutingQueue(2)
+    push_thread = HTTPPushThread(None, routing_queue.shards[0], threading.Event(), RateLimiter(), 50, Telemetry())
+    points = [_point(index) for index in range(10)]
+    push_thread._retry(points[:5], 0)
+    assert len(push_thread._retries) == 1
+
+    routing_queue.eject(0)
+    push_thread._reroute_retries()
+    push_thread._retry(points[5:], 1)
+    assert not push_thread._retries and routing_queue.shards[1].qsize() == 10
+
+    # with all nodes down the points stay for a retry
+    routing_queue.eject(1)
+    push_thread._retry(points[:1], 1)
+    assert len(push_thread._retries) == 1
+
+
+class FakeConnect:
+    tsdb_host, tsdb_port = '127.0.0.1', 4242
+
+    def __init__(self):
+        self.alive = True
+
+    def is_alive(self, timeout=3):
+        return self.alive
+
+
+def test_health_checker():
+    connects = [FakeConnect(), FakeConnect()]
+    checker = HealthChecker(connects, RoutingQueue(2), 10, threading.Event())
+    assert checker.check() == [0, 1]
+    connects[1].alive = False
+    assert checker.check() == [0]
+    connects[1].alive = True
+    assert checker.check() == [0, 1]
+
+
+def test_send_to_endpoints(tsdb_host, tsdb_port):
+    client = TSDBClient(host_tag=False, endpoints=['%s:%d' % (tsdb_host, tsdb_port), '127.0.0.1:1'],
+                        send_workers=2, health_check_interval=60)
+    assert len(client._metric_send_thread.threads) == 4
+    assert client._health_checker.check() == [0]
+
+    for index in range(100):
+        client.send('test.routing', index, series=index)
+    client.close()
+    client.wait()
+    assert client.statuses['success'] == 100
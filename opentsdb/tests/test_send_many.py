@@ -0,0 +1,67 @@
+import array
+
+import pytest
+
+from opentsdb.datapoint import DataPoint, PointsChunk, Series, iter_points, points_count
+from opentsdb.exceptions import ValidationError
+from opentsdb.protocols.encoders import JSONBatchEncoder
+from opentsdb.protocols.telnet_connect import TelnetTSDBConnect
+from opentsdb.tsdb_client import TSDBClient
+
+
+def _chunk():
+    return PointsChunk(Series('test.chunk', {'tag1': 'val1'}), [100, 101, 102], [1, 2.5, float('nan')])
+
+
+def test_chunk_encoded_as_points():
+    chunk = _chunk()
+    points = list(chunk)
+    assert points[1] == DataPoint(chunk.series, 101, 2.5)
+
+    encoder = JSONBatchEncoder()
+    assert encoder.encode([chunk]) == encoder.encode(points)
+    assert encoder.encode([points[0], chunk]) == encoder.encode([points[0]] + points)
+    assert TelnetTSDBConnect.format_metric(chunk) == b''.join(TelnetTSDBConnect.format_metric(p) for p in points)
+
+
+def test_points_count():
+    chunk = _chunk()
+    point = DataPoint(chunk.series, 100, 1)
+    assert points_count([chunk, point]) == 4
+    assert [p.timestamp for p in iter_points([point, chunk])] == [100, 100, 101, 102]
+
+
+def test_send_many_validation(http_client: TSDBClient):
+    pytest.raises(ValidationError, http_client.send_many, 'test', [1, 2], [1], tag1='val1')
+    pytest.raises(ValidationError, http_client.send_many, 'test', [1], [b''], tag1='val1')
+    pytest.raises(ValidationError, http_client.send_many, 'test', [1], [1])
+    assert http_client.send_many('test', [], [], tag1='val1') == 0
+    http_client.close()
+    http_client.wait()
+
+
+def test_send_many_chunks(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, run_at_once=False, send_many_chunk_size=4)
+    timestamps = array.array('q', range(1500000000000, 1500000000010))
+    assert client.send_many('test.many', timestamps, array.array('d', range(10)), tag1='val1') == 10
+    assert client.queue_size() == 3
+    chunk = client._metrics_queue.get_nowait()
+    assert (len(chunk), chunk.timestamps[0], chunk.values[0]) == (4, 1500000000000, 0.0)
+    assert client.statuses['queued'] == 10
+
+
+def _test_send_many(client: TSDBClient):
+    client.send('test.many', 1, tag1='val1')
+    assert client.send_many('test.many', range(1000, 1100), [index * 1.5 for index in range(100)], tag1='val1') == 100
+    client.close()
+    client.wait()
+    assert client.queue_size() == 0
+    assert client.statuses['success'] == 101
+
+
+def test_send_many_through_http(http_client: TSDBClient):
+    _test_send_many(http_client)
+
+
+def test_send_many_through_telnet(telnet_client: TSDBClient):
+    _test_send_many(telnet_client)
@@ -0,0 +1,30 @@
+from opentsdb import TSDBClient
+from opentsdb.datapoint import Series
+from opentsdb.series_cache import SeriesCache
+
+
+def test_lru_eviction():
+    cache = SeriesCache(maxsize=2)
+    for name in ('a', 'b'):
+        cache.put((name, ()), Series(name, {'tag1': 'val1'}))
+    assert cache.get(('a', ())) is not None
+    cache.put(('c', ()), Series('c', {'tag1': 'val1'}))
+
+    assert cache.get(('b', ())) is None
+    assert cache.get(('a', ())) is not None
+    assert cache.stats() == {'size': 2, 'maxsize': 2, 'hits': 2, 'misses': 1, 'evictions': 1, 'hit_ratio': 2 / 3}
+
+
+def test_telnet_format():
+    series = Series('test.%d', {'tag1': '100%'})
+    assert series.telnet_format % (1, 2.5) == 'put test.%d 1 2.5 tag1=100%\n'
+
+
+def test_client_cache_hits(http_client2: TSDBClient):
+    for value in range(10):
+        http_client2.send('test', value, tag1='val1')
+    http_client2.send('test', 1, tag1='val2')
+
+    stats = http_client2.series_cache.stats()
+    assert stats['misses'] == 2
+    assert stats['hits'] == 9
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from opentsdb.sketches import BucketHistogram, DDSketch, HyperLogLog
+
+
+@pytest.fixture
+def values():
+    generator = random.Random(42)
+    return [generator.lognormvariate(0, 1) for _ in range(10000)]
+
+
+def _exact(values, q):
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+def test_ddsketch_relative_accuracy(values):
+    sketch = DDSketch(relative_accuracy=0.01)
+    for value in values:
+        sketch.add(value)
+
+    assert sketch.count == len(values)
+    assert sketch.max == max(values)
+    for q in (0.5, 0.9, 0.99):
+        assert abs(sketch.quantile(q) - _exact(values, q)) <= 0.01 * _exact(values, q) + 1e-9
+
+
+def test_ddsketch_negative_and_zero():
+    sketch = DDSketch()
+    for value in (-10, -1, 0, 0, 1, 10):
+        sketch.add(value)
+    assert sketch.quantile(0) == -10
+    assert sketch.quantile(0.5) == 0
+    assert sketch.quantile(1) == 10
+
+
+def test_ddsketch_merge(values):
+    sketch, first, second = DDSketch(), DDSketch(), DDSketch()
+    for index, value in enumerate(values):
+        sketch.add(value)
+        (first if index % 2 else second).add(value)
+    first.merge(second)
+
+    assert first.count == sketch.count
+    assert first.quantile(0.9) == sketch.quantile(0.9)
+
+
+def test_ddsketch_bounded_bins(values):
+    sketch = DDSketch(max_bins=50)
+    for value in values:
+        sketch.add(value)
+    assert len(sketch.positive) == 50
+    assert abs(sketch.quantile(0.99) - _exact(values, 0.99)) <= 0.01 * _exact(values, 0.99)
+
+
+def test_bucket_histogram():
+    histogram = BucketHistogram((1, 2, 5, 10))
+    for value in range(1, 101):
+        histogram.add(value / 10)
+
+    assert histogram.counts == [10, 10, 30, 50, 0]
+    assert histogram.quantile(0.5) == 5
+    assert histogram.quantile(1) == 10
+    assert 0.1 <= histogram.quantile(0.01) <= 1
+
+
+def test_hyperloglog_count():
+    sketch, other = HyperLogLog(), HyperLogLog()
+    assert sketch.count() == 0
+    for index in range(20000):
+        (sketch if index % 2 else other).add('request-%d' % index)
+        sketch.add('request-1')
+    sketch.merge(other)
+    # standard error is 1.04 / sqrt(1024), about 3%
+    assert abs(sketch.count() - 20000) < 20000 * 0.1
+    assert len(sketch.registers) == 1024
+
+
+def test_ddsketch_collapses_smallest_bins():
+    sketch = DDSketch(max_bins=3)
+    for value in (1000, 100, 10, 1, 0.1):
+        sketch.add(value)
+    # the two smallest bins are folded into the third smallest one
+    assert len(sketch.positive) == 3
+    assert sketch.positive[min(sketch.positive)] == 3
+    assert sum(sketch.positive.values()) == 5
+    sketch.add(0.01)
+    assert len(sketch.positive) == 3 and sketch.positive[min(sketch.positive)] == 4
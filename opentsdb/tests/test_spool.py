@@ -0,0 +1,130 @@
+import threading
+import time
+
+from opentsdb.datapoint import DataPoint, Series
+from opentsdb.spool import DiskSpool, SpoolReplayThread
+from opentsdb.telemetry import Telemetry
+
+
+def _metrics(count, start=0):
+    return [DataPoint(Series('test', {'tag1': 'val1'}), 1, i) for i in range(start, start + count)]
+
+
+def test_append_read_commit(tmpdir):
+    spool = DiskSpool(str(tmpdir))
+    assert spool.empty()
+    spool.append(_metrics(10))
+
+    records = spool.read(4)
+    assert [metric['value'] for metric, _ in records] == [0, 1, 2, 3]
+    spool.commit(records[-1][1])
+
+    assert [metric['value'] for metric, _ in spool.read(100)] == list(range(4, 10))
+    spool.commit(spool.read(100)[-1][1])
+    assert spool.empty()
+
+
+def test_segments_rotation_and_removal(tmpdir):
+    spool = DiskSpool(str(tmpdir), segment_size=100)
+    for index in range(5):
+        spool.append(_metrics(2, index * 2))
+    assert len(tmpdir.listdir()) == 5
+
+    records = spool.read(100)
+    assert [metric['value'] for metric, _ in records] == list(range(10))
+    spool.commit(records[-1][1])
+    assert len([path for path in tmpdir.listdir() if path.ext == '.spool']) == 1
+
+
+def test_recovery_after_crash(tmpdir):
+    spool = DiskSpool(str(tmpdir))
+    spool.append(_metrics(5))
+    spool.commit(spool.read(2)[-1][1])
+    spool.close()
+
+    segment = [path for path in tmpdir.listdir() if path.ext == '.spool'][0]
+    with open(str(segment), 'ab') as segment_file:
+        segment_file.write(b'{"metric": "test", "timest')
+
+    recovered = DiskSpool(str(tmpdir))
+    recovered.append(_metrics(1, 100))
+    assert [metric['value'] for metric, _ in recovered.read(100)] == [2, 3, 4, 100]
+
+
+def test_max_size_drops_oldest_segment(tmpdir):
+    telemetry = Telemetry()
+    spool = DiskSpool(str(tmpdir), segment_size=100, max_size=250, telemetry=telemetry)
+    for index in range(5):
+        spool.append(_metrics(2, index * 2))
+
+    assert spool.size <= 250
+    assert spool.dropped_bytes > 0
+    records = spool.read(100)
+    assert records[0][0]['value'] > 0
+    # every record is either still spooled or counted as dropped
+    assert telemetry.statuses['dropped'] + len(records) == 10
+
+
+def test_pending_records_bounded(tmpdir):
+    telemetry = Telemetry()
+    spool = DiskSpool(str(tmpdir), max_pending=5, telemetry=telemetry)
+    for index in range(4):
+        spool.append_nowait(_metrics(2, index * 2))
+    assert telemetry.statuses['dropped'] == 4
+
+    spool.flush_pending()
+    assert [metric['value'] for metric, _ in spool.read(100)] == [4, 5, 6, 7]
+
+
+class FakeConnect:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    def is_alive(self):
+        return True
+
+    def sendall(self, *metrics):
+        if self.fail:
+            raise ConnectionError('refused')
+        self.sent.extend(metrics)
+        return {'success': len(metrics), 'failed': 0}
+
+    def disconnect(self):
+        pass
+
+
+def test_replay_commits_after_send(tmpdir):
+    spool = DiskSpool(str(tmpdir))
+    spool.append(_metrics(10))
+    telemetry = Telemetry()
+
+    replay_thread = SpoolReplayThread(spool, FakeConnect(fail=True), threading.Event(), 0, telemetry)
+    assert replay_thread.replay(6) == 0
+    # nothing was delivered, a crash now replays everything again
+    assert len(DiskSpool(str(tmpdir)).read(100)) == 10
+
+    replay_thread.tsdb_connect = FakeConnect()
+    assert replay_thread.replay(6) == 6
+    assert [metric['value'] for metric in replay_thread.tsdb_connect.sent] == list(range(6))
+    assert telemetry.statuses['success'] == 6
+    assert [metric['value'] for metric, _ in DiskSpool(str(tmpdir)).read(100)] == [6, 7, 8, 9]
+
+
+def test_append_nowait_is_written_by_replay_thread(tmpdir):
+    spool = DiskSpool(str(tmpdir))
+    spool.append_nowait(_metrics(3))
+    assert spool.empty() and spool.size == 0
+
+    close_client = threading.Event()
+    replay_thread = SpoolReplayThread(spool, FakeConnect(fail=True), close_client, 0)
+    replay_thread.CHECK_INTERVAL = 0.01
+    replay_thread.start()
+    deadline = time.monotonic() + 5
+    while not spool.size and time.monotonic() < deadline:
+        time.sleep(0.01)
+    close_client.set()
+    spool.wake()
+    replay_thread.join(5)
+    assert not replay_thread.is_alive()
+    assert [metric['value'] for metric, _ in DiskSpool(str(tmpdir)).read(100)] == [0, 1, 2]
@@ -0,0 +1,65 @@
+import threading
+
+from opentsdb import TSDBClient
+from opentsdb.telemetry import Telemetry
+
+
+def test_counters_are_atomic():
+    telemetry = Telemetry()
+
+    def increment():
+        for _ in range(10000):
+            telemetry.inc('success')
+
+    threads = [threading.Thread(target=increment) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert telemetry.statuses['success'] == 40000
+
+
+def test_snapshot_and_report_window():
+    sent = []
+    telemetry = Telemetry('tsdb.client', {'protocol': 'http'}, lambda name, value, **tags: sent.append((name, value)))
+    telemetry.observe('batch_size', 50)
+    telemetry.observe('batch_size', 10)
+    telemetry.observe_queue_depth(120)
+    telemetry.observe_queue_depth(30)
+
+    snapshot = telemetry.snapshot()
+    assert snapshot['queue_high_water'] == 120
+    assert snapshot['batch_size']['count'] == 2 and snapshot['batch_size']['max'] == 50
+    assert snapshot['round_trip_seconds']['count'] == 0
+
+    assert telemetry.collect() == len(sent)
+    metrics = dict(sent)
+    assert metrics['tsdb.client.queue_high_water'] == 120
+    assert metrics['tsdb.client.batch_size.count'] == 2
+    assert 'tsdb.client.round_trip_seconds.count' not in metrics
+
+    snapshot = telemetry.snapshot()
+    assert snapshot['queue_high_water'] == 0 and snapshot['batch_size']['count'] == 0
+
+
+def test_client_pipeline_telemetry(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False)
+    for index in range(100):
+        client.send('test.telemetry', index, tag1='val1')
+    client.close()
+    client.wait()
+
+    snapshot = client.telemetry.snapshot()
+    assert snapshot['success'] == snapshot['queued'] == 100
+    assert snapshot['enqueue_seconds']['count'] >= 100 // Telemetry.ENQUEUE_SAMPLING
+    assert snapshot['batch_size']['sum'] == snapshot['success']
+    assert snapshot['round_trip_seconds']['count'] == snapshot['serialization_seconds']['count'] > 0
+
+
+def test_client_reports_telemetry(tsdb_host, tsdb_port):
+    client = TSDBClient(tsdb_host, tsdb_port, host_tag=False, telemetry_prefix='tsdb.client')
+    client.send('test.telemetry', 1, tag1='val1')
+    client.close()
+    client.wait()
+    assert client.statuses['success'] > 1
+    assert client.series_cache.get(('tsdb.client.queued', (('protocol', 'http'),))) is not None
@@ -1,29 +1,85 @@
 import logging
-import queue
+import os
 import socket
 import string
 import threading
 import time
 from os import environ
+from types import MappingProxyType
 from typing import Optional
 
+from opentsdb.aggregator import MetricsAggregator
+from opentsdb.batcher import estimate_size
+from opentsdb.cardinality import CardinalityGuard
+from opentsdb.datapoint import DataPoint, PointsChunk, Series, iter_points, points_count
+from opentsdb.emission import ChangeFilter, Heartbeats
 from opentsdb.exceptions import ValidationError
 from opentsdb.metrics import Metric
+from opentsdb.metrics_queue import MetricsQueue, ShardedQueue
+from opentsdb.multiprocess import MultiprocessAggregator, pending_clients, register_fork_handler, start_pending_clients
 from opentsdb.protocols import TSDBConnectProtocols
+from opentsdb.protocols.encoders import JSONBatchEncoder
+from opentsdb.rate_limiter import RateLimiter
+from opentsdb.reporter import MetricsReporter
+from opentsdb.routing import HealthChecker, RoutingQueue, parse_endpoint
+from opentsdb.series_cache import SeriesCache
+from opentsdb.spool import DiskSpool, SpoolReplayThread
+from opentsdb.telemetry import Telemetry
 
 logger = logging.getLogger('opentsdb-py')
 
 
+def _to_list(items) -> list:
+    """Python list of timestamps or values given as a list, array.array or NumPy array."""
+    dtype = getattr(items, 'dtype', None)
+    if dtype is not None and dtype.kind == 'M':
+        # NumPy datetime64 goes as milliseconds since the epoch
+        items = items.astype('datetime64[ms]').astype('int64')
+    return items.tolist() if hasattr(items, 'tolist') else list(items)
+
+
 class TSDBClient:
     TSDB_HOST = environ.get('OPEN_TSDB_HOST', '127.0.0.1')
     TSDB_PORT = int(environ.get('OPEN_TSDB_PORT', 4242))
     TSDB_URI = environ.get('OPEN_TSDB_URI')
 
     TSDB_MAX_METRICS_QUEUE_SIZE = int(environ.get('TSDB_MAX_METRICS_QUEUE_SIZE', 10000))
-    TSDB_SEND_METRICS_PER_SECOND_LIMIT = int(environ.get('TSDB_SEND_METRICS_PER_SECOND_LIMIT', 1000))
+    TSDB_MAX_QUEUE_BYTES = int(environ.get('TSDB_MAX_QUEUE_BYTES', 0))
+    TSDB_QUEUE_OVERFLOW = environ.get('TSDB_QUEUE_OVERFLOW', MetricsQueue.DROP_OLDEST)
+    TSDB_QUEUE_BLOCK_TIMEOUT = float(environ.get('TSDB_QUEUE_BLOCK_TIMEOUT', 1))
+    TSDB_SEND_METRICS_PER_SECOND_LIMIT = int(environ.get('TSDB_SEND_METRICS_PER_SECOND_LIMIT', 0))
+    TSDB_SEND_BYTES_PER_SECOND_LIMIT = int(environ.get('TSDB_SEND_BYTES_PER_SECOND_LIMIT', 0))
     TSDB_SEND_METRICS_BATCH_LIMIT = int(environ.get('TSDB_SEND_METRICS_BATCH_LIMIT', 50))
+    TSDB_SEND_BATCH_MAX_BYTES = int(environ.get('TSDB_SEND_BATCH_MAX_BYTES', 0))
+    TSDB_SEND_BATCH_LINGER = float(environ.get('TSDB_SEND_BATCH_LINGER', 0))
+    TSDB_SEND_BATCH_TARGET_LATENCY = float(environ.get('TSDB_SEND_BATCH_TARGET_LATENCY', 0))
+    TSDB_SEND_MANY_CHUNK_SIZE = int(environ.get('TSDB_SEND_MANY_CHUNK_SIZE', 5000))
+    TSDB_MAX_RETRIES = int(environ.get('TSDB_MAX_RETRIES', 5))
+    TSDB_SEND_WORKERS = int(environ.get('TSDB_SEND_WORKERS', 1))
+    TSDB_TELNET_MAX_WRITE_BYTES = int(environ.get('TSDB_TELNET_MAX_WRITE_BYTES', 64 * 1024))
     TSDB_DEFAULT_HTTP_COMPRESSION = environ.get('TSDB_DEFAULT_HTTP_COMPRESSION', 'gzip')
+    TSDB_HTTP_COMPRESSION_LEVEL = int(environ.get('TSDB_HTTP_COMPRESSION_LEVEL', 6))
+    TSDB_HTTP_TRANSPORT = environ.get('TSDB_HTTP_TRANSPORT', TSDBConnectProtocols.REQUESTS)
+    TSDB_SPOOL_DIR = environ.get('TSDB_SPOOL_DIR')
+    TSDB_SPOOL_MAX_SIZE = int(environ.get('TSDB_SPOOL_MAX_SIZE', 256 * 1024 * 1024))
+    TSDB_SPOOL_SEGMENT_SIZE = int(environ.get('TSDB_SPOOL_SEGMENT_SIZE', 8 * 1024 * 1024))
+    TSDB_SPOOL_REPLAY_LIMIT = int(environ.get('TSDB_SPOOL_REPLAY_LIMIT', 1000))
+    TSDB_AGGREGATION_INTERVAL = float(environ.get('TSDB_AGGREGATION_INTERVAL', 0))
+    TSDB_REPORT_INTERVAL = float(environ.get('TSDB_REPORT_INTERVAL', 10))
+    TSDB_REPORT_MODE = environ.get('TSDB_REPORT_MODE', MetricsReporter.UPDATES)
+    TSDB_SEND_DEADBAND = float(environ['TSDB_SEND_DEADBAND']) if environ.get('TSDB_SEND_DEADBAND') else None
+    TSDB_SEND_HEARTBEAT = float(environ.get('TSDB_SEND_HEARTBEAT', 60))
+    TSDB_MAX_TAG_VALUES = int(environ.get('TSDB_MAX_TAG_VALUES', 0))
+    TSDB_CARDINALITY_ACTION = environ.get('TSDB_CARDINALITY_ACTION', CardinalityGuard.COLLAPSE)
+    TSDB_MAX_SERIES_RATE = float(environ.get('TSDB_MAX_SERIES_RATE', 0))
     VALID_METRICS_CHARS = set(string.ascii_letters + string.digits + '-_./')
+    TSDB_SERIES_CACHE_SIZE = int(environ.get('TSDB_SERIES_CACHE_SIZE', 10000))
+    TSDB_MULTIPROCESS_DIR = environ.get('TSDB_MULTIPROCESS_DIR')
+    TSDB_TELEMETRY_PREFIX = environ.get('TSDB_TELEMETRY_PREFIX')
+    TSDB_ENDPOINTS = environ.get('TSDB_ENDPOINTS')
+    TSDB_ROUTING = environ.get('TSDB_ROUTING', RoutingQueue.HASH)
+    TSDB_QUERY_CACHE_SIZE = int(environ.get('TSDB_QUERY_CACHE_SIZE', 128))
+    TSDB_HEALTH_CHECK_INTERVAL = float(environ.get('TSDB_HEALTH_CHECK_INTERVAL', 10))
 
     def __init__(self,
                  host: str=TSDB_HOST,
@@ -37,38 +93,192 @@ class TSDBClient:
                  http_compression: str=TSDB_DEFAULT_HTTP_COMPRESSION,
                  uri: str=TSDB_URI,
                  send_metrics_limit: int=TSDB_SEND_METRICS_PER_SECOND_LIMIT,
-                 send_metrics_batch_limit: int=TSDB_SEND_METRICS_BATCH_LIMIT):
+                 send_metrics_batch_limit: int=TSDB_SEND_METRICS_BATCH_LIMIT,
+                 aggregation_interval: float=TSDB_AGGREGATION_INTERVAL,
+                 telnet_max_write_bytes: int=TSDB_TELNET_MAX_WRITE_BYTES,
+                 send_bytes_limit: int=TSDB_SEND_BYTES_PER_SECOND_LIMIT,
+                 send_metrics_burst: Optional[int]=None,
+                 send_workers: int=TSDB_SEND_WORKERS,
+                 preserve_series_order: bool=True,
+                 spool_dir: Optional[str]=TSDB_SPOOL_DIR,
+                 spool_max_size: int=TSDB_SPOOL_MAX_SIZE,
+                 spool_segment_size: int=TSDB_SPOOL_SEGMENT_SIZE,
+                 spool_replay_limit: int=TSDB_SPOOL_REPLAY_LIMIT,
+                 series_cache_size: int=TSDB_SERIES_CACHE_SIZE,
+                 http_compression_level: int=TSDB_HTTP_COMPRESSION_LEVEL,
+                 http_encoder=None,
+                 report_interval: float=TSDB_REPORT_INTERVAL,
+                 max_retries: int=TSDB_MAX_RETRIES,
+                 circuit_breaker_threshold: int=5,
+                 circuit_breaker_timeout: float=30,
+                 send_batch_max_bytes: int=TSDB_SEND_BATCH_MAX_BYTES,
+                 send_batch_linger: float=TSDB_SEND_BATCH_LINGER,
+                 send_batch_target_latency: float=TSDB_SEND_BATCH_TARGET_LATENCY,
+                 multiprocess_dir: Optional[str]=TSDB_MULTIPROCESS_DIR,
+                 telemetry_prefix: Optional[str]=TSDB_TELEMETRY_PREFIX,
+                 endpoints: Optional[list]=None,
+                 routing: str=TSDB_ROUTING,
+                 health_check_interval: float=TSDB_HEALTH_CHECK_INTERVAL,
+                 query_cache_size: int=TSDB_QUERY_CACHE_SIZE,
+                 send_many_chunk_size: int=TSDB_SEND_MANY_CHUNK_SIZE,
+                 report_mode: str=TSDB_REPORT_MODE,
+                 send_deadband: Optional[float]=TSDB_SEND_DEADBAND,
+                 send_heartbeat: float=TSDB_SEND_HEARTBEAT,
+                 max_tag_values: int=TSDB_MAX_TAG_VALUES,
+                 cardinality_action: str=TSDB_CARDINALITY_ACTION,
+                 max_series_rate: float=TSDB_MAX_SERIES_RATE,
+                 max_queue_bytes: int=TSDB_MAX_QUEUE_BYTES,
+                 queue_overflow: str=TSDB_QUEUE_OVERFLOW,
+                 queue_block_timeout: float=TSDB_QUEUE_BLOCK_TIMEOUT,
+                 http_transport: str=TSDB_HTTP_TRANSPORT):
 
         self.host_tag = host_tag
+        self.hostname = socket.gethostname() if host_tag is True else None
         self.protocol = protocol
         self.check_tsdb_alive = check_tsdb_alive
-        self.static_tags = static_tags or {}
-        self.send_metrics_limit = send_metrics_limit if protocol == TSDBConnectProtocols.TELNET else 0
-        self.send_metrics_batch_limit = send_metrics_batch_limit if protocol == TSDBConnectProtocols.HTTP else 0
+        self._static_tags = dict(static_tags or {})
+        self.send_metrics_limit = send_metrics_limit
+        self.rate_limiter = RateLimiter(send_metrics_limit, send_bytes_limit, points_burst=send_metrics_burst)
+        self.send_metrics_batch_limit = send_metrics_batch_limit
+        self.send_batch_max_bytes = send_batch_max_bytes
+        self.send_batch_linger = send_batch_linger
+        self.send_batch_target_latency = send_batch_target_latency
+        self.send_many_chunk_size = max(1, send_many_chunk_size)
         self.http_compression = http_compression
+        self.http_compression_level = http_compression_level
+        assert http_transport in TSDBConnectProtocols.HTTP_TRANSPORTS, \
+            'Unsupported HTTP transport: %s' % http_transport
+        self.http_transport = http_transport
+        self.http_encoder = http_encoder
+        self._json_encoder = JSONBatchEncoder()
+        self.telnet_max_write_bytes = telnet_max_write_bytes
+        self.aggregation_interval = aggregation_interval
+        self.report_interval = report_interval
+        assert report_mode in (MetricsReporter.UPDATES, MetricsReporter.SNAPSHOT), \
+            'Unsupported report mode: %s' % report_mode
+        self.report_mode = report_mode
+        self.max_retries = max_retries
+        self.circuit_breaker_threshold = circuit_breaker_threshold
+        self.circuit_breaker_timeout = circuit_breaker_timeout
+        self.send_workers = max(1, send_workers)
+        self.spool_replay_limit = spool_replay_limit
+
+        if endpoints is None and self.TSDB_ENDPOINTS:
+            endpoints = self.TSDB_ENDPOINTS.split(',')
+        self.endpoints = [parse_endpoint(endpoint.strip(), port) for endpoint in endpoints] if endpoints else None
+        self.routing = routing
+        self.health_check_interval = health_check_interval
+        self._health_checker = None
+        self.query_cache_size = query_cache_size
+        self._query_client = None
+        self._query_lock = threading.Lock()
 
         self._tsdb_connect = None
         self._close_client = threading.Event()
-        self._metrics_queue = queue.Queue(maxsize=max_queue_size)
-        self.statuses = {'success': 0, 'failed': 0, 'queued': 0}
+        self.max_queue_size = max_queue_size
+        self.max_queue_bytes = max_queue_bytes
+        assert queue_overflow in MetricsQueue.OVERFLOW_POLICIES, 'Unsupported queue overflow policy: %s' % queue_overflow
+        self.queue_overflow = queue_overflow
+        self.queue_block_timeout = queue_block_timeout
+        self.preserve_series_order = preserve_series_order
+        self.telemetry_prefix = telemetry_prefix
+        self.telemetry = self._new_telemetry()
+        self.statuses = self.telemetry.statuses
+        self._metrics_queue = self._new_metrics_queue()
+        self.spool = DiskSpool(spool_dir, spool_segment_size, spool_max_size,
+                               telemetry=self.telemetry) if spool_dir else None
 
+        self.series_cache = SeriesCache(series_cache_size)
+        self.change_filter = None
+        if send_deadband is not None:
+            self.change_filter = ChangeFilter(send_deadband, send_heartbeat, maxsize=series_cache_size)
+        self.cardinality_guard = None
+        if max_tag_values or max_series_rate:
+            self.cardinality_guard = CardinalityGuard(max_tag_values, cardinality_action,
+                                                      max_series_rate=max_series_rate)
+        self.multiprocess_dir = multiprocess_dir
+        self._multiprocess_modes = {}
         self._metric_send_thread = None
+        self._fork_pending = False
+        self._aggregator = None
+        self._reporter = self._new_reporter()
+        self._spool_replay_thread = None
+        self._address = (host, port, uri)
+        if self.telemetry_prefix:
+            self.register_collector(self.telemetry)
+        if self.change_filter is not None and self.change_filter.heartbeat:
+            self.register_collector(Heartbeats(self))
+        register_fork_handler(self)
 
         if run_at_once is True:
             self.init_client(host, port, uri)
 
-    def init_client(self, host, port: int=TSDB_PORT, uri: Optional[str]=None):
-        self._tsdb_connect = TSDBConnectProtocols.get_connect(
-            self.protocol, host, port, self.check_tsdb_alive,
-            compression=self.http_compression, uri=uri
+    def _new_metrics_queue(self):
+        queue_kwargs = dict(max_bytes=self.max_queue_bytes, overflow=self.queue_overflow,
+                            block_timeout=self.queue_block_timeout)
+        if self.endpoints:
+            return RoutingQueue(len(self.endpoints), maxsize=self.max_queue_size, routing=self.routing,
+                                telemetry=self.telemetry, **queue_kwargs)
+        if self.send_workers > 1 and self.preserve_series_order:
+            return ShardedQueue(self.send_workers, maxsize=self.max_queue_size, **queue_kwargs)
+        return MetricsQueue(self.max_queue_size, **queue_kwargs)
+
+    def _get_connect(self, host, port, uri, check_tsdb_alive):
+        return TSDBConnectProtocols.get_connect(
+            self.protocol, host, port, check_tsdb_alive,
+            compression=self.http_compression, uri=uri, max_write_bytes=self.telnet_max_write_bytes,
+            compression_level=self.http_compression_level, encoder=self.http_encoder,
+            http_transport=self.http_transport
         )
 
-        self._metric_send_thread = TSDBConnectProtocols.get_push_thread(
-            self.protocol, self._tsdb_connect, self._metrics_queue, self._close_client,
-            self.send_metrics_limit, self.send_metrics_batch_limit, self.statuses)
+    def init_client(self, host, port: int=TSDB_PORT, uri: Optional[str]=None):
+        self._address = (host, port, uri)
+        addresses = self.endpoints or [(host, port, uri)]
+        connects = [
+            self._get_connect(node_host, node_port, node_uri, self.check_tsdb_alive and index == 0)
+            for node_host, node_port, node_uri in addresses
+            for index in range(self.send_workers)
+        ]
+        self._tsdb_connect = connects[0]
+
+        self._metric_send_thread = TSDBConnectProtocols.get_push_thread_pool(
+            self.protocol, connects, self._metrics_queue, self._close_client,
+            self.rate_limiter, self.send_metrics_batch_limit, self.telemetry, spool=self.spool,
+            max_retries=self.max_retries, circuit_breaker_threshold=self.circuit_breaker_threshold,
+            circuit_breaker_timeout=self.circuit_breaker_timeout, send_batch_max_bytes=self.send_batch_max_bytes,
+            send_batch_linger=self.send_batch_linger, send_batch_target_latency=self.send_batch_target_latency)
         self._metric_send_thread.daemon = True
         self._metric_send_thread.start()
 
+        if self.spool is not None:
+            self._spool_replay_thread = SpoolReplayThread(
+                self.spool, self._get_connect(*addresses[0], check_tsdb_alive=False), self._close_client,
+                self.spool_replay_limit, self.telemetry)
+            self._spool_replay_thread.daemon = True
+            self._spool_replay_thread.start()
+
+        if self.endpoints:
+            self._health_checker = HealthChecker(
+                [self._get_connect(*address, check_tsdb_alive=False) for address in self.endpoints],
+                self._metrics_queue, self.health_check_interval, self._close_client)
+            self._health_checker.daemon = True
+            self._health_checker.start()
+
+        if self.multiprocess_dir:
+            self._aggregator = MultiprocessAggregator(
+                self.multiprocess_dir, self._push_metric_to_queue, self.aggregation_interval or self.report_interval,
+                self._close_client, self._multiprocess_modes)
+            self._aggregator.daemon = True
+            self._aggregator.start()
+        elif self.aggregation_interval > 0:
+            self._aggregator = MetricsAggregator(
+                self._push_metric_to_queue, self.aggregation_interval, self._close_client)
+            self._aggregator.daemon = True
+            self._aggregator.start()
+
+        if not self._reporter.is_alive():
+            self._reporter.start()
+
         self._load_predefined_metrics()
 
     def _load_predefined_metrics(self):
@@ -80,9 +290,76 @@ class TSDBClient:
         if isinstance(value, Metric):
             if value.client is None:
                 value.client = self
+            if value.client is self:
+                self.register_collector(value)
 
         super(TSDBClient, self).__setattr__(key, value)
 
+    def register_collector(self, collector):
+        """Register object which sends collected metrics each report_interval, e.g. Histogram or labeled metric."""
+        mode = getattr(collector, 'multiprocess_mode', None)
+        if mode is not None:
+            self._multiprocess_modes[collector.name] = mode
+        self._reporter.register(collector)
+
+    def _after_fork(self):
+        """Rebuild the client in a forked child: threads don't survive fork and connections can't be shared.
+
+        Only the state is reset here, threads and connections are started by `_start_after_fork`
+        on the first send or metric update of the child.
+        """
+        if self._metric_send_thread is None or self._close_client.is_set():
+            return
+
+        if isinstance(self._aggregator, MultiprocessAggregator):
+            self._aggregator.after_fork()
+        self._aggregator = None
+        self._spool_replay_thread = None
+        if self.spool is not None:
+            logger.warning("Spool %s is left to the parent process, disabled in child %d",
+                           self.spool.directory, os.getpid())
+            self.spool = None
+
+        self._close_client = threading.Event()
+        self._health_checker = None
+        self.telemetry = self._new_telemetry()
+        self.statuses = self.telemetry.statuses
+        self._metrics_queue = self._new_metrics_queue()
+        self.series_cache = SeriesCache(self.series_cache.maxsize)
+        if self.change_filter is not None:
+            self.change_filter = ChangeFilter(
+                self.change_filter.deadband, self.change_filter.heartbeat, self.change_filter.maxsize)
+        if self.cardinality_guard is not None:
+            self.cardinality_guard.after_fork()
+
+        reporter = self._new_reporter()
+        for collector in self._reporter._collectors:
+            if isinstance(collector, Metric):
+                collector._after_fork(self.multiprocess_dir is not None)
+            if not isinstance(collector, Telemetry):
+                reporter.register(collector)
+        if self.telemetry_prefix:
+            reporter.register(self.telemetry)
+        self._reporter = reporter
+        self._fork_pending = True
+
+    def _start_after_fork(self):
+        if not self._fork_pending:
+            return
+        self._fork_pending = False
+        self.init_client(*self._address)
+
+    def _new_reporter(self) -> MetricsReporter:
+        # snapshots of all series are taken at the same aligned moments and share the timestamp
+        reporter = MetricsReporter(self.report_interval, self._close_client,
+                                   aligned=self.report_mode == MetricsReporter.SNAPSHOT,
+                                   send_collected=self.send_collected)
+        reporter.daemon = True
+        return reporter
+
+    def _new_telemetry(self) -> Telemetry:
+        return Telemetry(self.telemetry_prefix, {'protocol': self.protocol.lower()}, self.send)
+
     def is_connected(self) -> bool:
         return self._metric_send_thread.is_alive()
 
@@ -90,46 +367,232 @@ class TSDBClient:
         return self._tsdb_connect.is_alive()
 
     def close(self, force=False):
+        self._start_after_fork()
+        self._reporter.collect()
         self._close_client.set()
-        self._metrics_queue.put(StopIteration)
-        if force and self._tsdb_connect:
-            self._tsdb_connect.stopped.set()
+        if self.spool is not None:
+            self.spool.wake()
+        if self._aggregator:
+            self._aggregator.flush()
+        if self._metric_send_thread:
+            self._metric_send_thread.stop(force)
+        else:
+            self._metrics_queue.put(StopIteration)
 
     def wait(self):
-        while self.is_connected():
-            time.sleep(0.05)
+        self._metric_send_thread.join()
 
     def queue_size(self) -> int:
         return self._metrics_queue.qsize()
 
-    def send(self, name: str, value, **tags) -> dict:
-        tags.update(self.static_tags)
-        if self.host_tag is True and 'host' not in tags:
-            tags['host'] = socket.gethostname()
+    @property
+    def static_tags(self) -> MappingProxyType:
+        """Tags added to each metric, read-only: assign a new dict to change them."""
+        return MappingProxyType(self._static_tags)
 
+    @static_tags.setter
+    def static_tags(self, tags: dict):
+        self._static_tags = dict(tags or {})
+        # cached series hold the merged tags of the old static tags
+        self.series_cache.clear()
+
+    @property
+    def query_client(self) -> 'QueryClient':
+        """HTTP client of the read API, connects to the first endpoint (or host & port) whatever the protocol is."""
+        if self._query_client is None:
+            with self._query_lock:
+                if self._query_client is None:
+                    # numpy (if installed) is imported by the read API only
+                    from opentsdb.query import QueryClient
+                    host, port, uri = self.endpoints[0] if self.endpoints else self._address
+                    self._query_client = QueryClient(host, port, uri, cache_size=self.query_cache_size,
+                                                     http_transport=self.http_transport)
+        return self._query_client
+
+    def query(self, metric: str, start, end=None, aggregator: str='sum', tags: dict=None,
+              downsample: str=None, rate: bool=False, ms: bool=False) -> list:
+        """Read the metric from OpenTSDB /api/query, see QueryClient.query."""
+        return self.query_client.query(metric, start, end, aggregator, tags, downsample, rate, ms)
+
+    def query_last(self, metric: str, tags: dict=None, back_scan: Optional[int]=None) -> list:
+        """Read the last data point of each series of the metric from /api/query/last."""
+        return self.query_client.query_last(metric, tags, back_scan)
+
+    def send(self, name: str, value, **tags) -> DataPoint:
+        if pending_clients:
+            start_pending_clients()
+        # enqueue latency of every n-th point is enough for the distribution
+        sampled = not self.statuses['queued'] % self.telemetry.ENQUEUE_SAMPLING
+        started = time.perf_counter() if sampled else 0
+        point = self._new_point(name, value, tags)
+        if point is None or not self._accepted(point):
+            return point
+
+        if self._aggregator:
+            self._aggregator.add(point)
+        else:
+            self._push_metric_to_queue(point)
+
+        if sampled:
+            self.telemetry.observe('enqueue_seconds', time.perf_counter() - started)
+        return point
+
+    def send_collected(self, metrics) -> int:
+        """Send (name, value, tags) of one collect, e.g. all series of a metric in a report, as one batch.
+
+        Tags may hold `timestamp` like the keyword arguments of `send`. Points are checked like
+        `send` checks them and queued together, invalid ones are logged and skipped.
+        Return the number of sent points.
+        """
+        if pending_clients:
+            start_pending_clients()
+        points = []
+        for name, value, tags in metrics:
+            try:
+                point = self._new_point(name, value, dict(tags))
+            except ValidationError as error:
+                logger.error(error)
+                continue
+            if point is not None and self._accepted(point):
+                points.append(point)
+
+        if self._aggregator:
+            for point in points:
+                self._aggregator.add(point)
+        elif points:
+            self._push_points_to_queue(points)
+        return len(points)
+
+    def _new_point(self, name: str, value, tags: dict) -> Optional[DataPoint]:
+        timestamp = tags.pop('timestamp', None)
+        key = (name, tuple(sorted(tags.items())))
+        series = self.series_cache.get(key)
+        if series is None:
+            series = self._register_series(key, value, tags)
+            if series is None:
+                # rejected series are not cached, so each of their points is checked and counted
+                self.telemetry.inc('rejected')
+                return None
+        else:
+            self._validate_value(value)
+
+        return DataPoint(series, int(time.time() if timestamp is None else timestamp), value)
+
+    def _accepted(self, point: DataPoint) -> bool:
+        if self._close_client.is_set():
+            return False
+        if self.change_filter is not None and not self.change_filter.should_emit(point.series, point.value):
+            self.telemetry.inc('suppressed')
+            return False
+        if self.cardinality_guard is not None and not self.cardinality_guard.allow(point.series):
+            self.telemetry.inc('rate_limited')
+            return False
+        return True
+
+    def send_many(self, name: str, timestamps, values, on_sent=None, **tags) -> int:
+        """Send points of one series given as sequences of timestamps and values, return the number of points.
+
+        Sequences may be lists, `array.array` or NumPy arrays. Timestamps are in seconds or in
+        milliseconds (OpenTSDB tells them apart by magnitude), NumPy datetime64 is sent in milliseconds.
+        The series is validated once, points are encoded in chunks of `send_many_chunk_size` by the
+        calling thread and queued as a whole, bypassing aggregation. Unlike `send` it waits for room
+        in the queue instead of dropping older points, so it suits backfills of any size
+        (AsyncTSDBClient can't wait in sync code and queues chunks beyond max_queue_size).
+        `on_sent(points)` is called by the sending thread as OpenTSDB answers for the points,
+        see `PointsChunk`.
+        """
+        timestamps, values = _to_list(timestamps), _to_list(values)
+        if len(timestamps) != len(values):
+            raise ValidationError("Metric not valid: %d timestamps for %d values" % (len(timestamps), len(values)))
+        if not values or self._close_client.is_set():
+            return 0
+        if pending_clients:
+            start_pending_clients()
+
+        key = (name, tuple(sorted(tags.items())))
+        series = self.series_cache.get(key)
+        if series is None:
+            series = self._register_series(key, values[0], tags)
+            if series is None:
+                self.telemetry.inc('rejected', len(values))
+                return 0
+        if not all(type(value) is int or type(value) is float for value in values):
+            for value in values:
+                self._validate_value(value)
+        if not all(type(timestamp) is int for timestamp in timestamps):
+            timestamps = [int(timestamp) for timestamp in timestamps]
+
+        chunk_size = self.send_many_chunk_size
+        if self.send_batch_max_bytes:
+            point_size = estimate_size(DataPoint(series, timestamps[0], values[0]))
+            chunk_size = max(1, min(chunk_size, self.send_batch_max_bytes // point_size))
+        for start in range(0, len(values), chunk_size):
+            chunk = PointsChunk(series, timestamps[start:start + chunk_size], values[start:start + chunk_size],
+                                on_sent)
+            if self.protocol == TSDBConnectProtocols.HTTP:
+                chunk.json_text(self.http_encoder or self._json_encoder)
+            else:
+                chunk.telnet_text()
+            self._push_chunk_to_queue(chunk)
+        return len(values)
+
+    def _push_chunk_to_queue(self, chunk: PointsChunk):
+        # bulk data waits for the push threads rather than pushing older points out of the queue
+        self._metrics_queue.put(chunk)
+        self.telemetry.inc('queued', len(chunk))
+
+    def _register_series(self, key, value, tags) -> Optional[Series]:
+        name = key[0]
+        tags.update(self._static_tags)
+        if self.hostname is not None and 'host' not in tags:
+            tags['host'] = self.hostname
         self._validate_metric(name, value, tags)
-        metric = dict(metric=name, timestamp=int(tags.pop('timestamp', time.time())), value=value, tags=tags)
 
-        if not self._close_client.is_set():
-            self._push_metric_to_queue(metric)
+        if self.cardinality_guard is not None:
+            admitted = self.cardinality_guard.admit(name, tags)
+            if admitted is None:
+                return None
+            if admitted is not tags:
+                # all collapsed series of the metric share one Series (and its rate limit)
+                self.telemetry.inc('collapsed')
+                collapsed_key = (name, tuple(sorted(admitted.items())))
+                series = self.series_cache.get(collapsed_key)
+                if series is None:
+                    series = self.series_cache.put(collapsed_key, Series(name, admitted))
+                return self.series_cache.put(key, series)
 
-        return metric
+        return self.series_cache.put(key, Series(name, tags))
 
     def _validate_metric(self, name, value, tags):
+        self._validate_value(value)
         try:
             assert all(char in self.VALID_METRICS_CHARS for char in name), \
                 "Metric name contain incorrect chars '%s'" % name
-            assert isinstance(value, (str, int, float)), "Incorrect metric value type '%s'" % type(value)
             assert tags != {}, "Need at least one tag"
         except AssertionError as error:
             raise ValidationError("Metric not valid: %s" % str(error))
 
+    @staticmethod
+    def _validate_value(value):
+        if not isinstance(value, (str, int, float)):
+            raise ValidationError("Metric not valid: Incorrect metric value type '%s'" % type(value))
+
     def _push_metric_to_queue(self, metric):
-        try:
-            self._metrics_queue.put(metric, False)
-        except queue.Full:
-            logger.warning("Drop oldest metric because Queue is full.")
-            self._metrics_queue.get()
-            self._metrics_queue.put(metric, False)
+        dropped = self._metrics_queue.offer(metric)
+        if not dropped or dropped[-1] is not metric:
+            self.telemetry.inc('queued')
+        if dropped:
+            self._overflowed(dropped)
+
+    def _push_points_to_queue(self, points: list):
+        dropped = self._metrics_queue.offer_many(points)
+        new = {id(point) for point in points}
+        self.telemetry.inc('queued', len(points) - sum(1 for item in dropped if id(item) in new))
+        if dropped:
+            self._overflowed(dropped)
 
-        self.statuses['queued'] += 1
+    def _overflowed(self, dropped: tuple):
+        if self.spool is not None:
+            self.spool.append_nowait(iter_points(dropped))
+        else:
+            self.telemetry.inc('dropped', points_count(dropped))
@@ -8,7 +8,7 @@ setup(
     version=__version__,
     author='Sergey Suglobov',
     author_email='s.suglobov@gmail.com',
-    packages=find_packages(),
+    packages=find_packages(exclude=['benchmarks', 'benchmarks.*']),
     keywords="opentsdb, tsdb, metrics",
     url='https://github.com/scarchik/opentsdb-py',
     download_url='https://github.com/scarchik/opentsdb-py/archive/v{VERSION}.zip'.format(VERSION=__version__),
@@ -20,12 +20,22 @@ setup(
         'Natural Language :: English',
         'Operating System :: Microsoft :: Windows',
         'Operating System :: POSIX',
-        'Programming Language :: Python :: 3.6',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.8',
+        'Programming Language :: Python :: 3.9',
+        'Programming Language :: Python :: 3.10',
+        'Programming Language :: Python :: 3.11',
         'Programming Language :: Python :: 3 :: Only'
     ],
+    python_requires='>=3.7',
     install_requires=[
         "setuptools",
         "requests"
-    ]
+    ],
+    extras_require={
+        'numpy': ["numpy"],
+    },
+    entry_points={
+        'console_scripts': ['opentsdb-import = opentsdb.importer:main'],
+    }
 )